@@ -1,3 +1,17 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import SensorDevice, SensorReading
+
+
+@admin.register(SensorDevice)
+class SensorDeviceAdmin(admin.ModelAdmin):
+    list_display = ('device_id', 'name', 'last_seen', 'temperature', 'humidity', 'scored_at')
+    search_fields = ('device_id', 'name')
+
+
+@admin.register(SensorReading)
+class SensorReadingAdmin(admin.ModelAdmin):
+    list_display = ('device', 'timestamp', 'temperature', 'humidity')
+    list_filter = ('device',)
+    date_hierarchy = 'timestamp'
+    raw_id_fields = ('device',)
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.3 on 2026-10-18 10:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SensorDevice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('device_id', models.CharField(max_length=64, unique=True)),
+                ('name', models.CharField(blank=True, max_length=100)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_seen', models.DateTimeField(blank=True, db_index=True, null=True)),
+                ('N', models.FloatField(blank=True, null=True)),
+                ('P', models.FloatField(blank=True, null=True)),
+                ('K', models.FloatField(blank=True, null=True)),
+                ('temperature', models.FloatField(blank=True, null=True)),
+                ('humidity', models.FloatField(blank=True, null=True)),
+                ('ph', models.FloatField(blank=True, null=True)),
+                ('rainfall', models.FloatField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SensorReading',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.DateTimeField()),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('N', models.FloatField(blank=True, null=True)),
+                ('P', models.FloatField(blank=True, null=True)),
+                ('K', models.FloatField(blank=True, null=True)),
+                ('temperature', models.FloatField(blank=True, null=True)),
+                ('humidity', models.FloatField(blank=True, null=True)),
+                ('ph', models.FloatField(blank=True, null=True)),
+                ('rainfall', models.FloatField(blank=True, null=True)),
+                ('device', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='readings', to='cultivai.sensordevice')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['device', 'timestamp'], name='reading_device_timestamp_idx')],
+            },
+        ),
+    ]
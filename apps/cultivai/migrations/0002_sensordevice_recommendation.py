@@ -0,0 +1,28 @@
+# Generated by Django 5.2.3 on 2026-10-18 10:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cultivai', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sensordevice',
+            name='recommendation',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='sensordevice',
+            name='scored_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='sensordevice',
+            name='scored_features',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -1,3 +1,56 @@
 from django.db import models
 
-# Create your models here.
+
+class SensorDevice(models.Model):
+    """
+    Estación de sensores (Arduino) identificada por device_id
+
+    Además de la identidad guarda la proyección "último valor por característica", que se
+    actualiza al ingerir lecturas, para leer el estado actual sin recorrer SensorReading,
+    y la última recomendación de cultivo calculada sobre esa proyección.
+    """
+    device_id = models.CharField(max_length=64, unique=True)
+    name = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    # Proyección de la última lectura conocida
+    last_seen = models.DateTimeField(null=True, blank=True, db_index=True)
+    N = models.FloatField(null=True, blank=True)
+    P = models.FloatField(null=True, blank=True)
+    K = models.FloatField(null=True, blank=True)
+    temperature = models.FloatField(null=True, blank=True)
+    humidity = models.FloatField(null=True, blank=True)
+    ph = models.FloatField(null=True, blank=True)
+    rainfall = models.FloatField(null=True, blank=True)
+
+    # Última recomendación: se recalcula al ingerir solo si alguna característica supera su umbral
+    scored_at = models.DateTimeField(null=True, blank=True)
+    scored_features = models.JSONField(null=True, blank=True)
+    recommendation = models.JSONField(null=True, blank=True)
+
+    def __str__(self):
+        return self.name or self.device_id
+
+
+class SensorReading(models.Model):
+    """Lectura de una estación; la tabla es de solo inserción (serie de tiempo)"""
+    device = models.ForeignKey(SensorDevice, on_delete=models.CASCADE, related_name='readings')
+    timestamp = models.DateTimeField()
+    received_at = models.DateTimeField(auto_now_add=True)
+
+    # Cada estación reporta solo los sensores que tiene; el resto queda en null
+    N = models.FloatField(null=True, blank=True)
+    P = models.FloatField(null=True, blank=True)
+    K = models.FloatField(null=True, blank=True)
+    temperature = models.FloatField(null=True, blank=True)
+    humidity = models.FloatField(null=True, blank=True)
+    ph = models.FloatField(null=True, blank=True)
+    rainfall = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['device', 'timestamp'], name='reading_device_timestamp_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.device_id} @ {self.timestamp.isoformat()}'
@@ -0,0 +1,191 @@
+import logging
+import os
+import threading
+from typing import TYPE_CHECKING, Dict
+
+from django.conf import settings
+from django.core.cache import cache
+
+from ...recommendations.services.features import FEATURE_COLUMNS
+from ...recommendations.services.reference_dataset import load_reference_dataset
+from ...recommendations.services.registry import get_service
+
+# pandas y plotly se importan en el primer uso: la mayoría de las peticiones no los necesita
+if TYPE_CHECKING:
+    import pandas as pd
+
+logger = logging.getLogger('analytics')
+
+# Gráficos de caja de la página de análisis: (columna, título, nombre en el contexto)
+BOX_PLOTS = [
+    ('N', 'Nivel de Nitrógeno', 'fig_box_n'),
+    ('P', 'Nivel de Fósforo', 'fig_box_p'),
+    ('K', 'Nivel de Potasio', 'fig_box_k'),
+    ('temperature', 'Temperatura', 'fig_box_temperature'),
+    ('humidity', 'Nivel de humedad', 'fig_box_humidity'),
+    ('ph', 'Nivel de pH ', 'fig_box_ph'),
+    ('rainfall', 'Nivel de lluvia', 'fig_box_rainfall'),
+]
+
+# Última versión generada en este proceso; evita ir a la caché de Django en cada petición
+_charts = {'key': None, 'html': None}
+_charts_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats = {'signature': None, 'stats': None}
+
+
+def dataset_signature() -> tuple:
+    """Firma (mtime, tamaño) del CSV de referencia; cambia cuando el archivo cambia"""
+    stat = os.stat(settings.DATASET_PATH)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def get_dataset() -> 'pd.DataFrame':
+    """
+    Devuelve el dataset de referencia desde su copia columnar con memory-map
+
+    Las columnas numéricas quedan respaldadas por el archivo (compartido entre workers)
+    y la etiqueta es categórica; la copia se regenera sola si el CSV cambió.
+    """
+    return load_reference_dataset().to_frame()
+
+
+def compute_feature_stats(data: 'pd.DataFrame') -> Dict:
+    """
+    Calcula el resumen de los gráficos de caja por cultivo con un groupby vectorizado
+
+    Los cuartiles usan interpolación lineal y los bigotes llegan al dato más extremo
+    dentro de 1.5 IQR de los cuartiles, igual que plotly al dibujar los datos crudos.
+
+    Args:
+        data (pd.DataFrame): Dataset con las siete características y la columna label
+
+    Returns:
+        dict: Cultivos (en orden de aparición) y, por característica, una lista por estadístico
+    """
+    labels = data['label']
+    features = data[FEATURE_COLUMNS]
+
+    summary = features.groupby(labels, sort=False, observed=True).describe()
+    q1 = summary.xs('25%', axis=1, level=1)
+    q3 = summary.xs('75%', axis=1, level=1)
+    iqr = q3 - q1
+
+    # Límites de Tukey alineados con cada fila para enmascarar los valores atípicos
+    lower_limit = (q1 - 1.5 * iqr).reindex(labels).to_numpy()
+    upper_limit = (q3 + 1.5 * iqr).reindex(labels).to_numpy()
+    values = features.to_numpy()
+    inside = features.where((values >= lower_limit) & (values <= upper_limit))
+    whiskers = inside.groupby(labels, sort=False, observed=True).agg(['min', 'max'])
+
+    def column(frame: 'pd.DataFrame', feature: str, stat: str) -> list:
+        return frame[(feature, stat)].round(4).tolist()
+
+    stats = {}
+    for feature in FEATURE_COLUMNS:
+        stats[feature] = {
+            'count': summary[(feature, 'count')].astype(int).tolist(),
+            'mean': column(summary, feature, 'mean'),
+            'min': column(summary, feature, 'min'),
+            'q1': column(summary, feature, '25%'),
+            'median': column(summary, feature, '50%'),
+            'q3': column(summary, feature, '75%'),
+            'max': column(summary, feature, 'max'),
+            'lowerfence': column(whiskers, feature, 'min'),
+            'upperfence': column(whiskers, feature, 'max'),
+        }
+
+    return {
+        'crops': summary.index.tolist(),
+        'features': FEATURE_COLUMNS,
+        'stats': stats
+    }
+
+
+def get_feature_stats() -> Dict:
+    """Devuelve el resumen estadístico del dataset, calculado una vez por versión del CSV"""
+    signature = dataset_signature()
+    if _stats['signature'] != signature:
+        with _stats_lock:
+            if _stats['signature'] != signature:
+                data = get_dataset()
+                _stats['stats'] = compute_feature_stats(data)
+                _stats['signature'] = signature
+    return _stats['stats']
+
+
+def generar_grafico(feature_stats: Dict, y: str, title: str) -> str:
+    """Dibuja el gráfico de caja a partir del resumen precalculado, sin enviar los datos crudos"""
+    import plotly.graph_objects as go
+
+    summary = feature_stats['stats'][y]
+    fig = go.Figure(go.Box(
+        x=feature_stats['crops'],
+        q1=summary['q1'],
+        median=summary['median'],
+        q3=summary['q3'],
+        lowerfence=summary['lowerfence'],
+        upperfence=summary['upperfence'],
+        mean=summary['mean'],
+        name=y
+    ))
+    fig.update_layout(
+        title=title, xaxis_title='label', yaxis_title=y,
+        margin={"l": 0, "r": 0, "t": 30, "b": 0}, autosize=True
+    )
+    # plotly.js se carga una sola vez en la plantilla, no dentro de cada figura
+    return fig.to_html(full_html=False, include_plotlyjs=False)
+
+
+def _build_charts(model) -> Dict[str, str]:
+    """Genera el HTML de todas las figuras de la página de análisis"""
+    import pandas as pd
+    import plotly.express as px
+
+    feature_stats = get_feature_stats()
+    charts = {name: generar_grafico(feature_stats, y, title) for y, title, name in BOX_PLOTS}
+
+    # Obtener importancia de las características
+    feature_importances = pd.Series(model.feature_importances_, index=FEATURE_COLUMNS)
+    barra_importancia = px.bar(feature_importances.sort_values(ascending=True), orientation='h', title="Importancia de cada característica")
+    barra_importancia.update_layout(
+        xaxis_title="Importancia",
+        yaxis_title="Característica"
+    )
+    charts['barra_importancia'] = barra_importancia.to_html(full_html=False, include_plotlyjs=False)
+
+    return charts
+
+
+def get_charts() -> Dict[str, str]:
+    """
+    Devuelve el HTML de las figuras, generado una vez por versión del dataset y del modelo
+
+    La clave incluye la firma del CSV y la versión del modelo en servicio, así que
+    cualquier cambio en alguno de los dos genera las figuras de nuevo. El resultado se
+    guarda en memoria y en la caché de Django (compartible entre workers).
+
+    Returns:
+        dict: HTML de cada figura por nombre de variable de la plantilla
+    """
+    service = get_service()
+    mtime_ns, size = dataset_signature()
+    key = f'analytics:charts:{mtime_ns}:{size}:{service.model_version}'
+
+    if _charts['key'] == key:
+        return _charts['html']
+
+    with _charts_lock:
+        if _charts['key'] == key:
+            return _charts['html']
+
+        charts = cache.get(key)
+        if charts is None:
+            logger.info(f"Generando gráficos de análisis ({key})")
+            charts = _build_charts(service.model)
+            cache.set(key, charts, timeout=settings.ANALYTICS_CACHE_TIMEOUT)
+
+        _charts['html'] = charts
+        _charts['key'] = key
+
+    return charts
@@ -0,0 +1,408 @@
+import codecs
+import json
+import logging
+import math
+from datetime import datetime, timezone as dt_timezone
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from ..models import SensorDevice, SensorReading
+from .live import broker
+from .rescoring import rescore_devices
+from ...recommendations.services.features import FEATURE_COLUMNS
+
+logger = logging.getLogger('sensors')
+
+# Claves de la proyección "última lectura por dispositivo" en la caché
+LATEST_CACHE_PREFIX = 'sensors:latest:'
+LAST_DEVICE_CACHE_KEY = 'sensors:latest-device'
+
+# Caracteres que pueden continuar un número JSON ('1.' o '2e' al final de un bloque están incompletos)
+_NUMBER_CONTINUATION = frozenset('0123456789.eE+-')
+
+
+def _parse_timestamp(value) -> Optional[datetime]:
+    """Acepta ISO 8601 o segundos desde epoch; las fechas sin zona se interpretan en UTC"""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return datetime.fromtimestamp(value, tz=dt_timezone.utc)
+
+    if isinstance(value, str):
+        parsed = parse_datetime(value)
+        if parsed is not None and timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed, dt_timezone.utc)
+        return parsed
+
+    return None
+
+
+def _parse_value(value) -> Optional[float]:
+    """Convierte un valor de sensor a float; acepta números entre comillas (como los envía el firmware)"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, str):
+        value = value.strip()
+    elif not isinstance(value, (int, float)):
+        return None
+
+    try:
+        number = float(value)
+    except (ValueError, OverflowError):
+        return None
+    return number if math.isfinite(number) else None
+
+
+def parse_reading(payload: Dict, default_device_id: Optional[str] = None) -> Dict:
+    """
+    Valida una lectura recibida de una estación
+
+    Args:
+        payload (dict): Lectura con device_id, timestamp opcional y cualquiera de N, P, K,
+            temperature, humidity, ph, rainfall (números o textos numéricos como "25.3")
+        default_device_id (str): Dispositivo para lecturas sin device_id (por defecto
+            settings.SENSOR_DEFAULT_DEVICE_ID)
+
+    Returns:
+        dict: {'valid', 'errors', 'reading'} con la lectura normalizada si es válida
+    """
+    if not isinstance(payload, dict):
+        return {'valid': False, 'errors': ['La lectura debe ser un objeto'], 'reading': None}
+
+    errors = []
+
+    device_id = payload.get('device_id', default_device_id or settings.SENSOR_DEFAULT_DEVICE_ID)
+    if not isinstance(device_id, str) or not device_id or len(device_id) > 64:
+        errors.append('device_id debe ser un texto de 1 a 64 caracteres')
+
+    timestamp = payload.get('timestamp')
+    if timestamp is None:
+        timestamp = timezone.now()
+    else:
+        try:
+            timestamp = _parse_timestamp(timestamp)
+        except (ValueError, OverflowError, OSError):
+            timestamp = None
+        if timestamp is None:
+            errors.append('timestamp inválido')
+
+    values = {}
+    for field in FEATURE_COLUMNS:
+        value = payload.get(field)
+        if value is None:
+            continue
+        number = _parse_value(value)
+        if number is None:
+            errors.append(f'{field} debe ser numérico')
+        else:
+            values[field] = number
+
+    if not values and not errors:
+        errors.append('La lectura no contiene valores de sensores')
+
+    if errors:
+        return {'valid': False, 'errors': errors, 'reading': None}
+
+    return {
+        'valid': True,
+        'errors': [],
+        'reading': {'device_id': device_id, 'timestamp': timestamp, 'values': values}
+    }
+
+
+def ingest_readings(readings: List[Dict]) -> List[SensorReading]:
+    """
+    Persiste lecturas ya validadas con inserciones masivas y actualiza la proyección por dispositivo
+
+    Después re-puntúa los dispositivos cuya proyección cambió más que settings.SENSOR_RESCORE;
+    un fallo del modelo se registra sin rechazar las lecturas ya guardadas.
+
+    Args:
+        readings (list): Lecturas normalizadas por parse_reading
+
+    Returns:
+        list: Instancias de SensorReading insertadas
+    """
+    if not readings:
+        return []
+
+    with transaction.atomic():
+        devices = _get_or_create_devices({reading['device_id'] for reading in readings})
+
+        objects = [
+            SensorReading(device=devices[reading['device_id']], timestamp=reading['timestamp'], **reading['values'])
+            for reading in readings
+        ]
+        SensorReading.objects.bulk_create(objects, batch_size=settings.SENSOR_INGEST_BATCH_SIZE)
+
+        updated_devices = _update_latest(devices, readings)
+
+    # La caché se actualiza al final para no publicar estados de una transacción revertida
+    _cache_latest(updated_devices)
+
+    try:
+        rescore_devices(updated_devices)
+    except Exception as e:
+        logger.error(f"Error re-puntuando dispositivos: {e}")
+
+    logger.info(f"{len(objects)} lecturas ingeridas de {len(devices)} dispositivos")
+    return objects
+
+
+def _get_or_create_devices(device_ids: Iterable[str]) -> Dict[str, SensorDevice]:
+    device_ids = set(device_ids)
+    devices = {device.device_id: device for device in SensorDevice.objects.filter(device_id__in=device_ids)}
+
+    missing = device_ids - devices.keys()
+    if missing:
+        # ignore_conflicts cubre el alta simultánea del mismo dispositivo desde otro worker
+        SensorDevice.objects.bulk_create([SensorDevice(device_id=device_id) for device_id in missing],
+                                         ignore_conflicts=True)
+        devices.update({device.device_id: device for device in SensorDevice.objects.filter(device_id__in=missing)})
+
+    return devices
+
+
+def _update_latest(devices: Dict[str, SensorDevice], readings: List[Dict]) -> List[SensorDevice]:
+    """Aplica a cada dispositivo el último valor de cada característica presente en el lote"""
+    latest = {}
+    for reading in sorted(readings, key=lambda reading: reading['timestamp']):
+        state = latest.setdefault(reading['device_id'], {})
+        state['last_seen'] = reading['timestamp']
+        state.update(reading['values'])
+
+    for device_id, state in latest.items():
+        # Una lectura atrasada (por ejemplo, reenviada por un gateway) no pisa un estado más nuevo
+        SensorDevice.objects.filter(
+            Q(last_seen__isnull=True) | Q(last_seen__lte=state['last_seen']),
+            pk=devices[device_id].pk
+        ).update(**state)
+
+    return list(SensorDevice.objects.filter(pk__in=[devices[device_id].pk for device_id in latest]))
+
+
+def device_snapshot(device: SensorDevice) -> Dict:
+    """Estado actual de un dispositivo en formato serializable"""
+    return {
+        'device_id': device.device_id,
+        'timestamp': device.last_seen.isoformat() if device.last_seen else None,
+        **{field: getattr(device, field) for field in FEATURE_COLUMNS}
+    }
+
+
+def _cache_latest(devices: List[SensorDevice]):
+    devices = [device for device in devices if device.last_seen is not None]
+    if not devices:
+        return
+
+    timeout = settings.SENSOR_LATEST_CACHE_TIMEOUT
+    snapshots = {LATEST_CACHE_PREFIX + device.device_id: device_snapshot(device) for device in devices}
+    cache.set_many(snapshots, timeout=timeout)
+
+    # Empujar el nuevo estado a los tableros conectados por SSE
+    for snapshot in snapshots.values():
+        broker.publish(snapshot)
+
+    newest = max(devices, key=lambda device: device.last_seen)
+    current = cache.get(LAST_DEVICE_CACHE_KEY)
+    if current is None or current[1] <= newest.last_seen:
+        cache.set(LAST_DEVICE_CACHE_KEY, (newest.device_id, newest.last_seen), timeout=timeout)
+
+
+def get_latest(device_id: Optional[str] = None) -> Optional[Dict]:
+    """
+    Devuelve la última lectura conocida de un dispositivo (o del último que reportó)
+
+    Lee la proyección en caché y, si no está, la fila del dispositivo; nunca recorre
+    la tabla de lecturas.
+
+    Args:
+        device_id (str): Identificador del dispositivo; None para el último que reportó
+
+    Returns:
+        dict: Estado actual o None si no hay datos
+    """
+    timeout = settings.SENSOR_LATEST_CACHE_TIMEOUT
+
+    if device_id is None:
+        last_device = cache.get(LAST_DEVICE_CACHE_KEY)
+        if last_device is not None:
+            device_id = last_device[0]
+        else:
+            device = SensorDevice.objects.filter(last_seen__isnull=False).order_by('-last_seen').first()
+            if device is None:
+                return None
+            cache.set(LAST_DEVICE_CACHE_KEY, (device.device_id, device.last_seen), timeout=timeout)
+            snapshot = device_snapshot(device)
+            cache.set(LATEST_CACHE_PREFIX + device.device_id, snapshot, timeout=timeout)
+            return snapshot
+
+    snapshot = cache.get(LATEST_CACHE_PREFIX + device_id)
+    if snapshot is None:
+        device = SensorDevice.objects.filter(device_id=device_id, last_seen__isnull=False).first()
+        if device is None:
+            return None
+        snapshot = device_snapshot(device)
+        cache.set(LATEST_CACHE_PREFIX + device_id, snapshot, timeout=timeout)
+
+    return snapshot
+
+
+def iter_ndjson(stream) -> Iterator[Tuple[object, Optional[str]]]:
+    """
+    Recorre un cuerpo NDJSON línea por línea sin cargarlo completo en memoria
+
+    Returns:
+        Iterator: (lectura, None) por línea válida o (None, error) si la línea no es JSON
+    """
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line), None
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            yield None, 'JSON inválido'
+
+
+def iter_json_array(stream, chunk_size: int = 64 * 1024) -> Iterator[object]:
+    """
+    Recorre los elementos de un arreglo JSON leyendo el cuerpo por bloques
+
+    Raises:
+        ValueError: Si el cuerpo no es un arreglo JSON bien formado
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    buffer = ''
+    position = 0
+    eof = False
+    started = False
+
+    def fill():
+        nonlocal buffer, position, eof
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            eof = True
+            buffer = buffer[position:] + text_decoder.decode(b'', final=True)
+        else:
+            buffer = buffer[position:] + text_decoder.decode(chunk)
+        position = 0
+
+    def skip_whitespace():
+        nonlocal position
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n':
+                position += 1
+            if position < len(buffer) or eof:
+                return
+            fill()
+
+    skip_whitespace()
+    if position >= len(buffer) or buffer[position] != '[':
+        raise ValueError('Se esperaba un arreglo JSON')
+    position += 1
+
+    while True:
+        skip_whitespace()
+        if position >= len(buffer):
+            raise ValueError('Arreglo JSON incompleto')
+
+        if buffer[position] == ']':
+            position += 1
+            skip_whitespace()
+            if position < len(buffer):
+                raise ValueError('Contenido inesperado después del arreglo JSON')
+            return
+
+        if started:
+            if buffer[position] != ',':
+                raise ValueError('Se esperaba "," entre elementos')
+            position += 1
+            skip_whitespace()
+        started = True
+
+        # Un valor al final del bloque podría estar incompleto: se acepta solo si hay más texto o es EOF.
+        # Un número también se ve completo si el bloque lo corta en '.' o en el exponente
+        while True:
+            try:
+                value, end = decoder.raw_decode(buffer, position)
+                if eof or (end < len(buffer) and not (
+                        isinstance(value, (int, float)) and buffer[end] in _NUMBER_CONTINUATION)):
+                    break
+            except json.JSONDecodeError:
+                if eof:
+                    raise ValueError('Arreglo JSON mal formado')
+            fill()
+
+        position = end
+        yield value
+
+
+def ingest_stream(items: Iterable[Tuple[object, Optional[str]]], default_device_id: Optional[str] = None,
+                  max_readings: Optional[int] = None) -> Dict:
+    """
+    Valida y persiste un flujo de lecturas por lotes, sin acumular el cuerpo completo
+
+    Args:
+        items (iterable): Pares (lectura, error de parseo) en el orden recibido
+        default_device_id (str): Dispositivo para lecturas sin device_id
+        max_readings (int): Máximo de lecturas aceptadas en una petición
+
+    Returns:
+        dict: Conteos, el estado de cada lectura por índice y 'error' si el flujo se cortó;
+            las lecturas aceptadas antes del corte quedan guardadas
+    """
+    batch_size = settings.SENSOR_INGEST_BATCH_SIZE
+    results = []
+    pending = []
+    stream_error = None
+
+    def flush():
+        try:
+            ingest_readings([reading for _, reading in pending])
+        except Exception as e:
+            logger.error(f"Error guardando lote de lecturas: {e}")
+            for index, _ in pending:
+                results[index] = {'index': index, 'status': 'rejected', 'errors': ['Error al guardar la lectura']}
+        pending.clear()
+
+    try:
+        for index, (payload, error) in enumerate(items):
+            if max_readings is not None and index >= max_readings:
+                stream_error = f'Se admiten como máximo {max_readings} lecturas por petición'
+                break
+
+            if error is not None:
+                results.append({'index': index, 'status': 'rejected', 'errors': [error]})
+                continue
+
+            parsed = parse_reading(payload, default_device_id)
+            if not parsed['valid']:
+                results.append({'index': index, 'status': 'rejected', 'errors': parsed['errors']})
+                continue
+
+            results.append({'index': index, 'status': 'accepted'})
+            pending.append((index, parsed['reading']))
+            if len(pending) >= batch_size:
+                flush()
+    except ValueError as e:
+        stream_error = str(e)
+
+    if pending:
+        flush()
+
+    accepted = sum(1 for result in results if result['status'] == 'accepted')
+    summary = {
+        'received': len(results),
+        'accepted': accepted,
+        'rejected': len(results) - accepted,
+        'results': results
+    }
+    if stream_error is not None:
+        summary['error'] = stream_error
+    return summary
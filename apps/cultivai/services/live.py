@@ -0,0 +1,77 @@
+import asyncio
+import logging
+import threading
+from typing import Dict, Optional
+
+logger = logging.getLogger('sensors')
+
+
+class Subscription:
+    """
+    Suscripción de una conexión a un canal de dispositivo (o a todos con device_id=None)
+
+    La cola está acotada: si el cliente no consume a tiempo se descarta la lectura más
+    antigua, ya que para un tablero en vivo solo importa el estado más reciente.
+    """
+
+    def __init__(self, device_id: Optional[str], max_queue: int):
+        self.device_id = device_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=max_queue)
+
+    def _put(self, snapshot: Dict):
+        # Corre en el event loop de la suscripción
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(snapshot)
+
+    async def get(self) -> Dict:
+        return await self.queue.get()
+
+
+class SensorBroker:
+    """
+    Publica cada lectura ingerida a las conexiones suscritas, con un canal por dispositivo
+
+    publish() se llama desde los hilos de las vistas síncronas; la entrega a cada
+    suscriptor se agenda en su event loop con call_soon_threadsafe. El alcance es el
+    proceso: con varios workers, cada uno publica lo que ingiere él mismo (ver
+    SENSOR_STREAM_POLL_INTERVAL para cubrir el resto con la caché compartida).
+    """
+
+    def __init__(self):
+        self._channels: Dict[Optional[str], set] = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, device_id: Optional[str], max_queue: int = 16) -> Subscription:
+        subscription = Subscription(device_id, max_queue)
+        with self._lock:
+            self._channels.setdefault(device_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            subscribers = self._channels.get(subscription.device_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._channels[subscription.device_id]
+
+    def publish(self, snapshot: Dict):
+        """Entrega el estado de un dispositivo a su canal y al canal de todos los dispositivos"""
+        with self._lock:
+            subscribers = list(self._channels.get(snapshot['device_id'], ())) + list(self._channels.get(None, ()))
+
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription._put, snapshot)
+            except RuntimeError:
+                # El event loop ya se cerró; la conexión se limpia en su propio finally
+                logger.debug(f"Suscripción sin event loop para {snapshot['device_id']}")
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._channels.values())
+
+
+broker = SensorBroker()
@@ -0,0 +1,158 @@
+import logging
+from typing import Dict, List, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+
+from ..models import SensorDevice
+from ...recommendations.services.features import FEATURE_COLUMNS
+from ...recommendations.services.registry import get_service
+
+logger = logging.getLogger('sensors')
+
+# Última recomendación por dispositivo en la caché
+RECOMMENDATION_CACHE_PREFIX = 'sensors:recommendation:'
+
+# Campos de la predicción que se guardan por dispositivo
+RESCORE_FIELDS = frozenset({
+    'predicted_crop', 'predicted_crop_spanish', 'confidence_score', 'confidence_level',
+    'top_recommendations', 'recommendations'
+})
+
+
+def current_features(device: SensorDevice) -> Optional[Dict[str, float]]:
+    """Vector de características actual del dispositivo (None si aún falta alguna)"""
+    features = {field: getattr(device, field) for field in FEATURE_COLUMNS}
+    if any(value is None for value in features.values()):
+        return None
+    return features
+
+
+def needs_rescore(device: SensorDevice, features: Dict[str, float], thresholds: Dict[str, float],
+                  model_version: Optional[str]) -> bool:
+    """
+    Indica si la proyección del dispositivo se alejó lo suficiente de la última predicción
+
+    Args:
+        device (SensorDevice): Dispositivo con scored_features y recommendation
+        features (dict): Vector actual (de current_features)
+        thresholds (dict): Cambio absoluto por característica que dispara una predicción nueva
+        model_version (str): Versión del modelo en servicio; si cambió se predice de nuevo
+    """
+    scored = device.scored_features
+    # Un resultado fallido (por ejemplo, una característica fuera de rango) sigue la misma regla:
+    # lecturas que no se mueven más que el umbral no vuelven a validar ni reescriben la fila
+    if not scored or not device.recommendation:
+        return True
+    if device.recommendation.get('model_version') != model_version:
+        return True
+    return any(
+        scored.get(field) is None or abs(value - scored[field]) > thresholds.get(field, 0)
+        for field, value in features.items()
+    )
+
+
+def rescore_devices(devices: List[SensorDevice], force: bool = False) -> List[str]:
+    """
+    Recalcula la recomendación de los dispositivos cuyo estado cambió más que el umbral
+
+    Todas las predicciones pendientes van en una sola llamada a predict_crops. Cada resultado
+    se guarda en la fila del dispositivo junto al vector puntuado, así que leerlo es una
+    consulta por clave; una predicción sobre un estado más viejo no pisa una más nueva.
+
+    Args:
+        devices (list): Dispositivos recién actualizados (con la proyección ya guardada)
+        force (bool): Predice todos los dispositivos completos aunque no superen el umbral
+
+    Returns:
+        list: device_id de los dispositivos re-puntuados
+    """
+    config = settings.SENSOR_RESCORE
+    if not (config['ENABLED'] or force) or not devices:
+        return []
+
+    service = get_service()
+    if not service.is_model_available():
+        return []
+
+    model_version = service.model_version
+    pending = []
+    for device in devices:
+        features = current_features(device)
+        if features is None or device.last_seen is None:
+            continue
+        if force or needs_rescore(device, features, config['THRESHOLDS'], model_version):
+            pending.append((device, features))
+
+    if not pending:
+        return []
+
+    output = service.predict_crops([features for _, features in pending], RESCORE_FIELDS)
+    if not output.get('results'):
+        logger.error(f"No se pudo re-puntuar {len(pending)} dispositivos: {output.get('errors')}")
+        return []
+
+    snapshots = {}
+    for (device, features), result in zip(pending, output['results']):
+        # La versión del lote se guarda por dispositivo para re-puntuar cuando cambie el modelo
+        result.pop('index', None)
+        result['model_version'] = output['model_version']
+        updated = SensorDevice.objects.filter(
+            Q(scored_at__isnull=True) | Q(scored_at__lte=device.last_seen), pk=device.pk
+        ).update(scored_at=device.last_seen, scored_features=features, recommendation=result)
+        if updated:
+            device.scored_at, device.scored_features, device.recommendation = device.last_seen, features, result
+            snapshots[RECOMMENDATION_CACHE_PREFIX + device.device_id] = recommendation_snapshot(device)
+
+    cache.set_many(snapshots, timeout=settings.SENSOR_LATEST_CACHE_TIMEOUT)
+
+    logger.info(f"{len(snapshots)} de {len(devices)} dispositivos re-puntuados")
+    return [key[len(RECOMMENDATION_CACHE_PREFIX):] for key in snapshots]
+
+
+def recommendation_snapshot(device: SensorDevice) -> Dict:
+    """Última recomendación de un dispositivo en formato serializable"""
+    return {
+        'device_id': device.device_id,
+        'scored_at': device.scored_at.isoformat() if device.scored_at else None,
+        'features': device.scored_features,
+        **(device.recommendation or {})
+    }
+
+
+def get_recommendation(device_id: Optional[str] = None) -> Optional[Dict]:
+    """
+    Devuelve la última recomendación de un dispositivo (o del último que reportó)
+
+    Lee la caché y, si no está, la fila del dispositivo; nunca ejecuta el modelo.
+
+    Args:
+        device_id (str): Identificador del dispositivo; None para el último que reportó
+
+    Returns:
+        dict: Recomendación guardada (con success False si la última predicción falló)
+        o None si el dispositivo aún no tiene una
+    """
+    from .ingestion import LAST_DEVICE_CACHE_KEY
+
+    if device_id is None:
+        last_device = cache.get(LAST_DEVICE_CACHE_KEY)
+        if last_device is not None:
+            device_id = last_device[0]
+        else:
+            device = SensorDevice.objects.filter(last_seen__isnull=False).order_by('-last_seen').first()
+            if device is None:
+                return None
+            device_id = device.device_id
+
+    key = RECOMMENDATION_CACHE_PREFIX + device_id
+    snapshot = cache.get(key)
+    if snapshot is None:
+        device = SensorDevice.objects.filter(device_id=device_id, recommendation__isnull=False).first()
+        if device is None:
+            return None
+        snapshot = recommendation_snapshot(device)
+        cache.set(key, snapshot, timeout=settings.SENSOR_LATEST_CACHE_TIMEOUT)
+
+    return snapshot
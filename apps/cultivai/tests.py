@@ -1,3 +1,371 @@
-from django.test import TestCase
+import io
+import json
+import os
+import shutil
+import tempfile
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from .models import SensorDevice, SensorReading
+from .services import analytics
+from .services.analytics import compute_feature_stats, get_feature_stats
+from .services.ingestion import iter_json_array, iter_ndjson, parse_reading
+
+
+class ParseReadingTests(SimpleTestCase):
+    """Las lecturas aceptan números o textos numéricos y rechazan lo que no sea un número finito"""
+
+    def test_numeric_strings_are_converted(self):
+        parsed = parse_reading({'device_id': 'a', 'temperature': '25', 'humidity': ' 61.5 ', 'ph': 6})
+        self.assertTrue(parsed['valid'], parsed['errors'])
+        self.assertEqual(parsed['reading']['values'], {'temperature': 25.0, 'humidity': 61.5, 'ph': 6.0})
+
+    def test_invalid_values_are_rejected(self):
+        for value in ('abc', '', 'nan', 'inf', '-Infinity', '1e400', True, [25], {'v': 1}, float('nan')):
+            parsed = parse_reading({'device_id': 'a', 'temperature': value})
+            self.assertFalse(parsed['valid'], value)
+            self.assertEqual(parsed['errors'], ['temperature debe ser numérico'])
+
+
+class ReceiveArduinoDataTests(TestCase):
+    """El endpoint de una lectura acepta valores entre comillas, como antes de la serie de tiempo"""
+
+    def test_quoted_values_are_stored(self):
+        response = self.client.post('/receive_arduino_data/', json.dumps({
+            'device_id': 'arduino-1', 'temperature': '25', 'humidity': '60.5'
+        }), content_type='application/json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], 'success')
+        reading = SensorReading.objects.get()
+        self.assertEqual((reading.temperature, reading.humidity), (25.0, 60.5))
+        self.assertEqual(SensorDevice.objects.get(device_id='arduino-1').temperature, 25.0)
+
+    def test_unparseable_value_is_rejected(self):
+        response = self.client.post('/receive_arduino_data/', json.dumps({
+            'device_id': 'arduino-1', 'temperature': 'NaN', 'humidity': '60'
+        }), content_type='application/json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(SensorReading.objects.count(), 0)
+
+
+class IterJsonArrayTests(SimpleTestCase):
+    """El parser incremental debe dar lo mismo que json.loads sin importar dónde se corten los bloques"""
+
+    def parse(self, body: bytes, chunk_size: int = 64 * 1024):
+        return list(iter_json_array(io.BytesIO(body), chunk_size=chunk_size))
+
+    def test_chunk_boundaries(self):
+        body = json.dumps([
+            {'device_id': 'estación-ñ', 'temperature': 25.5, 'humidity': 61},
+            12345, 1.5e3, -2.5e-3, 'texto con "comillas", \\ y [corchetes]', [1, [2, {}]], True, False, None,
+        ], ensure_ascii=False).encode('utf-8')
+
+        expected = json.loads(body)
+        for chunk_size in (1, 2, 3, 5, 7, 64, len(body)):
+            self.assertEqual(self.parse(body, chunk_size), expected, chunk_size)
+
+    def test_empty_array(self):
+        for body in (b'[]', b'  [ \n ]  \n'):
+            for chunk_size in (1, 64):
+                self.assertEqual(self.parse(body, chunk_size), [])
+
+    def test_malformed_bodies(self):
+        for body in (b'', b'{}', b'[1, 2', b'[{"a": 1', b'[1 2]', b'[1, 2,]', b'[,1]', b'[1,,2]', b'[1] x',
+                     b'["sin cerrar]'):
+            for chunk_size in (1, 3, 64):
+                with self.assertRaises(ValueError, msg=(body, chunk_size)):
+                    self.parse(body, chunk_size)
+
+    def test_elements_before_error_are_yielded(self):
+        items = iter_json_array(io.BytesIO(b'[{"a": 1}, {"b": 2} {"c": 3}]'), chunk_size=4)
+        self.assertEqual(next(items), {'a': 1})
+        self.assertEqual(next(items), {'b': 2})
+        with self.assertRaises(ValueError):
+            next(items)
+
+
+class IterNdjsonTests(SimpleTestCase):
+    def test_bad_and_blank_lines(self):
+        body = b'{"a": 1}\n\n   \nno es json\n\xff\xfe\n{"b": 2}\r\n[3]'
+        self.assertEqual(list(iter_ndjson(io.BytesIO(body))), [
+            ({'a': 1}, None), (None, 'JSON inválido'), (None, 'JSON inválido'), ({'b': 2}, None), ([3], None),
+        ])
+
+
+class BulkIngestionTests(TestCase):
+    """El endpoint masivo guarda lo válido y reporta por índice lo rechazado"""
+
+    URL = '/receive_arduino_data/bulk/'
+
+    def post(self, body, content_type='application/json', **params):
+        url = self.URL + (f"?device_id={params['device_id']}" if 'device_id' in params else '')
+        return self.client.post(url, body, content_type=content_type)
+
+    @override_settings(SENSOR_INGEST_BATCH_SIZE=2)
+    def test_partial_failure_summary(self):
+        readings = [
+            {'device_id': 'a', 'temperature': 21.5},
+            {'device_id': 'a', 'temperature': 'caliente'},
+            'no es un objeto',
+            {'humidity': '60'},
+            {'device_id': 'b'},
+            {'device_id': 'b', 'ph': 6.5, 'timestamp': 'ayer'},
+            {'device_id': 'b', 'ph': 6.8, 'timestamp': 1700000000},
+        ]
+        response = self.post(json.dumps(readings), device_id='gateway')
+
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual((body['received'], body['accepted'], body['rejected']), (7, 3, 4))
+        self.assertEqual([result['status'] for result in body['results']],
+                         ['accepted', 'rejected', 'rejected', 'accepted', 'rejected', 'rejected', 'accepted'])
+        self.assertEqual(body['results'][1]['errors'], ['temperature debe ser numérico'])
+        self.assertEqual(body['results'][4]['errors'], ['La lectura no contiene valores de sensores'])
+        self.assertEqual(body['results'][5]['errors'], ['timestamp inválido'])
+
+        self.assertEqual(SensorReading.objects.count(), 3)
+        self.assertEqual(SensorDevice.objects.get(device_id='gateway').humidity, 60.0)
+
+    @override_settings(SENSOR_INGEST_BATCH_SIZE=2)
+    def test_truncated_array_keeps_accepted_readings(self):
+        body = b'[{"device_id": "a", "temperature": 20}, {"device_id": "a", "temperature": 21}, {"device_id": "a", "te'
+        response = self.post(body)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['status'], 'error')
+        self.assertEqual(response.json()['accepted'], 2)
+        self.assertEqual(SensorReading.objects.count(), 2)
+
+    def test_ndjson_with_bad_lines(self):
+        body = b'{"device_id": "a", "temperature": 20}\n\n{roto\n{"device_id": "a", "humidity": 55}\n'
+        response = self.post(body, content_type='application/x-ndjson')
+
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual([result['status'] for result in body['results']], ['accepted', 'rejected', 'accepted'])
+        self.assertEqual(body['results'][1]['errors'], ['JSON inválido'])
+        self.assertEqual(SensorReading.objects.count(), 2)
+
+    @override_settings(SENSOR_BULK_MAX_READINGS=2)
+    def test_reading_limit(self):
+        readings = [{'device_id': 'a', 'temperature': 20 + i} for i in range(3)]
+        response = self.post(json.dumps(readings))
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['received'], 2)
+        self.assertEqual(SensorReading.objects.count(), 2)
+
+    def test_save_error_marks_batch_rejected(self):
+        readings = [{'device_id': 'a', 'temperature': 20}, {'device_id': 'a', 'temperature': 'x'}]
+        with mock.patch('apps.cultivai.services.ingestion.ingest_readings', side_effect=RuntimeError('db caída')):
+            response = self.post(json.dumps(readings))
+
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual((body['accepted'], body['rejected']), (0, 2))
+        self.assertEqual(body['results'][0]['errors'], ['Error al guardar la lectura'])
+
+
+@override_settings(SENSOR_STREAM_HEARTBEAT=0.05, SENSOR_STREAM_WSGI_POLL_INTERVAL=0.01)
+class SensorStreamTests(TestCase):
+    """El flujo SSE debe entregar su primer evento tanto por WSGI como por ASGI"""
+
+    URL = '/api/sensores/stream/?device_id=arduino-1'
+
+    def setUp(self):
+        cache.clear()
+        self.client.post('/receive_arduino_data/', json.dumps({
+            'device_id': 'arduino-1', 'temperature': 24.5, 'humidity': 60
+        }), content_type='application/json')
+
+    def test_wsgi_first_event(self):
+        response = self.client.get(self.URL)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertFalse(response.is_async)
+
+        events = iter(response.streaming_content)
+        first = next(events).decode()
+        self.assertIn('event: reading', first)
+        self.assertEqual(json.loads(first.split('data: ', 1)[1])['temperature'], 24.5)
+
+        # Sin lecturas nuevas solo llegan keep-alive; una lectura nueva se entrega al consultar la caché
+        self.assertEqual(next(events), b': keep-alive\n\n')
+        self.client.post('/receive_arduino_data/', json.dumps({
+            'device_id': 'arduino-1', 'temperature': 26, 'humidity': 60
+        }), content_type='application/json')
+        self.assertIn('"temperature": 26.0', next(events).decode())
+        response.close()
+
+    async def test_asgi_first_event(self):
+        response = await self.async_client.get(self.URL)
+        self.assertTrue(response.is_async)
+
+        events = aiter(response.streaming_content)
+        first = await anext(events)
+        self.assertIn('event: reading', first.decode())
+        self.assertEqual(await anext(events), b': keep-alive\n\n')
+        await events.aclose()
+
+
+class TemporaryDatasetMixin:
+    """Apunta DATASET_PATH a un CSV pequeño en una carpeta temporal y limpia las copias en memoria"""
+
+    ROWS = [
+        # N de 'arroz': 1, 2, 3, 4 y un atípico 100; 'maiz' en orden de aparición después
+        {'N': 1, 'P': 10, 'K': 5, 'temperature': 20.0, 'humidity': 80.0, 'ph': 6.0, 'rainfall': 200.0, 'label': 'arroz'},
+        {'N': 50, 'P': 40, 'K': 20, 'temperature': 25.0, 'humidity': 60.0, 'ph': 6.5, 'rainfall': 80.0, 'label': 'maiz'},
+        {'N': 2, 'P': 12, 'K': 6, 'temperature': 21.0, 'humidity': 81.0, 'ph': 6.1, 'rainfall': 210.0, 'label': 'arroz'},
+        {'N': 3, 'P': 14, 'K': 7, 'temperature': 22.0, 'humidity': 82.0, 'ph': 6.2, 'rainfall': 220.0, 'label': 'arroz'},
+        {'N': 60, 'P': 42, 'K': 22, 'temperature': 26.0, 'humidity': 62.0, 'ph': 6.7, 'rainfall': 90.0, 'label': 'maiz'},
+        {'N': 4, 'P': 16, 'K': 8, 'temperature': 23.0, 'humidity': 83.0, 'ph': 6.3, 'rainfall': 230.0, 'label': 'arroz'},
+        {'N': 100, 'P': 18, 'K': 9, 'temperature': 24.0, 'humidity': 84.0, 'ph': 6.4, 'rainfall': 240.0, 'label': 'arroz'},
+    ]
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.csv_path = os.path.join(directory, 'data.csv')
+        self.write_csv(self.ROWS)
+
+        settings_override = override_settings(
+            DATASET_PATH=self.csv_path, DATASET_COLUMNAR_DIR=os.path.join(directory, 'columnar')
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        cache.clear()
+        for state in (analytics._stats, analytics._charts):
+            patcher = mock.patch.dict(state, {key: None for key in state})
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def write_csv(self, rows):
+        import pandas as pd
+        pd.DataFrame(rows).to_csv(self.csv_path, index=False)
+
+
+class FeatureStatsTests(TemporaryDatasetMixin, TestCase):
+    """Resumen de /api/stats/: valores de los gráficos de caja, caché por firma del CSV y ETag"""
+
+    def test_quartiles_and_whiskers(self):
+        import pandas as pd
+
+        stats = compute_feature_stats(pd.DataFrame(self.ROWS))
+        self.assertEqual(stats['crops'], ['arroz', 'maiz'])
+
+        n = stats['stats']['N']
+        # arroz: [1, 2, 3, 4, 100] -> Q1 2, mediana 3, Q3 4; 100 queda fuera de Q3 + 1.5 IQR = 7
+        self.assertEqual(n['count'], [5, 2])
+        self.assertEqual((n['q1'][0], n['median'][0], n['q3'][0]), (2.0, 3.0, 4.0))
+        self.assertEqual((n['lowerfence'][0], n['upperfence'][0], n['max'][0]), (1.0, 4.0, 100.0))
+        self.assertEqual(n['mean'][0], 22.0)
+        # maiz: [50, 60] con interpolación lineal
+        self.assertEqual((n['q1'][1], n['median'][1], n['q3'][1]), (52.5, 55.0, 57.5))
+        self.assertEqual((n['lowerfence'][1], n['upperfence'][1]), (50.0, 60.0))
+
+    def test_cached_per_csv_signature(self):
+        with mock.patch.object(analytics, 'compute_feature_stats', wraps=compute_feature_stats) as compute:
+            first = get_feature_stats()
+            self.assertIs(get_feature_stats(), first)
+            self.assertEqual(compute.call_count, 1)
+
+            self.write_csv(self.ROWS + [{**self.ROWS[1], 'N': 70}])
+            self.assertEqual(get_feature_stats()['stats']['N']['count'], [5, 3])
+            self.assertEqual(compute.call_count, 2)
+
+    def test_etag_round_trip(self):
+        response = self.client.get('/api/stats/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['crops'], ['arroz', 'maiz'])
+        etag = response['ETag']
+
+        self.assertEqual(self.client.get('/api/stats/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.write_csv(self.ROWS[:-1])
+        response = self.client.get('/api/stats/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['stats']['N']['count'], [4, 2])
+
+
+class ChartsCacheTests(TemporaryDatasetMixin, TestCase):
+    """Las figuras se generan una vez por firma del CSV y versión del modelo; plotly.js se cachea en el navegador"""
+
+    def setUp(self):
+        super().setUp()
+        self.service = SimpleNamespace(model_version='v1', model=None)
+        patcher = mock.patch.object(analytics, 'get_service', return_value=self.service)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        builds = iter(range(1, 100))
+        patcher = mock.patch.object(analytics, '_build_charts', side_effect=lambda model: {'grafico': str(next(builds))})
+        self.build_charts = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_second_call_hits_cache(self):
+        first = analytics.get_charts()
+        self.assertIs(analytics.get_charts(), first)
+        self.assertEqual(self.build_charts.call_count, 1)
+
+        # Otro worker (sin copia en memoria) la toma de la caché de Django
+        analytics._charts.update(key=None, html=None)
+        self.assertEqual(analytics.get_charts(), first)
+        self.assertEqual(self.build_charts.call_count, 1)
+
+    def test_csv_change_rebuilds(self):
+        first = analytics.get_charts()
+        self.write_csv(self.ROWS + [{**self.ROWS[1], 'N': 70}])
+        self.assertNotEqual(analytics.get_charts(), first)
+        self.assertEqual(self.build_charts.call_count, 2)
+
+    def test_model_version_change_rebuilds(self):
+        first = analytics.get_charts()
+        self.service.model_version = 'v2'
+        self.assertNotEqual(analytics.get_charts(), first)
+        self.assertEqual(self.build_charts.call_count, 2)
+
+        # Volver a la versión anterior reutiliza sus figuras guardadas
+        self.service.model_version = 'v1'
+        self.assertEqual(analytics.get_charts(), first)
+        self.assertEqual(self.build_charts.call_count, 2)
+
+    def test_plotly_js_cache_headers(self):
+        response = self.client.get('/graficos/plotly.min.js')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/javascript')
+        self.assertIn(b'plotly', response.content[:1000].lower())
+
+        cache_control = {value.strip() for value in response['Cache-Control'].split(',')}
+        self.assertEqual(cache_control, {'public', 'max-age=31536000', 'immutable'})
+
+
+class CropRecommendationViewTests(TestCase):
+    """Las vistas de cultivai reportan el motivo real cuando predict_crop falla"""
+
+    VALID = {'N': 90, 'P': 42, 'K': 43, 'temperature': 20.8, 'humidity': 82, 'ph': 6.5, 'rainfall': 202.9}
+
+    def _post(self, path, data):
+        return self.client.post(path, json.dumps(data), content_type='application/json')
+
+    def test_invalid_data_message(self):
+        for path in ('/api/crop_recommendation/', '/api/crop_recommendation/async/'):
+            response = self._post(path, {**self.VALID, 'temperature': 60})
+            self.assertEqual(response.status_code, 400, path)
+            body = response.json()
+            self.assertEqual(body['error'], 'Datos inválidos: temperature: Ensure this value is less than or equal to 43.7.')
+            self.assertEqual(list(body['errors']), ['temperature'])
+
+    def test_model_error_message(self):
+        failed = {'success': False, 'errors': 'Modelo ML no disponible', 'predicted_crop': None}
+        with mock.patch('apps.cultivai.views.get_service') as get_service:
+            get_service.return_value.predict_crop.return_value = failed
+            response = self._post('/api/crop_recommendation/', self.VALID)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'Modelo ML no disponible'})
@@ -1,11 +1,22 @@
 from django.urls import path
-from .views import index_view, graphics_view, receive_arduino_data, obtener_ultimos_datos
+from .views import (
+    index_view, graphics_view, receive_arduino_data, obtener_ultimos_datos, plotly_js_view,
+    feature_stats_view, receive_arduino_data_bulk, sensor_stream, crop_recommendation,
+    crop_recommendation_async, sensor_recommendation,
+)
 from . import views
 
 
 urlpatterns = [
     path('', index_view, name='index'),
     path('receive_arduino_data/', receive_arduino_data, name='receive_arduino_data'),
+    path('receive_arduino_data/bulk/', receive_arduino_data_bulk, name='receive_arduino_data_bulk'),
     path('graficos/', graphics_view, name='graficos'),
+    path('graficos/plotly.min.js', plotly_js_view, name='plotly_js'),
     path('api/obtener_ultimos_datos/', obtener_ultimos_datos, name='obtener_ultimos_datos'),
+    path('api/sensores/stream/', sensor_stream, name='sensor_stream'),
+    path('api/sensores/recomendacion/', sensor_recommendation, name='sensor_recommendation'),
+    path('api/stats/', feature_stats_view, name='feature_stats'),
+    path('api/crop_recommendation/', crop_recommendation, name='crop_recommendation'),
+    path('api/crop_recommendation/async/', crop_recommendation_async, name='crop_recommendation_async'),
 ]
\ No newline at end of file
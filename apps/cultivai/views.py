@@ -1,20 +1,26 @@
-import pandas as pd
-import plotly.express as px
-from django.shortcuts import render
-from django.http import JsonResponse
-from django.views.decorators.csrf import csrf_exempt
+import asyncio
 import json
+import time
 
-from .forms import CropForm
-
+from asgiref.sync import sync_to_async
 from django.conf import settings
-from ..recommendations.services.ml_service import CropRecommendationService
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.shortcuts import render
+from django.views.decorators.cache import cache_control
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import etag, require_GET
 
+from .forms import CropForm
+from .services.analytics import dataset_signature, get_charts, get_feature_stats
+from .services.ingestion import (
+    get_latest, ingest_readings, ingest_stream, iter_json_array, iter_ndjson, parse_reading
+)
+from .services.live import broker
+from .services.rescoring import get_recommendation
 
-ml_service = CropRecommendationService(settings.MODEL_PATH, settings.ENCODER_PATH)
-model = ml_service.model
-label_encoder = ml_service.label_encoder
-data = pd.read_csv('./static/data/Crop_recommendation.csv')
+from ..recommendations.services.executor import InferenceRejected, InferenceTimeout, get_inference_executor
+from ..recommendations.services.registry import get_service
 
 
 def index_view(request):
@@ -29,61 +35,62 @@ def index_view(request):
     return render(request, 'index.html', {'form': form})
 
 
-def generar_grafico(y, title):
-    fig = px.box(data, x='label', y=y, title=title)
-    fig.update_layout(margin={"l": 0, "r": 0, "t": 30, "b": 0}, autosize=True)
-    fig_html = fig.to_html(full_html=False)
-    return fig_html
-
-
 def graphics_view(request):
-    fig_box_n_html = generar_grafico('N', 'Nivel de Nitrógeno')
-    fig_box_p_html = generar_grafico('P', 'Nivel de Fósforo')
-    fig_box_k_html = generar_grafico('K', 'Nivel de Potasio')
-    fig_box_temperature_html = generar_grafico('temperature', 'Temperatura')
-    fig_box_humidity_html = generar_grafico('humidity', 'Nivel de humedad')
-    fig_box_ph_html = generar_grafico('ph', 'Nivel de pH ')
-    fig_box_rainfall_html = generar_grafico('rainfall', 'Nivel de lluvia')
-
-    # Obtener importancia de las características
-    feature_importances = pd.Series(model.feature_importances_, index=data.columns[:-1])
-    barra_importancia = px.bar(feature_importances.sort_values(ascending=True), orientation='h', title="Importancia de cada característica")
-    barra_importancia.update_layout(
-        xaxis_title="Importancia",
-        yaxis_title="Característica"
-    )
-    barra_importancia_html = barra_importancia.to_html(full_html=False)
-
+    import plotly
 
+    # Las figuras se generan una vez por versión del dataset y del modelo
     context = {
-        'fig_box_n': fig_box_n_html,
-        'fig_box_p': fig_box_p_html,
-        'fig_box_k': fig_box_k_html,
-        'fig_box_temperature': fig_box_temperature_html,
-        'fig_box_humidity': fig_box_humidity_html,
-        'fig_box_ph': fig_box_ph_html,
-        'fig_box_rainfall': fig_box_rainfall_html,
-        'barra_importancia': barra_importancia_html
+        **get_charts(),
+        'plotly_version': plotly.__version__
     }
     return render(request, 'graficos.html', context)
 
 
-datos_ambiente_temporal = {}  # Diccionario para almacenar temporalmente los datos
+@require_GET
+@etag(lambda request: '%d-%d' % dataset_signature())
+def feature_stats_view(request):
+    """
+    Endpoint con el resumen por cultivo (cuartiles, bigotes, media y conteo) de cada característica
+    """
+    return JsonResponse(get_feature_stats())
+
+
+_plotly_js = {}
+
+
+@require_GET
+@cache_control(public=True, max_age=60 * 60 * 24 * 365, immutable=True)
+def plotly_js_view(request):
+    """
+    Sirve plotly.js una sola vez para todas las figuras (la URL lleva la versión, así que se cachea)
+    """
+    if 'content' not in _plotly_js:
+        from plotly.offline import get_plotlyjs
+        _plotly_js['content'] = get_plotlyjs().encode('utf-8')
+    return HttpResponse(_plotly_js['content'], content_type='application/javascript')
+
 
 @csrf_exempt
 def receive_arduino_data(request):
     if request.method == 'POST':
         try:
             data = json.loads(request.body)
+            if not isinstance(data, dict):
+                return JsonResponse({'status': 'error', 'message': 'Datos incompletos'}, status=400)
+
             temperature = data.get('temperature')
             humidity = data.get('humidity')
 
             if temperature is not None and humidity is not None:
-                # Almacenar los datos temporalmente
-                datos_ambiente_temporal['temperature'] = temperature
-                datos_ambiente_temporal['humidity'] = humidity
+                parsed = parse_reading(data)
+                if not parsed['valid']:
+                    return JsonResponse({'status': 'error', 'message': '; '.join(parsed['errors'])}, status=400)
+
+                # Guardar la lectura en la serie de tiempo del dispositivo
+                ingest_readings([parsed['reading']])
                 return JsonResponse({
                     'status': 'success',
+                    'device_id': parsed['reading']['device_id'],
                     'temperature': temperature,
                     'humidity': humidity
                 })
@@ -96,63 +103,257 @@ def receive_arduino_data(request):
     return JsonResponse({'status': 'error', 'message': 'Método no permitido'}, status=405)
 
 
+@csrf_exempt
+def receive_arduino_data_bulk(request):
+    """
+    Endpoint para que los gateways envíen muchas lecturas (de varios dispositivos) en una petición
+
+    Acepta un arreglo JSON o NDJSON (Content-Type application/x-ndjson), ambos leídos por
+    bloques. ?device_id= define el dispositivo de las lecturas que no lo traen.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'Método no permitido'}, status=405)
+
+    content_type = request.content_type or ''
+    if content_type in ('application/x-ndjson', 'application/jsonl', 'application/ndjson'):
+        items = iter_ndjson(request)
+    else:
+        items = ((reading, None) for reading in iter_json_array(request))
+
+    try:
+        summary = ingest_stream(
+            items,
+            default_device_id=request.GET.get('device_id'),
+            max_readings=settings.SENSOR_BULK_MAX_READINGS
+        )
+    except Exception as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=500)
+
+    # Si el flujo se cortó, lo aceptado hasta ese punto ya quedó guardado y se informa por índice
+    if 'error' in summary:
+        return JsonResponse({'status': 'error', 'message': summary.pop('error'), **summary}, status=400)
+
+    return JsonResponse({'status': 'success', **summary})
+
+
 def obtener_ultimos_datos(request):
     """
     Endpoint para obtener los últimos datos de temperatura y humedad
+
+    Con ?device_id= devuelve los de ese dispositivo; sin él, los del último que reportó.
     """
-    if 'temperature' in datos_ambiente_temporal and 'humidity' in datos_ambiente_temporal:
-        return JsonResponse({
-            'temperature': datos_ambiente_temporal['temperature'],
-            'humidity': datos_ambiente_temporal['humidity']
-        })
+    latest = get_latest(request.GET.get('device_id'))
+    if latest is not None:
+        return JsonResponse(latest)
     else:
         return JsonResponse({
             'temperature': None,
             'humidity': None
         })
 
+
+def sensor_recommendation(request):
+    """
+    Endpoint con la última recomendación de cultivo calculada para un dispositivo
+
+    Se actualiza al ingerir lecturas (solo cuando alguna característica supera su umbral),
+    así que leerla no ejecuta el modelo. Sin ?device_id= usa el último dispositivo que reportó.
+    Si la última predicción falló (lecturas fuera del rango del modelo) responde 422 con sus errores.
+    """
+    recommendation = get_recommendation(request.GET.get('device_id'))
+    if recommendation is None:
+        return JsonResponse({'status': 'error', 'message': 'El dispositivo aún no tiene una recomendación'}, status=404)
+
+    if not recommendation.get('success'):
+        return JsonResponse({
+            'status': 'error',
+            'message': 'Las lecturas actuales del dispositivo no son válidas para el modelo',
+            'device_id': recommendation['device_id'],
+            'scored_at': recommendation['scored_at'],
+            'features': recommendation['features'],
+            'errors': recommendation.get('errors', [])
+        }, status=422)
+
+    return JsonResponse(recommendation)
+
+
+def _sse_event(snapshot):
+    return f"id: {snapshot['timestamp']}\nevent: reading\ndata: {json.dumps(snapshot)}\n\n"
+
+
+async def _sensor_events(device_id):
+    subscription = broker.subscribe(device_id, max_queue=settings.SENSOR_STREAM_QUEUE_SIZE)
+    poll_interval = settings.SENSOR_STREAM_POLL_INTERVAL
+    wait_timeout = settings.SENSOR_STREAM_HEARTBEAT
+    if poll_interval:
+        wait_timeout = min(poll_interval, wait_timeout)
+    try:
+        # Estado actual al conectar, para no esperar a la siguiente lectura
+        last_sent = await sync_to_async(get_latest)(device_id)
+        if last_sent is not None:
+            yield _sse_event(last_sent)
+
+        while True:
+            try:
+                snapshot = await asyncio.wait_for(subscription.get(), timeout=wait_timeout)
+            except asyncio.TimeoutError:
+                snapshot = None
+                # Lecturas ingeridas por otros workers: se leen de la proyección en caché compartida
+                if poll_interval:
+                    snapshot = await sync_to_async(get_latest)(device_id)
+                    if snapshot == last_sent:
+                        snapshot = None
+
+            if snapshot is None:
+                # Comentario SSE para mantener viva la conexión a través de proxies
+                yield ': keep-alive\n\n'
+                continue
+
+            last_sent = snapshot
+            yield _sse_event(snapshot)
+    finally:
+        broker.unsubscribe(subscription)
+
+
+def _sensor_events_polling(device_id):
+    """
+    Variante síncrona para WSGI (runserver, gunicorn con workers sync)
+
+    Un generador asíncrono bajo WSGI se consume completo antes de responder y, como el
+    flujo no termina, la petición nunca responde. Aquí se consulta la proyección en caché
+    cada SENSOR_STREAM_POLL_INTERVAL segundos (o SENSOR_STREAM_WSGI_POLL_INTERVAL si está
+    desactivado); cada conexión ocupa un hilo del servidor mientras esté abierta.
+    """
+    poll_interval = settings.SENSOR_STREAM_POLL_INTERVAL or settings.SENSOR_STREAM_WSGI_POLL_INTERVAL
+    heartbeat = settings.SENSOR_STREAM_HEARTBEAT
+
+    last_sent = get_latest(device_id)
+    if last_sent is not None:
+        yield _sse_event(last_sent)
+
+    idle = 0.0
+    while True:
+        time.sleep(poll_interval)
+        snapshot = get_latest(device_id)
+        if snapshot is not None and snapshot != last_sent:
+            last_sent, idle = snapshot, 0.0
+            yield _sse_event(snapshot)
+            continue
+
+        idle += poll_interval
+        if idle >= heartbeat:
+            idle = 0.0
+            yield ': keep-alive\n\n'
+
+
+async def sensor_stream(request):
+    """
+    Server-Sent Events con cada nueva lectura, en lugar de consultar obtener_ultimos_datos
+
+    Con ?device_id= solo se reciben las lecturas de ese dispositivo. Está pensado para
+    servirse por ASGI (core.asgi), donde cada conexión inactiva es solo una tarea del
+    event loop y no ocupa un worker; bajo WSGI se usa un generador síncrono que consulta
+    la caché.
+    """
+    if request.method != 'GET':
+        return JsonResponse({'status': 'error', 'message': 'Método no permitido'}, status=405)
+
+    device_id = request.GET.get('device_id')
+    events = _sensor_events(device_id) if isinstance(request, ASGIRequest) else _sensor_events_polling(device_id)
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def _parse_recommendation_input(body: bytes):
+    """Convierte el cuerpo JSON al formato esperado por el modelo; None si faltan campos"""
+    data = json.loads(body)
+
+    # Validar que todos los campos requeridos estén presentes
+    required_fields = ['N', 'P', 'K', 'temperature', 'humidity', 'ph', 'rainfall']
+    if not all(field in data for field in required_fields):
+        return None
+
+    return {
+        'N': float(data['N']),
+        'P': float(data['P']),
+        'K': float(data['K']),
+        'temperature': float(data['temperature']),
+        'humidity': float(data['humidity']),
+        'ph': float(data['ph']),
+        'rainfall': float(data['rainfall'])
+    }
+
+
+def _recommendation_response(input_data, prediction_result):
+    """Formatea el resultado de predict_crop para el frontend"""
+    if not prediction_result.get('success', False):
+        # predict_crop deja el motivo en 'errors': mensajes por campo o un texto si falló el modelo
+        errors = prediction_result.get('errors')
+        if isinstance(errors, dict):
+            details = '; '.join(f"{field}: {' '.join(messages)}" for field, messages in errors.items())
+            return JsonResponse({
+                'error': f"{prediction_result.get('error', 'Datos inválidos')}: {details}",
+                'errors': errors
+            }, status=400)
+        return JsonResponse({'error': errors or prediction_result.get('error', 'Error en la predicción')}, status=400)
+
+    confidence_percentage = prediction_result.get('confidence_score', 0) * 100
+    return JsonResponse({
+        'success': True,
+        'predicted_crop': prediction_result.get('predicted_crop', ''),
+        'predicted_crop_spanish': prediction_result.get('predicted_crop_spanish', ''),
+        'confidence_percentage': confidence_percentage,
+        'confidence_level': get_confidence_level(confidence_percentage),
+        'model_version': prediction_result.get('model_version'),
+        'input_data': input_data,
+        'top_recommendations': prediction_result.get('top_recommendations', [])
+    })
+
+
 @csrf_exempt
 def crop_recommendation(request):
     if request.method != 'POST':
         return JsonResponse({'error': 'Método no permitido'}, status=405)
 
     try:
-        # Obtener datos del cuerpo de la petición
-        data = json.loads(request.body)
-
-        # Validar que todos los campos requeridos estén presentes
-        required_fields = ['N', 'P', 'K', 'temperature', 'humidity', 'ph', 'rainfall']
-        if not all(field in data for field in required_fields):
+        input_data = _parse_recommendation_input(request.body)
+        if input_data is None:
             return JsonResponse({'error': 'Faltan campos requeridos'}, status=400)
 
-        # Convertir los datos al formato esperado por el modelo
-        input_data = {
-            'N': float(data['N']),
-            'P': float(data['P']),
-            'K': float(data['K']),
-            'temperature': float(data['temperature']),
-            'humidity': float(data['humidity']),
-            'ph': float(data['ph']),
-            'rainfall': float(data['rainfall'])
-        }
-
         # Obtener la predicción del modelo
-        prediction_result = ml_service.predict_crop(input_data)
-
-        # Formatear la respuesta
-        response_data = {
-            'success': True,
-            'predicted_crop': prediction_result.get('crop', ''),
-            'predicted_crop_spanish': prediction_result.get('crop_spanish', ''),
-            'confidence_percentage': prediction_result.get('confidence', 0) * 100,
-            'confidence_level': get_confidence_level(prediction_result.get('confidence', 0) * 100),
-            'model_version': '1.0.0',  # Reemplaza con la versión real de tu modelo
-            'input_data': input_data,
-            'top_recommendations': prediction_result.get('top_recommendations', [])
-        }
-
-        return JsonResponse(response_data)
+        prediction_result = get_service().predict_crop(input_data)
+        return _recommendation_response(input_data, prediction_result)
+
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Formato JSON inválido'}, status=400)
+    except ValueError as e:
+        return JsonResponse({'error': f'Error en los datos: {str(e)}'}, status=400)
+    except Exception as e:
+        return JsonResponse({'error': f'Error interno del servidor: {str(e)}'}, status=500)
+
+
+@csrf_exempt
+async def crop_recommendation_async(request):
+    """Variante asíncrona (ASGI): la predicción corre en el pool de inferencia, no en el event loop"""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Método no permitido'}, status=405)
+
+    try:
+        input_data = _parse_recommendation_input(request.body)
+        if input_data is None:
+            return JsonResponse({'error': 'Faltan campos requeridos'}, status=400)
+
+        prediction_result = await get_inference_executor().predict_crop(input_data)
+        return _recommendation_response(input_data, prediction_result)
 
+    except InferenceRejected:
+        response = JsonResponse({'error': 'Servidor saturado, intenta de nuevo más tarde'}, status=429)
+        response['Retry-After'] = str(settings.ML_INFERENCE_POOL['RETRY_AFTER'])
+        return response
+    except InferenceTimeout:
+        return JsonResponse({'error': 'La predicción excedió el tiempo límite'}, status=504)
     except json.JSONDecodeError:
         return JsonResponse({'error': 'Formato JSON inválido'}, status=400)
     except ValueError as e:
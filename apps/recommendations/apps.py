@@ -4,3 +4,12 @@ from django.apps import AppConfig
 class RecommendationsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.recommendations'
+
+    def ready(self):
+        from django.conf import settings
+
+        # Precarga opcional del modelo (por ejemplo en el proceso maestro de gunicorn con --preload,
+        # para que los workers compartan las páginas copy-on-write); si no, se carga en el primer uso
+        if settings.ML_PRELOAD_MODEL:
+            from .services.registry import get_service
+            get_service()
@@ -0,0 +1,80 @@
+import json
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.recommendations.services.benchmark import SCENARIOS, compare_to_baseline, run_benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark de inferencia y carga: servicio, endpoints y servidores WSGI/ASGI en proceso, '
+        'con línea base en JSON para detectar regresiones'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS),
+                            help='Escenarios a ejecutar')
+        parser.add_argument('--samples', type=int, default=500, help='Filas del dataset por escenario')
+        parser.add_argument('--concurrency', type=int, default=8, help='Conexiones simultáneas de las pruebas de carga')
+        parser.add_argument('--warmup', type=int, default=20, help='Llamadas de calentamiento descartadas')
+        parser.add_argument('--save-baseline', nargs='?', const=settings.BENCHMARK_BASELINE_PATH, default=None,
+                            help='Guarda el resultado como línea base')
+        parser.add_argument('--check', nargs='?', const=settings.BENCHMARK_BASELINE_PATH, default=None,
+                            help='Compara con la línea base y falla si hay regresiones')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='Empeoramiento relativo permitido por métrica (0.25 = 25%%)')
+        parser.add_argument('--json', action='store_true', help='Imprime el resultado completo en JSON')
+
+    def handle(self, *args, **options):
+        result = run_benchmarks(
+            options['scenarios'], samples=options['samples'],
+            concurrency=options['concurrency'], warmup=options['warmup']
+        )
+
+        if options['json']:
+            self.stdout.write(json.dumps(result, indent=2))
+        else:
+            self.stdout.write(
+                f"{'escenario':20} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+                f"{'alloc KB':>9} {'RSS MB':>8} {'errores':>8}"
+            )
+            for name, metrics in result['scenarios'].items():
+                self.stdout.write(
+                    f"{name:20} {metrics['throughput_rps']:>9.1f} {metrics['p50_ms']:>9.3f} "
+                    f"{metrics['p95_ms']:>9.3f} {metrics['p99_ms']:>9.3f} "
+                    f"{metrics.get('alloc_peak_kb', float('nan')):>9.1f} {metrics['rss_mb'] or 0:>8.1f} "
+                    f"{metrics['errors']:>8}"
+                )
+
+            scenarios = result['scenarios']
+            if 'legacy_service' in scenarios and 'service' in scenarios:
+                speedup = scenarios['legacy_service']['mean_ms'] / scenarios['service']['mean_ms']
+                self.stdout.write(self.style.SUCCESS(f'Aceleración media respecto al camino anterior: {speedup:.2f}x'))
+
+        if options['save_baseline']:
+            os.makedirs(os.path.dirname(options['save_baseline']) or '.', exist_ok=True)
+            with open(options['save_baseline'], 'w') as baseline_file:
+                json.dump(result, baseline_file, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Línea base guardada en {options['save_baseline']}"))
+
+        if options['check']:
+            if not os.path.exists(options['check']):
+                raise CommandError(f"No existe la línea base {options['check']} (genérala con --save-baseline)")
+
+            with open(options['check']) as baseline_file:
+                baseline = json.load(baseline_file)
+
+            # Las latencias solo son comparables en la misma máquina; una línea base ajena se avisa
+            for key in ('python', 'cpu_count', 'model_version'):
+                if baseline.get(key) != result[key]:
+                    self.stderr.write(self.style.WARNING(
+                        f"La línea base se tomó con {key}={baseline.get(key)} y esta corrida tiene {result[key]}; "
+                        f"regenérala con --save-baseline en esta máquina para comparar"
+                    ))
+
+            regressions = compare_to_baseline(result, baseline, options['tolerance'])
+            if regressions:
+                raise CommandError('Regresiones de rendimiento:\n' + '\n'.join(regressions))
+            self.stdout.write(self.style.SUCCESS('Sin regresiones respecto a la línea base'))
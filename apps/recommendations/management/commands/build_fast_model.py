@@ -0,0 +1,122 @@
+import json
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from joblib import dump, load
+
+from apps.recommendations.services.fast_model import (
+    DEFAULT_CCP_ALPHAS, DEFAULT_DEPTHS, DEFAULT_TREES, build_candidate, candidate_specs, evaluate
+)
+from apps.recommendations.services.ml_service import FEATURE_COLUMNS
+from apps.recommendations.services.reference_dataset import load_reference_dataset
+
+
+class Command(BaseCommand):
+    help = (
+        'Genera variantes reducidas del modelo (menos árboles, profundidad limitada, poda ccp), compara su '
+        'exactitud y latencia p99 con el modelo actual y guarda la elegida para ML_MODEL_VARIANT="fast"'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--trees', type=int, nargs='+', default=list(DEFAULT_TREES), help='Árboles por variante')
+        parser.add_argument('--depths', type=int, nargs='*', default=list(DEFAULT_DEPTHS),
+                            help='Profundidades máximas de las variantes reentrenadas')
+        parser.add_argument('--ccp-alphas', type=float, nargs='*', default=list(DEFAULT_CCP_ALPHAS),
+                            help='Valores de ccp_alpha (poda por complejidad de costo) de las variantes reentrenadas')
+        parser.add_argument('--holdout', type=float, default=0.2,
+                            help='Fracción del dataset reservada para evaluar las variantes reentrenadas')
+        parser.add_argument('--latency-samples', type=int, default=300, help='Predicciones por variante para la latencia')
+        parser.add_argument('--no-compiled', action='store_true', help='No medir la latencia con el backend compilado')
+        parser.add_argument('--save', default=None, metavar='VARIANTE',
+                            help='Variante a guardar; "auto" elige la de menor p99 con coincidencia >= --min-agreement')
+        parser.add_argument('--min-agreement', type=float, default=0.99,
+                            help='Coincidencia mínima con el modelo actual para la elección automática')
+        parser.add_argument('--output', default=settings.ML_FAST_MODEL_PATH, help='Archivo de la variante guardada')
+        parser.add_argument('--json', action='store_true', help='Imprime el reporte completo en JSON')
+
+    def handle(self, *args, **options):
+        from sklearn.model_selection import train_test_split
+
+        model = load(settings.MODEL_PATH)
+        label_encoder = load(settings.ENCODER_PATH)
+
+        dataset = load_reference_dataset()
+        frame = dataset.to_frame()
+        features = frame[FEATURE_COLUMNS]
+        labels = label_encoder.transform(frame[dataset.label_column].astype(str))
+        train_features, holdout_features, train_labels, holdout_labels = train_test_split(
+            features, labels, test_size=options['holdout'], stratify=labels, random_state=0
+        )
+        all_features = features.to_numpy()
+        latency_rows = all_features[:options['latency_samples']]
+
+        specs = candidate_specs(model, options['trees'], options['depths'], options['ccp_alphas'])
+        report = []
+        for spec in specs:
+            start = time.perf_counter()
+            # Las variantes reentrenadas se evalúan entrenadas sin la partición reservada
+            candidate = build_candidate(model, spec, train_features, train_labels)
+            build_seconds = time.perf_counter() - start
+            holdout = (holdout_features.to_numpy(), holdout_labels) if spec['kind'] == 'retrained' else None
+            metrics = evaluate(
+                candidate, model, all_features, labels, latency_rows,
+                holdout=holdout, compiled=not options['no_compiled']
+            )
+            report.append({**spec, **metrics, 'build_seconds': round(build_seconds, 2)})
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            self._print_report(report, compiled=not options['no_compiled'])
+
+        if options['save']:
+            self._save(options, model, specs, report, features, labels)
+
+    def _print_report(self, report, compiled: bool):
+        header = (
+            f"{'variante':22} {'árboles':>7} {'nodos':>7} {'prof':>4} {'KB':>8} {'exactitud':>9} "
+            f"{'reservada':>9} {'coincide':>8} {'p50 ms':>7} {'p99 ms':>7}"
+        )
+        if compiled:
+            header += f" {'p99 comp':>8}"
+        self.stdout.write(header)
+        for entry in report:
+            holdout = f"{entry['holdout_accuracy']:.2%}" if entry['holdout_accuracy'] is not None else '—'
+            line = (
+                f"{entry['name']:22} {entry['trees']:>7} {entry['nodes']:>7} {entry['max_depth']:>4} "
+                f"{entry['size_kb']:>8.1f} {entry['accuracy']:>9.2%} {holdout:>9} {entry['agreement']:>8.2%} "
+                f"{entry['p50_ms']:>7.3f} {entry['p99_ms']:>7.3f}"
+            )
+            if compiled:
+                line += f" {entry['compiled_p99_ms']:>8.3f}"
+            self.stdout.write(line)
+        self.stdout.write(
+            'exactitud: sobre todo el CSV; reservada: partición no usada al reentrenar '
+            '(el modelo actual y sus subconjuntos pudieron ver esas filas); coincide: misma clase que el modelo actual'
+        )
+
+    def _save(self, options, model, specs, report, features, labels):
+        if options['save'] == 'auto':
+            eligible = [
+                entry for entry in report
+                if entry['kind'] != 'current' and entry['agreement'] >= options['min_agreement']
+            ]
+            if not eligible:
+                raise CommandError(f"Ninguna variante coincide en al menos {options['min_agreement']:.0%} con el modelo actual")
+            name = min(eligible, key=lambda entry: entry['p99_ms'])['name']
+        else:
+            name = options['save']
+
+        spec = next((spec for spec in specs if spec['name'] == name), None)
+        if spec is None:
+            raise CommandError(f"Variante desconocida: {name}. Disponibles: {', '.join(s['name'] for s in specs)}")
+
+        # La variante guardada se reentrena con el dataset completo
+        candidate = build_candidate(model, spec, features, labels)
+        os.makedirs(os.path.dirname(options['output']) or '.', exist_ok=True)
+        dump(candidate, options['output'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Variante {name} guardada en {options['output']}; actívala con ML_MODEL_VARIANT = 'fast'"
+        ))
@@ -0,0 +1,92 @@
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.recommendations.services.ml_service import FEATURE_COLUMNS, INPUT_RANGES, CropRecommendationService
+from apps.recommendations.services.prediction_grid import PredictionGrid, build_grid
+from apps.recommendations.services.reference_dataset import load_reference_dataset
+from apps.recommendations.services.registry import serving_model_path
+
+
+class Command(BaseCommand):
+    help = 'Precalcula la malla de probabilidades del modo malla (ML_GRID) y reporta su cobertura sobre el dataset'
+
+    def add_arguments(self, parser):
+        grid_settings = settings.ML_GRID
+        parser.add_argument('--output', default=grid_settings['DIR'], help='Carpeta de salida')
+        parser.add_argument('--points', type=int, default=None,
+                            help='Vértices por eje (por defecto ML_GRID["POINTS"])')
+        parser.add_argument('--max-error', type=float, default=grid_settings['MAX_ERROR'],
+                            help='Error máximo de probabilidad, medido contra el modelo, en una celda confiable')
+        parser.add_argument('--samples', type=int, default=grid_settings.get('SAMPLES_PER_CELL', 4),
+                            help='Puntos interiores por celda comparados con el modelo')
+
+    def handle(self, *args, **options):
+        service = CropRecommendationService(
+            serving_model_path(), settings.ENCODER_PATH,
+            backend=settings.ML_BACKEND, compiled_dir=settings.ML_COMPILED_MODEL_DIR
+        )
+        slot = service._slot
+        if slot is None:
+            raise CommandError('Modelo ML no disponible')
+
+        points = options['points'] or settings.ML_GRID['POINTS']
+        ranges = {feature: INPUT_RANGES[feature] for feature in FEATURE_COLUMNS}
+
+        def predict_proba(vertices: np.ndarray) -> np.ndarray:
+            if slot.use_dataframe_input:
+                vertices = pd.DataFrame(vertices, columns=FEATURE_COLUMNS)
+            return slot.inference_model.predict_proba(vertices)
+
+        # Las filas válidas del dataset también se usan para descartar celdas con error mayor al permitido
+        rows = load_reference_dataset().to_frame()[FEATURE_COLUMNS].to_dict('records')
+        rows = [row for row in rows if service._validate_input_data(row)['valid']]
+        validation_points = service._prepare_batch_input(slot, rows)
+        validation_points = np.asarray(validation_points, dtype=np.float64)
+
+        interpolate = settings.ML_GRID.get('INTERPOLATE', True)
+        start = time.perf_counter()
+        try:
+            meta = build_grid(
+                predict_proba, options['output'], ranges, points, len(slot.class_names), options['max_error'],
+                slot.version, interpolate=interpolate, samples_per_cell=options['samples'],
+                validation_points=validation_points
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+        build_seconds = time.perf_counter() - start
+
+        size_mb = sum(
+            os.path.getsize(os.path.join(options['output'], name)) for name in os.listdir(options['output'])
+        ) / 2**20
+        self.stdout.write(
+            f"Malla en {options['output']}: {meta['axes']['N'][2]} vértices por eje, {size_mb:.1f} MB, "
+            f"{meta['reliable_fraction']:.1%} de celdas confiables de {meta['candidate_fraction']:.1%} candidatas "
+            f"(error medido hasta {meta['measured_max_error']:.4f}, {build_seconds:.1f} s)"
+        )
+
+        # Cobertura y error contra el modelo sobre las filas válidas del dataset
+        grid = PredictionGrid(options['output'], interpolate=interpolate)
+        expected = slot.inference_model.predict_proba(service._prepare_batch_input(slot, rows))
+
+        errors, agreements = [], []
+        for row, probabilities in zip(rows, expected):
+            looked_up = grid.lookup(row)
+            if looked_up is not None:
+                errors.append(np.abs(looked_up - probabilities).max())
+                agreements.append(np.argmax(looked_up) == np.argmax(probabilities))
+
+        self.stdout.write(f"Filas del dataset resueltas por la malla: {grid.hits}/{len(rows)}")
+        if errors:
+            self.stdout.write(
+                f"Error máximo de probabilidad {max(errors):.4f}, "
+                f"misma clase que el modelo en {np.mean(agreements):.2%}"
+            )
+        if grid.hits < len(rows) / 2:
+            self.stdout.write(self.style.WARNING(
+                'La mayoría de las consultas irá al modelo; aumenta --points o --max-error'
+            ))
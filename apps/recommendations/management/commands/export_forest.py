@@ -0,0 +1,76 @@
+import copy
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from joblib import load
+
+from apps.recommendations.services.compiled_forest import CompiledForest, export_forest
+from apps.recommendations.services.ml_service import FEATURE_COLUMNS, _artifact_version
+from apps.recommendations.services.reference_dataset import load_reference_dataset
+from apps.recommendations.services.registry import serving_model_path
+
+# Diferencia máxima aceptada contra predict_proba de sklearn
+TOLERANCE = 1e-12
+
+
+def _mean_latency_ms(predict_proba, row: np.ndarray, repeats: int = 200) -> float:
+    for _ in range(10):
+        predict_proba(row)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        predict_proba(row)
+    return (time.perf_counter() - start) * 1000 / repeats
+
+
+class Command(BaseCommand):
+    help = (
+        'Exporta el bosque en servicio (MODEL_PATH o la variante de ML_MODEL_VARIANT) a arreglos .npy '
+        'para el backend compilado y lo verifica contra sklearn'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=settings.ML_COMPILED_MODEL_DIR, help='Carpeta de salida')
+        parser.add_argument('--skip-check', action='store_true', help='No comparar las probabilidades con sklearn')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        model_path = serving_model_path()
+        model = load(model_path)
+        sklearn_load_ms = (time.perf_counter() - start) * 1000
+
+        meta = export_forest(model, options['output'], FEATURE_COLUMNS, _artifact_version([model_path]))
+        self.stdout.write(
+            f"Bosque exportado en {options['output']}: {meta['n_trees']} árboles, "
+            f"{meta['n_nodes']} nodos, profundidad máxima {meta['max_depth']}"
+        )
+
+        start = time.perf_counter()
+        forest = CompiledForest(options['output'], mmap_mode='r')
+        compiled_load_ms = (time.perf_counter() - start) * 1000
+
+        if options['skip_check']:
+            return
+
+        # Mismo camino que el servicio: arreglo NumPy sin nombres de columnas
+        sklearn_model = copy.copy(model)
+        if hasattr(sklearn_model, 'feature_names_in_'):
+            del sklearn_model.feature_names_in_
+
+        features = load_reference_dataset().features(FEATURE_COLUMNS)
+        expected = sklearn_model.predict_proba(features)
+        actual = forest.predict_proba(features)
+        max_diff = float(np.abs(expected - actual).max())
+
+        self.stdout.write(f"Diferencia máxima con sklearn en {len(features)} filas: {max_diff:.3e}")
+        if max_diff > TOLERANCE:
+            raise CommandError(f"El bosque compilado difiere de sklearn en {max_diff:.3e} (> {TOLERANCE})")
+
+        row = features[:1]
+        sklearn_ms = _mean_latency_ms(sklearn_model.predict_proba, row)
+        compiled_ms = _mean_latency_ms(forest.predict_proba, row)
+        self.stdout.write(f"{'':10} {'carga':>10} {'1 muestra':>12}")
+        self.stdout.write(f"{'sklearn':10} {sklearn_load_ms:>8.1f}ms {sklearn_ms:>10.3f}ms")
+        self.stdout.write(f"{'compilado':10} {compiled_load_ms:>8.1f}ms {compiled_ms:>10.3f}ms")
+        self.stdout.write(self.style.SUCCESS(f"Speedup por llamada: {sklearn_ms / compiled_ms:.1f}x"))
@@ -0,0 +1,78 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.recommendations.services.bulk_scoring import model_summary, score_file
+from apps.recommendations.services.ml_service import CropRecommendationService
+from apps.recommendations.services.registry import serving_model_path
+
+
+class Command(BaseCommand):
+    help = 'Puntúa un archivo CSV o Parquet de muestras de sensores por bloques y escribe el top-k de cultivos por fila'
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', help='Archivo CSV o Parquet con las columnas N, P, K, temperature, humidity, ph, rainfall')
+        parser.add_argument('output', help='Archivo de salida (.csv o .parquet)')
+        parser.add_argument('--chunk-size', type=int, default=100_000, help='Filas por bloque')
+        parser.add_argument('--top-k', type=int, default=3, help='Cultivos a incluir por fila')
+        parser.add_argument('--keep', nargs='*', default=[], metavar='COLUMNA',
+                            help='Columnas de entrada que se copian a la salida (por ejemplo un id de parcela)')
+        parser.add_argument('--recommendations', action='store_true',
+                            help='Agrega textos agronómicos y advertencias del cultivo predicho')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Procesos para puntuar (0 = uno por núcleo)')
+        parser.add_argument('--input-format', choices=('csv', 'parquet'), default=None,
+                            help='Formato de entrada (por defecto según la extensión)')
+        parser.add_argument('--output-format', choices=('csv', 'parquet'), default=None,
+                            help='Formato de salida (por defecto según la extensión)')
+
+    def handle(self, *args, **options):
+        if not os.path.exists(options['input']):
+            raise CommandError(f"No existe el archivo {options['input']}")
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size debe ser mayor que cero')
+
+        workers = options['workers'] or os.cpu_count() or 1
+        if workers > 1:
+            # Cada worker carga su propio servicio; aquí basta la versión del modelo para el resumen
+            service = None
+            try:
+                model_version = model_summary(serving_model_path(), settings.ENCODER_PATH)['model_version']
+            except (OSError, ValueError) as e:
+                raise CommandError(f'Modelo ML no disponible: {e}')
+        else:
+            service = CropRecommendationService(
+                serving_model_path(), settings.ENCODER_PATH,
+                use_dataframe_input=settings.ML_DATAFRAME_INPUT,
+                backend=settings.ML_BACKEND, compiled_dir=settings.ML_COMPILED_MODEL_DIR
+            )
+            if not service.is_model_available():
+                raise CommandError('Modelo ML no disponible')
+            model_version = service.model_version
+
+        start = time.perf_counter()
+
+        def progress(rows: int):
+            elapsed = time.perf_counter() - start
+            self.stderr.write(f"\r{rows:,} filas ({rows / elapsed:,.0f} filas/s)", ending='')
+
+        try:
+            summary = score_file(
+                service, options['input'], options['output'],
+                chunk_size=options['chunk_size'], top_k=options['top_k'], keep_columns=options['keep'],
+                workers=workers, input_format=options['input_format'], output_format=options['output_format'],
+                recommendations=options['recommendations'], progress=progress if options['verbosity'] >= 1 else None
+            )
+        except (ValueError, ImportError) as e:
+            raise CommandError(str(e))
+
+        elapsed = time.perf_counter() - start
+        if options['verbosity'] >= 1:
+            self.stderr.write('')
+        self.stdout.write(self.style.SUCCESS(
+            f"{summary['rows']:,} filas puntuadas en {elapsed:.1f} s ({summary['rows'] / elapsed:,.0f} filas/s, "
+            f"{workers} proceso(s), modelo {model_version}); "
+            f"{summary['invalid']:,} filas inválidas. Resultados en {options['output']}"
+        ))
@@ -0,0 +1,47 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.recommendations.services.startup import STARTUP_TARGETS, check_budget, profile_startup
+
+
+class Command(BaseCommand):
+    help = (
+        'Perfil de arranque en frío de los workers (python -X importtime): tiempo de importación, '
+        'memoria residente y módulos más costosos de core.wsgi / core.asgi'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--targets', nargs='+', default=list(STARTUP_TARGETS), help='Puntos de entrada a medir')
+        parser.add_argument('--top', type=int, default=15, help='Módulos más costosos a mostrar')
+        parser.add_argument('--check', action='store_true',
+                            help='Falla si se excede settings.STARTUP_BUDGET o se cargan dependencias pesadas')
+        parser.add_argument('--json', action='store_true', help='Imprime el resultado completo en JSON')
+
+    def handle(self, *args, **options):
+        reports = []
+        for target in options['targets']:
+            try:
+                reports.append(profile_startup(target, top=options['top']))
+            except RuntimeError as e:
+                raise CommandError(str(e))
+
+        if options['json']:
+            self.stdout.write(json.dumps(reports, indent=2))
+        else:
+            for report in reports:
+                self.stdout.write(self.style.MIGRATE_HEADING(
+                    f"{report['target']}: {report['elapsed_ms']:.1f} ms, {report['rss_mb']} MB residentes"
+                ))
+                heavy = ', '.join(report['heavy_modules']) or 'ninguna'
+                self.stdout.write(f"  Dependencias pesadas cargadas: {heavy}")
+                self.stdout.write(f"  {'módulo':50} {'acumulado ms':>13} {'propio ms':>10}")
+                for entry in report['slowest']:
+                    self.stdout.write(f"  {entry['name']:50} {entry['cumulative_ms']:>13.1f} {entry['self_ms']:>10.1f}")
+
+        if options['check']:
+            problems = [problem for report in reports for problem in check_budget(report, settings.STARTUP_BUDGET)]
+            if problems:
+                raise CommandError('Presupuesto de arranque excedido:\n' + '\n'.join(problems))
+            self.stdout.write(self.style.SUCCESS('Arranque dentro del presupuesto'))
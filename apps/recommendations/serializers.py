@@ -1,11 +1,33 @@
+import math
+
+from django.conf import settings
 from rest_framework import serializers
 
+from .services.features import FEATURES
+
+
+class FeatureField(serializers.FloatField):
+    """FloatField que además rechaza booleanos, NaN e infinitos (mismas reglas que fast_json.validate_input)"""
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail('invalid')
+        value = super().to_internal_value(data)
+        if not math.isfinite(value):
+            self.fail('invalid')
+        return value
+
 
 class CropInputSerializer(serializers.Serializer):
-    N = serializers.FloatField(min_value=0, max_value=140)
-    P = serializers.FloatField(min_value=5, max_value=145)
-    K = serializers.FloatField(min_value=5, max_value=205)
-    temperature = serializers.FloatField(min_value=8, max_value=44)
-    humidity = serializers.FloatField(min_value=14, max_value=100)
-    ph = serializers.FloatField(min_value=3.5, max_value=10)
-    rainfall = serializers.FloatField(min_value=0, max_value=300)
+    # Los campos salen de la tabla de rangos compartida con el formulario y el servicio
+    def get_fields(self):
+        return {
+            feature.name: FeatureField(min_value=feature.min_value, max_value=feature.max_value)
+            for feature in FEATURES
+        }
+
+
+class CropBatchInputSerializer(serializers.Serializer):
+    # Las muestras se validan fila por fila en el servicio (con las reglas de CropInputSerializer)
+    # para no hacer fallar el lote completo
+    samples = serializers.ListField(allow_empty=False, max_length=settings.ML_MAX_BATCH_SIZE)
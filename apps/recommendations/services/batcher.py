@@ -0,0 +1,108 @@
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger('predictions')
+
+
+class PredictionBatcher:
+    """
+    Agrupa predicciones concurrentes de una muestra en una sola llamada a predict_proba
+
+    Cada llamada encola su muestra y espera su fila; un hilo dedicado junta las que
+    lleguen durante max_wait_ms (o hasta max_batch) y recorre el bosque una vez con la
+    matriz completa. La latencia extra de una petición está acotada por max_wait_ms.
+
+    Args:
+        service (CropRecommendationService): Servicio que prepara la entrada del modelo
+        max_batch (int): Muestras máximas por llamada a predict_proba
+        max_wait_ms (float): Milisegundos máximos que se espera a más muestras
+    """
+
+    def __init__(self, service, max_batch: int = 64, max_wait_ms: float = 2.0):
+        self._service = service
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+
+        self._queue = queue.SimpleQueue()
+        self._worker: Optional[threading.Thread] = None
+        self._worker_pid = None
+        self._worker_lock = threading.Lock()
+
+        self.batches = 0
+        self.samples = 0
+
+    def predict_proba(self, slot, data_received: Dict) -> np.ndarray:
+        """Devuelve las probabilidades de una muestra ya validada, calculadas dentro de un lote"""
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((slot, data_received, future))
+        return future.result()
+
+    def _ensure_worker(self):
+        # El hilo se (re)inicia en cada proceso: los hilos no sobreviven al fork de los workers
+        if self._worker is not None and self._worker_pid == os.getpid():
+            return
+
+        with self._worker_lock:
+            if self._worker is not None and self._worker_pid == os.getpid():
+                return
+            self._queue = queue.SimpleQueue()
+            self._worker_pid = os.getpid()
+            self._worker = threading.Thread(target=self._run, name='prediction-batcher', daemon=True)
+            self._worker.start()
+
+    def _run(self):
+        pending = self._queue
+        while True:
+            batch = [pending.get()]
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(pending.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            self._process(batch)
+
+    def _process(self, batch: List[tuple]):
+        # Durante una recarga pueden convivir dos versiones; cada una se predice por separado
+        groups: Dict[int, List[tuple]] = {}
+        for item in batch:
+            groups.setdefault(id(item[0]), []).append(item)
+
+        for items in groups.values():
+            slot = items[0][0]
+            try:
+                model_input = self._service._prepare_batch_input(slot, [data for _, data, _ in items])
+                probabilities = slot.inference_model.predict_proba(model_input)
+            except Exception as e:
+                logger.error(f"Error en lote de predicción: {e}")
+                for _, _, future in items:
+                    future.set_exception(e)
+                continue
+
+            for (_, _, future), row in zip(items, probabilities):
+                future.set_result(row)
+
+        self.batches += 1
+        self.samples += len(batch)
+
+    def stats(self) -> Dict:
+        """Lotes procesados y tamaño promedio de lote en este proceso"""
+        return {
+            'max_batch': self.max_batch,
+            'max_wait_ms': self.max_wait * 1000,
+            'batches': self.batches,
+            'samples': self.samples,
+            'mean_batch_size': round(self.samples / self.batches, 2) if self.batches else 0.0
+        }
@@ -0,0 +1,363 @@
+import asyncio
+import io
+import json
+import os
+import platform
+import sys
+import threading
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+from django.core.cache import cache
+from django.db import transaction
+from django.test import Client
+
+from .ml_service import FEATURE_COLUMNS, INPUT_RANGES
+from .reference_dataset import load_reference_dataset
+from .registry import _current_rss_bytes, get_service
+
+RECOMMEND_PATH = '/api/recommendations/recommend/'
+RECOMMEND_ASYNC_PATH = '/api/recommendations/recommend/async/'
+ARDUINO_PATH = '/receive_arduino_data/'
+
+# Dispositivo usado por el escenario de ingesta; sus lecturas se descartan al terminar
+BENCHMARK_DEVICE_ID = 'benchmark'
+
+# Métricas comparadas contra la línea base y si un valor mayor es peor
+REGRESSION_METRICS = {
+    'p50_ms': True,
+    'p95_ms': True,
+    'p99_ms': True,
+    'throughput_rps': False,
+    'alloc_peak_kb': True,
+}
+
+SCENARIOS = ('legacy_service', 'service', 'recommend_endpoint', 'arduino_endpoint', 'wsgi_load', 'asgi_load')
+
+
+def load_rows(limit: Optional[int] = None) -> List[Dict]:
+    """Filas del dataset de referencia dentro de los rangos válidos, en orden aleatorio fijo"""
+    data = load_reference_dataset().to_frame()[FEATURE_COLUMNS]
+    for feature, (min_val, max_val, _) in INPUT_RANGES.items():
+        data = data[data[feature].between(min_val, max_val)]
+
+    data = data.sample(frac=1, random_state=0)
+    if limit is not None:
+        data = data.head(limit)
+    return data.to_dict('records')
+
+
+def summarize(latencies: List[float], elapsed: float, errors: int) -> Dict:
+    """Resume latencias (segundos) en throughput y percentiles en milisegundos"""
+    timings = np.array(latencies) * 1000
+    return {
+        'requests': len(timings),
+        'errors': errors,
+        'throughput_rps': round(len(timings) / elapsed, 1) if elapsed else 0.0,
+        'mean_ms': round(float(timings.mean()), 3),
+        'p50_ms': round(float(np.percentile(timings, 50)), 3),
+        'p95_ms': round(float(np.percentile(timings, 95)), 3),
+        'p99_ms': round(float(np.percentile(timings, 99)), 3),
+    }
+
+
+def _run_sequential(call: Callable[[Dict], bool], rows: List[Dict], warmup: int) -> Dict:
+    for row in rows[:warmup]:
+        call(row)
+
+    latencies, errors = [], 0
+    start = time.perf_counter()
+    for row in rows:
+        call_start = time.perf_counter()
+        if not call(row):
+            errors += 1
+        latencies.append(time.perf_counter() - call_start)
+    elapsed = time.perf_counter() - start
+
+    metrics = summarize(latencies, elapsed, errors)
+    metrics.update(_measure_allocations(call, rows[:max(1, min(len(rows), 50))]))
+    return metrics
+
+
+def _measure_allocations(call: Callable[[Dict], bool], rows: List[Dict]) -> Dict:
+    """Pico de memoria asignada por Python durante las llamadas (pasada aparte: tracemalloc es lento)"""
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        for row in rows:
+            call(row)
+        after, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'alloc_peak_kb': round((peak - before) / 1024, 1),
+        'alloc_retained_kb': round((after - before) / 1024, 1),
+    }
+
+
+def _legacy_predict(service, data_received: Dict) -> Dict:
+    """Reproduce el camino de inferencia anterior (DataFrame, predict + predict_proba e inverse_transform por clase)"""
+    import pandas as pd
+
+    service._validate_input_data(data_received)
+    input_df = pd.DataFrame([[data_received[column] for column in FEATURE_COLUMNS]], columns=FEATURE_COLUMNS)
+
+    prediction = service.model.predict(input_df)[0]
+    probabilities = service.model.predict_proba(input_df)[0]
+    crop_name = service.label_encoder.inverse_transform([prediction])[0]
+
+    top_recommendations = []
+    for idx in np.argsort(probabilities)[::-1][:3]:
+        top_recommendations.append(service.label_encoder.inverse_transform([idx])[0])
+
+    all_probabilities = {}
+    for i, prob in enumerate(probabilities):
+        all_probabilities[service.label_encoder.inverse_transform([i])[0]] = float(prob)
+
+    return {'predicted_crop': crop_name, 'top': top_recommendations, 'all_probabilities': all_probabilities}
+
+
+def bench_legacy_service(rows: List[Dict], warmup: int = 20, **kwargs) -> Dict:
+    """Camino de inferencia anterior, como referencia de la aceleración de 'service'"""
+    service = get_service()
+    return _run_sequential(lambda row: bool(_legacy_predict(service, row)['predicted_crop']), rows, warmup)
+
+
+def bench_service(rows: List[Dict], warmup: int = 20, **kwargs) -> Dict:
+    """predict_crop llamado directamente"""
+    service = get_service()
+    return _run_sequential(lambda row: service.predict_crop(row)['success'], rows, warmup)
+
+
+def bench_recommend_endpoint(rows: List[Dict], warmup: int = 20, **kwargs) -> Dict:
+    """recommend/ a través del cliente de pruebas de Django (middleware, DRF y serializer incluidos)"""
+    client = Client()
+
+    def call(row: Dict) -> bool:
+        response = client.post(RECOMMEND_PATH, json.dumps(row), content_type='application/json')
+        return response.status_code == 200
+
+    return _run_sequential(call, rows, warmup)
+
+
+def bench_arduino_endpoint(rows: List[Dict], warmup: int = 20, **kwargs) -> Dict:
+    """receive_arduino_data/ a través del cliente de pruebas; las lecturas se revierten al terminar"""
+    client = Client()
+
+    def call(row: Dict) -> bool:
+        payload = {'device_id': BENCHMARK_DEVICE_ID, **row}
+        response = client.post(ARDUINO_PATH, json.dumps(payload), content_type='application/json')
+        return response.status_code == 200
+
+    from ...cultivai.services.ingestion import LAST_DEVICE_CACHE_KEY, LATEST_CACHE_PREFIX
+    from ...cultivai.services.rescoring import RECOMMENDATION_CACHE_PREFIX
+
+    with transaction.atomic():
+        metrics = _run_sequential(call, rows, warmup)
+        transaction.set_rollback(True)
+
+    # La proyección y la recomendación en caché tampoco deben mostrar el dispositivo de prueba
+    cache.delete_many([LATEST_CACHE_PREFIX + BENCHMARK_DEVICE_ID, RECOMMENDATION_CACHE_PREFIX + BENCHMARK_DEVICE_ID])
+    last_device = cache.get(LAST_DEVICE_CACHE_KEY)
+    if last_device is not None and last_device[0] == BENCHMARK_DEVICE_ID:
+        cache.delete(LAST_DEVICE_CACHE_KEY)
+    return metrics
+
+
+def _wsgi_environ(path: str, body: bytes) -> Dict:
+    return {
+        'REQUEST_METHOD': 'POST',
+        'SCRIPT_NAME': '',
+        'PATH_INFO': path,
+        'QUERY_STRING': '',
+        'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'HTTP_HOST': 'localhost',
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+
+
+def bench_wsgi_load(rows: List[Dict], concurrency: int = 8, path: str = RECOMMEND_PATH, **kwargs) -> Dict:
+    """Carga concurrente sobre core.wsgi.application con un hilo por conexión simultánea"""
+    from core.wsgi import application
+
+    bodies = [json.dumps(row).encode() for row in rows]
+    latencies, errors = [], []
+    lock = threading.Lock()
+
+    def worker(chunk: List[bytes]):
+        local_latencies, local_errors = [], 0
+        for body in chunk:
+            status_holder = []
+            start = time.perf_counter()
+            response = application(_wsgi_environ(path, body), lambda status, headers: status_holder.append(status))
+            for _ in response:
+                pass
+            response.close()
+            local_latencies.append(time.perf_counter() - start)
+            if not status_holder or not status_holder[0].startswith('200'):
+                local_errors += 1
+        with lock:
+            latencies.extend(local_latencies)
+            errors.append(local_errors)
+
+    threads = [threading.Thread(target=worker, args=(bodies[i::concurrency],)) for i in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    return {**summarize(latencies, elapsed, sum(errors)), 'concurrency': concurrency}
+
+
+async def _asgi_request(application, path: str, body: bytes) -> int:
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'POST',
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'query_string': b'',
+        'root_path': '',
+        'headers': [
+            (b'host', b'localhost'),
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode()),
+        ],
+        'client': ('127.0.0.1', 0),
+        'server': ('localhost', 80),
+    }
+    finished = asyncio.Event()
+    sent_body = False
+    status = []
+
+    async def receive():
+        nonlocal sent_body
+        if not sent_body:
+            sent_body = True
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+        # El cliente se desconecta solo después de recibir la respuesta completa
+        await finished.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            status.append(message['status'])
+        elif message['type'] == 'http.response.body' and not message.get('more_body', False):
+            finished.set()
+
+    await application(scope, receive, send)
+    return status[0] if status else 500
+
+
+def bench_asgi_load(rows: List[Dict], concurrency: int = 8, path: str = RECOMMEND_ASYNC_PATH, **kwargs) -> Dict:
+    """Carga concurrente sobre core.asgi.application con una corrutina por conexión simultánea"""
+    from core.asgi import application
+
+    bodies = [json.dumps(row).encode() for row in rows]
+    latencies, errors = [], 0
+
+    async def worker(chunk: List[bytes]):
+        nonlocal errors
+        for body in chunk:
+            start = time.perf_counter()
+            status = await _asgi_request(application, path, body)
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                errors += 1
+
+    async def run():
+        await asyncio.gather(*(worker(bodies[i::concurrency]) for i in range(concurrency)))
+
+    start = time.perf_counter()
+    asyncio.run(run())
+    elapsed = time.perf_counter() - start
+
+    return {**summarize(latencies, elapsed, errors), 'concurrency': concurrency}
+
+
+BENCHMARKS = {
+    'legacy_service': bench_legacy_service,
+    'service': bench_service,
+    'recommend_endpoint': bench_recommend_endpoint,
+    'arduino_endpoint': bench_arduino_endpoint,
+    'wsgi_load': bench_wsgi_load,
+    'asgi_load': bench_asgi_load,
+}
+
+
+def run_benchmarks(scenarios: List[str] = SCENARIOS, samples: int = 500, concurrency: int = 8,
+                   warmup: int = 20) -> Dict:
+    """
+    Ejecuta los escenarios indicados sobre filas del dataset de referencia
+
+    Returns:
+        dict: Entorno de la corrida y, por escenario, throughput, percentiles de latencia,
+        asignaciones de memoria y memoria residente del proceso al terminar
+    """
+    rows = load_rows(samples)
+    results = {}
+    for name in scenarios:
+        metrics = BENCHMARKS[name](rows, warmup=warmup, concurrency=concurrency)
+        rss = _current_rss_bytes()
+        metrics['rss_mb'] = round(rss / 2**20, 1) if rss is not None else None
+        results[name] = metrics
+
+    return {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'model_version': get_service().model_version,
+        'samples': len(rows),
+        'scenarios': results,
+    }
+
+
+def compare_to_baseline(current: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """
+    Compara una corrida con la línea base guardada
+
+    Args:
+        current (dict): Resultado de run_benchmarks
+        baseline (dict): Línea base guardada (mismo formato)
+        tolerance (float): Empeoramiento relativo permitido (0.25 = 25 %)
+
+    Returns:
+        list: Descripción de cada regresión encontrada (vacía si no hay)
+    """
+    regressions = []
+    for scenario, metrics in current['scenarios'].items():
+        reference = baseline.get('scenarios', {}).get(scenario)
+        if reference is None:
+            continue
+
+        if metrics.get('errors') and not reference.get('errors'):
+            regressions.append(f"{scenario}: {metrics['errors']} peticiones con error")
+
+        for metric, higher_is_worse in REGRESSION_METRICS.items():
+            value, base = metrics.get(metric), reference.get(metric)
+            if value is None or not base:
+                continue
+
+            change = (value - base) / base if higher_is_worse else (base - value) / base
+            if change > tolerance:
+                regressions.append(f"{scenario}.{metric}: {value} vs {base} en la línea base ({change:+.0%})")
+
+    return regressions
@@ -0,0 +1,264 @@
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from .executor import _init_process_worker
+from .ml_service import FEATURE_COLUMNS, INPUT_RANGES, CropRecommendationService, _artifact_version
+
+PARQUET_EXTENSIONS = ('.parquet', '.pq')
+
+_MIN_VALUES = np.array([INPUT_RANGES[column][0] for column in FEATURE_COLUMNS], dtype=np.float64)
+_MAX_VALUES = np.array([INPUT_RANGES[column][1] for column in FEATURE_COLUMNS], dtype=np.float64)
+
+
+def file_format(path: str, explicit: Optional[str] = None) -> str:
+    """'csv' o 'parquet' según el formato indicado o la extensión del archivo"""
+    if explicit:
+        return explicit
+    return 'parquet' if path.lower().endswith(PARQUET_EXTENSIONS) else 'csv'
+
+
+def _import_pyarrow():
+    # pyarrow es opcional: solo se necesita para leer o escribir Parquet
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError('Para archivos Parquet instala pyarrow (pip install pyarrow)')
+    return pyarrow
+
+
+def iter_chunks(path: str, chunk_size: int, columns: List[str], fmt: Optional[str] = None) -> Iterator[pd.DataFrame]:
+    """
+    Lee el archivo por bloques de chunk_size filas (memoria constante)
+
+    Raises:
+        ValueError: Si faltan columnas en el archivo
+    """
+    if file_format(path, fmt) == 'parquet':
+        pyarrow = _import_pyarrow()
+        parquet_file = pyarrow.parquet.ParquetFile(path)
+        missing = [column for column in columns if column not in parquet_file.schema_arrow.names]
+        if missing:
+            raise ValueError(f"Faltan columnas en {path}: {', '.join(missing)}")
+        for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=columns):
+            yield batch.to_pandas()
+        return
+
+    header = pd.read_csv(path, nrows=0).columns
+    missing = [column for column in columns if column not in header]
+    if missing:
+        raise ValueError(f"Faltan columnas en {path}: {', '.join(missing)}")
+    # Una columna con valores no numéricos llega como texto; score_chunk la convierte y marca esas filas
+    yield from pd.read_csv(path, usecols=columns, chunksize=chunk_size)
+
+
+def score_chunk(service: CropRecommendationService, chunk: pd.DataFrame, first_row: int, top_k: int = 3,
+                keep_columns: Optional[List[str]] = None, recommendations: bool = False) -> pd.DataFrame:
+    """
+    Puntúa un bloque con una sola llamada vectorizada a predict_proba
+
+    Las filas con valores faltantes, no numéricos o fuera de rango no se predicen:
+    quedan con valid=False y la lista de características inválidas en errors.
+
+    Returns:
+        pd.DataFrame: row, columnas conservadas, valid, predicted_crop, predicted_crop_spanish,
+        confidence_score, errors, top{i}_crop / top{i}_probability para i = 1..top_k y, si se
+        piden, los textos y advertencias de la base de conocimiento de cultivos
+    """
+    slot = service._slot
+    if slot is None:
+        raise RuntimeError('Modelo ML no disponible')
+
+    values = chunk[FEATURE_COLUMNS].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float64)
+    # NaN falla ambas comparaciones, así que los faltantes quedan fuera de rango
+    in_range = (values >= _MIN_VALUES) & (values <= _MAX_VALUES)
+    valid = in_range.all(axis=1)
+
+    n_rows, n_classes = len(chunk), len(slot.class_names)
+    top_k = max(1, min(top_k, n_classes))
+    top_indices = np.zeros((n_rows, top_k), dtype=np.intp)
+    top_probabilities = np.full((n_rows, top_k), np.nan)
+
+    if valid.any():
+        model_input = values[valid]
+        if slot.use_dataframe_input:
+            model_input = pd.DataFrame(model_input, columns=FEATURE_COLUMNS)
+        probabilities = slot.inference_model.predict_proba(model_input)
+
+        # Orden estable descendente, igual que _get_top_recommendations
+        order = np.argsort(-probabilities, axis=1, kind='stable')[:, :top_k]
+        top_indices[valid] = order
+        top_probabilities[valid] = np.take_along_axis(probabilities, order, axis=1)
+
+    class_names = np.array(slot.class_names + [''], dtype=object)
+    class_names_spanish = np.array(slot.class_names_spanish + [''], dtype=object)
+    # Las filas inválidas apuntan a la etiqueta vacía del final
+    top_indices[~valid] = n_classes
+
+    output = {'row': np.arange(first_row, first_row + n_rows)}
+    for column in keep_columns or []:
+        output[column] = chunk[column].to_numpy()
+    output['valid'] = valid
+    output['predicted_crop'] = class_names[top_indices[:, 0]]
+    output['predicted_crop_spanish'] = class_names_spanish[top_indices[:, 0]]
+    output['confidence_score'] = top_probabilities[:, 0]
+
+    errors = np.full(n_rows, '', dtype=object)
+    for i in np.flatnonzero(~valid):
+        errors[i] = ';'.join(column for column, ok in zip(FEATURE_COLUMNS, in_range[i]) if not ok)
+    output['errors'] = errors
+
+    for rank in range(top_k):
+        output[f'top{rank + 1}_crop'] = class_names[top_indices[:, rank]]
+        output[f'top{rank + 1}_probability'] = top_probabilities[:, rank]
+
+    if recommendations:
+        class_ids = np.where(valid, top_indices[:, 0], 0)
+        for field, texts in slot.knowledge.columns(class_ids, values).items():
+            texts[~valid] = ''
+            output[field] = texts
+
+    return pd.DataFrame(output)
+
+
+class ResultWriter:
+    """Escribe los bloques puntuados uno tras otro en CSV o Parquet"""
+
+    def __init__(self, path: str, fmt: Optional[str] = None):
+        self.path = path
+        self.format = file_format(path, fmt)
+        self._file = None
+        self._parquet_writer = None
+
+    def write(self, frame: pd.DataFrame):
+        if self.format == 'parquet':
+            pyarrow = _import_pyarrow()
+            table = pyarrow.Table.from_pandas(frame, preserve_index=False)
+            if self._parquet_writer is None:
+                self._parquet_writer = pyarrow.parquet.ParquetWriter(self.path, table.schema)
+            self._parquet_writer.write_table(table)
+            return
+
+        header = self._file is None
+        if header:
+            self._file = open(self.path, 'w', newline='', encoding='utf-8')
+        frame.to_csv(self._file, header=header, index=False)
+
+    def close(self):
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+        if self._file is not None:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _score_in_worker(chunk: pd.DataFrame, first_row: int, top_k: int, keep_columns: List[str],
+                     recommendations: bool) -> pd.DataFrame:
+    # Función de módulo para poder enviarla a un proceso; cada worker usa su servicio compartido
+    from .registry import get_service
+    return score_chunk(get_service(), chunk, first_row, top_k, keep_columns, recommendations)
+
+
+def model_summary(model_path: str, encoder_path: str) -> Dict:
+    """
+    Versión y clases del modelo sin deserializar el bosque (solo se lee el label encoder)
+
+    Es lo que necesita el proceso principal cuando la puntuación se reparte en workers,
+    que cargan cada uno su propio servicio.
+
+    Raises:
+        FileNotFoundError: Si falta el modelo o el label encoder
+    """
+    for path in (model_path, encoder_path):
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"No existe el archivo {path}")
+
+    from joblib import load
+    label_encoder = load(encoder_path)
+    return {
+        'model_version': _artifact_version([model_path, encoder_path]),
+        'classes': [str(label) for label in label_encoder.classes_]
+    }
+
+
+def score_file(service: Optional[CropRecommendationService], input_path: str, output_path: str, chunk_size: int = 100_000,
+               top_k: int = 3, keep_columns: Optional[List[str]] = None, workers: int = 1,
+               input_format: Optional[str] = None, output_format: Optional[str] = None,
+               recommendations: bool = False, progress=None) -> Dict:
+    """
+    Puntúa un archivo completo por bloques y escribe los resultados en el mismo orden
+
+    Con workers > 1 los bloques se reparten en un pool de procesos; a lo sumo 2 bloques
+    por worker están en vuelo, así que la memoria no crece con el tamaño del archivo.
+
+    Args:
+        service (CropRecommendationService): Servicio usado cuando workers == 1; con workers > 1
+            puede ser None, porque cada worker usa el servicio de su proceso
+        input_path (str): Archivo CSV o Parquet con las columnas de FEATURE_COLUMNS
+        output_path (str): Archivo de salida (CSV o Parquet)
+        chunk_size (int): Filas por bloque
+        top_k (int): Cultivos alternativos a incluir por fila
+        keep_columns (list): Columnas de entrada que se copian a la salida (por ejemplo un id)
+        workers (int): Procesos para puntuar
+        recommendations (bool): Agrega los textos y advertencias de la base de conocimiento
+        progress (callable): Se llama con las filas procesadas tras cada bloque
+
+    Returns:
+        dict: rows, valid, invalid y chunks
+
+    Raises:
+        ValueError: Si workers == 1 y no se pasa un servicio
+    """
+    if workers <= 1 and service is None:
+        raise ValueError('Se necesita un servicio para puntuar sin workers')
+    if 'parquet' in (file_format(input_path, input_format), file_format(output_path, output_format)):
+        _import_pyarrow()
+
+    keep_columns = keep_columns or []
+    columns = FEATURE_COLUMNS + [column for column in keep_columns if column not in FEATURE_COLUMNS]
+    chunks = iter_chunks(input_path, chunk_size, columns, input_format)
+    summary = {'rows': 0, 'valid': 0, 'invalid': 0, 'chunks': 0}
+
+    def consume(frame: pd.DataFrame):
+        writer.write(frame)
+        valid = int(frame['valid'].sum())
+        summary['rows'] += len(frame)
+        summary['valid'] += valid
+        summary['invalid'] += len(frame) - valid
+        summary['chunks'] += 1
+        if progress is not None:
+            progress(summary['rows'])
+
+    with ResultWriter(output_path, output_format) as writer:
+        if workers <= 1:
+            first_row = 0
+            for chunk in chunks:
+                consume(score_chunk(service, chunk, first_row, top_k, keep_columns, recommendations))
+                first_row += len(chunk)
+            return summary
+
+        pending = deque()
+        first_row = 0
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_process_worker, initargs=(1,)) as pool:
+            for chunk in chunks:
+                pending.append(
+                    pool.submit(_score_in_worker, chunk, first_row, top_k, keep_columns, recommendations)
+                )
+                first_row += len(chunk)
+                if len(pending) >= 2 * workers:
+                    consume(pending.popleft().result())
+            while pending:
+                consume(pending.popleft().result())
+
+    return summary
+
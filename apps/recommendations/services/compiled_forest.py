@@ -0,0 +1,173 @@
+import json
+import logging
+import os
+from typing import Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger('predictions')
+
+# Arreglos del artefacto exportado, un archivo .npy por arreglo
+COMPILED_ARRAYS = ('feature', 'threshold', 'children', 'value', 'roots', 'classes', 'feature_importances')
+COMPILED_META_FILE = 'meta.json'
+COMPILED_FORMAT_VERSION = 1
+
+# Filas recorridas a la vez; acota la memoria temporal (filas x árboles x clases)
+_CHUNK_ROWS = 512
+
+
+def export_forest(model, directory: str, feature_names: List[str], source_version: Optional[str] = None) -> Dict:
+    """
+    Aplana los árboles de un RandomForestClassifier en arreglos contiguos de NumPy
+
+    Todos los nodos de todos los árboles van en un mismo arreglo; roots indica el
+    nodo raíz de cada árbol. Las hojas apuntan a sí mismas como hijos, así el recorrido
+    vectorizado avanza max_depth pasos sin ramificar. value guarda, por nodo, las
+    probabilidades normalizadas de cada clase (lo que devuelve predict_proba de cada árbol).
+
+    Args:
+        model: RandomForestClassifier entrenado
+        directory (str): Carpeta de salida
+        feature_names (list): Orden de columnas que recibirá el motor
+        source_version (str): Versión del archivo del modelo del que se exporta
+
+    Returns:
+        dict: Metadatos del artefacto exportado
+    """
+    model_features = getattr(model, 'feature_names_in_', None)
+    if model_features is not None and list(model_features) != list(feature_names):
+        raise ValueError(f"Columnas del modelo {list(model_features)} distintas de {list(feature_names)}")
+
+    n_classes = len(model.classes_)
+    features, thresholds, children, values, roots = [], [], [], [], []
+    offset = 0
+    max_depth = 0
+
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        n_nodes = tree.node_count
+        is_leaf = tree.children_left == -1
+        node_ids = np.arange(n_nodes)
+
+        tree_children = np.empty((n_nodes, 2), dtype=np.int32)
+        tree_children[:, 0] = np.where(is_leaf, node_ids, tree.children_left) + offset
+        tree_children[:, 1] = np.where(is_leaf, node_ids, tree.children_right) + offset
+
+        tree_values = tree.value[:, 0, :n_classes].astype(np.float64)
+        normalizer = tree_values.sum(axis=1, keepdims=True)
+        normalizer[normalizer == 0.0] = 1.0
+
+        features.append(np.where(is_leaf, 0, tree.feature).astype(np.int32))
+        thresholds.append(np.where(is_leaf, np.inf, tree.threshold).astype(np.float64))
+        children.append(tree_children)
+        values.append(tree_values / normalizer)
+        roots.append(offset)
+
+        max_depth = max(max_depth, int(tree.max_depth))
+        offset += n_nodes
+
+    arrays = {
+        'feature': np.concatenate(features),
+        'threshold': np.concatenate(thresholds),
+        'children': np.concatenate(children),
+        'value': np.concatenate(values),
+        'roots': np.asarray(roots, dtype=np.int32),
+        'classes': np.asarray(model.classes_),
+        'feature_importances': np.asarray(model.feature_importances_, dtype=np.float64),
+    }
+
+    os.makedirs(directory, exist_ok=True)
+    for name, array in arrays.items():
+        np.save(os.path.join(directory, f'{name}.npy'), np.ascontiguousarray(array))
+
+    meta = {
+        'format_version': COMPILED_FORMAT_VERSION,
+        'n_trees': len(roots),
+        'n_nodes': offset,
+        'n_classes': n_classes,
+        'max_depth': max_depth,
+        'feature_names': list(feature_names),
+        'source_version': source_version,
+    }
+    # Los metadatos se escriben al final: sin ellos el artefacto no se considera completo
+    with open(os.path.join(directory, COMPILED_META_FILE), 'w') as meta_file:
+        json.dump(meta, meta_file, indent=2)
+
+    return meta
+
+
+class CompiledForest:
+    """
+    Motor de inferencia sobre un bosque exportado con export_forest
+
+    Expone la parte de la interfaz de sklearn que usa el servicio (classes_,
+    feature_importances_, predict_proba, predict) sin su validación por llamada. Como
+    sklearn, compara en float32 contra los umbrales, así que las probabilidades
+    coinciden con las de RandomForestClassifier.
+
+    Args:
+        directory (str): Carpeta del artefacto
+        mmap_mode (str): Modo de np.load; 'r' mapea los arreglos sin copiarlos (compartidos entre workers)
+    """
+
+    def __init__(self, directory: str, mmap_mode: Optional[str] = 'r'):
+        with open(os.path.join(directory, COMPILED_META_FILE)) as meta_file:
+            self.meta = json.load(meta_file)
+
+        if self.meta.get('format_version') != COMPILED_FORMAT_VERSION:
+            raise ValueError(f"Formato de bosque compilado no soportado: {self.meta.get('format_version')}")
+
+        arrays = {
+            name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode=mmap_mode)
+            for name in COMPILED_ARRAYS
+        }
+        # np.asarray da vistas ndarray sobre el mapeo (sin copia) para que np.take no envuelva el resultado en memmap
+        self.directory = directory
+        self.feature = np.asarray(arrays['feature'])
+        self.threshold = np.asarray(arrays['threshold'])
+        self.children = np.asarray(arrays['children'])
+        self.value = np.asarray(arrays['value'])
+        self.roots = np.asarray(arrays['roots']).astype(np.intp)
+        self._children_flat = self.children.reshape(-1)
+        self.classes_ = np.asarray(arrays['classes'])
+        self.feature_importances_ = np.asarray(arrays['feature_importances'])
+
+        self.feature_names = self.meta['feature_names']
+        self.n_features_in_ = len(self.feature_names)
+        self.n_estimators = self.meta['n_trees']
+        self.max_depth = self.meta['max_depth']
+
+    @property
+    def source_version(self) -> Optional[str]:
+        return self.meta.get('source_version')
+
+    def predict_proba(self, X) -> np.ndarray:
+        """Probabilidades promedio de los árboles, una fila por muestra"""
+        # sklearn convierte la entrada a float32 antes de compararla con los umbrales
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_features_in_:
+            raise ValueError(f"Se esperaban {self.n_features_in_} columnas, se recibió la forma {X.shape}")
+
+        if X.shape[0] <= _CHUNK_ROWS:
+            return self._predict_chunk(X)
+
+        return np.concatenate([
+            self._predict_chunk(X[start:start + _CHUNK_ROWS])
+            for start in range(0, X.shape[0], _CHUNK_ROWS)
+        ])
+
+    def _predict_chunk(self, X: np.ndarray) -> np.ndarray:
+        # Índices planos: np.take es bastante más rápido que la indexación avanzada
+        row_offsets = (np.arange(X.shape[0], dtype=np.intp) * X.shape[1])[:, None]
+        values = X.reshape(-1)
+        nodes = np.broadcast_to(self.roots, (X.shape[0], len(self.roots)))
+
+        # Todas las muestras bajan por todos los árboles a la vez; las hojas se apuntan a sí mismas
+        for _ in range(self.max_depth):
+            go_right = np.take(values, row_offsets + np.take(self.feature, nodes)) > np.take(self.threshold, nodes)
+            nodes = np.take(self._children_flat, nodes * 2 + go_right)
+
+        return np.take(self.value, nodes, axis=0).sum(axis=1) / self.n_estimators
+
+    def predict(self, X) -> np.ndarray:
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
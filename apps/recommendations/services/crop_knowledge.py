@@ -0,0 +1,141 @@
+import json
+import logging
+import os
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from .features import FEATURE_COLUMNS
+
+logger = logging.getLogger('predictions')
+
+DEFAULT_KNOWLEDGE_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'crop_knowledge.json')
+
+# Textos por cultivo y categorías de advertencias, en el orden de la respuesta
+TEXT_FIELDS = (
+    'planting_season', 'irrigation_recommendation', 'fertilization_recommendation',
+    'pest_control_tips', 'expected_yield', 'growth_duration'
+)
+WARNING_CATEGORIES = ('soil_warnings', 'climate_warnings')
+RECOMMENDATION_FIELDS = TEXT_FIELDS + WARNING_CATEGORIES
+
+_documents: Dict[str, Dict] = {}
+_documents_lock = threading.Lock()
+
+
+def _load_document(path: str) -> Dict:
+    """Lee el archivo de conocimiento una sola vez por proceso"""
+    document = _documents.get(path)
+    if document is None:
+        with _documents_lock:
+            document = _documents.get(path)
+            if document is None:
+                with open(path, encoding='utf-8') as knowledge_file:
+                    document = json.load(knowledge_file)
+                _documents[path] = document
+    return document
+
+
+class CropKnowledgeBase:
+    """
+    Recomendaciones agronómicas por cultivo indexadas por id de clase, con advertencias vectorizadas
+
+    Los textos se guardan en un arreglo por campo alineado con las columnas de predict_proba,
+    así que un lote completo se resuelve indexando con los ids predichos. Cada regla de
+    advertencia es un umbral sobre una característica; un lote se evalúa con una sola
+    comparación de arreglos y los mensajes se arman una vez por combinación distinta de reglas.
+
+    Args:
+        class_names (list): Cultivos en el orden de las clases del modelo
+        path (str): Archivo JSON con 'crops' (textos por cultivo) y 'warnings' (reglas)
+    """
+
+    def __init__(self, class_names: List[str], path: str = DEFAULT_KNOWLEDGE_PATH):
+        document = _load_document(path)
+        crops = document.get('crops', {})
+
+        missing = [name for name in class_names if name not in crops]
+        if missing:
+            logger.warning(f"Cultivos sin recomendaciones en {path}: {', '.join(missing)}")
+
+        self.class_names = list(class_names)
+        self.class_index = {name: i for i, name in enumerate(self.class_names)}
+        self._texts = {
+            field: np.array([crops.get(name, {}).get(field, '') for name in self.class_names], dtype=object)
+            for field in TEXT_FIELDS
+        }
+
+        rules = document.get('warnings', [])
+        self._rule_features = np.array([FEATURE_COLUMNS.index(rule['feature']) for rule in rules], dtype=np.intp)
+        self._rule_above = np.array(['above' in rule for rule in rules], dtype=bool)
+        self._rule_thresholds = np.array(
+            [rule['above'] if 'above' in rule else rule['below'] for rule in rules], dtype=np.float64
+        )
+        self._rule_messages = [rule['message'] for rule in rules]
+        self._category_rules = {
+            category: np.array([i for i, rule in enumerate(rules) if rule['category'] == category], dtype=np.intp)
+            for category in WARNING_CATEGORIES
+        }
+
+    def triggered_warnings(self, features: np.ndarray) -> np.ndarray:
+        """
+        Evalúa todas las reglas sobre un lote
+
+        Args:
+            features (np.ndarray): Matriz (muestras x FEATURE_COLUMNS); NaN no dispara reglas
+
+        Returns:
+            np.ndarray: Matriz booleana (muestras x reglas)
+        """
+        values = features[:, self._rule_features]
+        return np.where(self._rule_above, values > self._rule_thresholds, values < self._rule_thresholds)
+
+    def warning_texts(self, features: np.ndarray) -> Dict[str, np.ndarray]:
+        """Texto de advertencias por categoría para cada muestra (mensajes unidos con '; ')"""
+        triggered = self.triggered_warnings(features)
+        texts = {}
+        for category, rule_ids in self._category_rules.items():
+            if not len(rule_ids):
+                texts[category] = np.full(len(features), '', dtype=object)
+                continue
+
+            # Cada combinación de reglas disparadas se codifica como un entero y su texto se arma una vez
+            codes = triggered[:, rule_ids] @ (1 << np.arange(len(rule_ids), dtype=np.int64))
+            unique_codes, inverse = np.unique(codes, return_inverse=True)
+            messages = np.array([
+                '; '.join(self._rule_messages[rule_ids[bit]] for bit in range(len(rule_ids)) if code >> bit & 1)
+                for code in unique_codes
+            ], dtype=object)
+            texts[category] = messages[inverse.reshape(-1)]
+        return texts
+
+    def columns(self, class_ids: np.ndarray, features: np.ndarray) -> Dict[str, np.ndarray]:
+        """Arreglos por campo de RECOMMENDATION_FIELDS para un lote (útil para salidas tabulares)"""
+        class_ids = np.asarray(class_ids, dtype=np.intp)
+        result = {field: self._texts[field][class_ids] for field in TEXT_FIELDS}
+        result.update(self.warning_texts(features))
+        return result
+
+    def recommendations(self, class_ids: np.ndarray, features: np.ndarray) -> List[Dict]:
+        """Diccionario de recomendaciones por muestra de un lote"""
+        columns = self.columns(class_ids, features)
+        values = [columns[field] for field in RECOMMENDATION_FIELDS]
+        return [dict(zip(RECOMMENDATION_FIELDS, row)) for row in zip(*values)]
+
+    def recommendation(self, class_id: Optional[int], data: Dict) -> Dict:
+        """
+        Recomendaciones de una muestra
+
+        Args:
+            class_id (int): Id de la clase predicha (None para un cultivo desconocido: solo advertencias)
+            data (dict): Datos de sensores; las características faltantes no disparan advertencias
+        """
+        features = np.array([[data.get(column, np.nan) for column in FEATURE_COLUMNS]], dtype=np.float64)
+        warnings = self.warning_texts(features)
+        result = {
+            field: self._texts[field][class_id] if class_id is not None else ''
+            for field in TEXT_FIELDS
+        }
+        result.update({category: warnings[category][0] for category in WARNING_CATEGORIES})
+        return result
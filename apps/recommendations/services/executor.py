@@ -0,0 +1,150 @@
+import asyncio
+import logging
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, Optional
+
+from django.conf import settings
+
+logger = logging.getLogger('predictions')
+
+
+class InferenceRejected(Exception):
+    """El pool de inferencia está saturado (se responde 429 con Retry-After)"""
+
+
+class InferenceTimeout(Exception):
+    """La predicción no terminó dentro del tiempo límite de la petición"""
+
+
+def _limit_native_threads(blas_threads: int):
+    """Evita la sobresuscripción: cada worker usa a lo sumo blas_threads hilos de BLAS/OpenMP"""
+    from threadpoolctl import threadpool_limits
+    threadpool_limits(limits=blas_threads)
+
+
+def _init_process_worker(blas_threads: int):
+    # Con el método spawn el proceso hijo arranca sin Django configurado
+    import django
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+    django.setup()
+    _limit_native_threads(blas_threads)
+
+
+def _predict_crop(data: Dict, fields: Optional[frozenset] = None, use_grid: bool = False) -> Dict:
+    # Función de módulo para poder enviarla a un proceso; cada worker usa su servicio compartido
+    from .registry import get_service
+    return get_service().predict_crop(data, fields, use_grid=use_grid)
+
+
+class InferenceExecutor:
+    """
+    Pool acotado para ejecutar predict_crop fuera del event loop
+
+    Admite a lo sumo max_workers predicciones en ejecución más max_queue en espera; por
+    encima de eso rechaza de inmediato (backpressure) en lugar de acumular peticiones.
+    Un trabajo que excede el tiempo límite libera a quien espera, pero su lugar en el
+    pool se libera solo cuando el worker termina.
+
+    Args:
+        kind (str): 'thread' o 'process'
+        max_workers (int): Workers del pool
+        max_queue (int): Predicciones que pueden esperar un worker libre
+        timeout (float): Segundos máximos por predicción
+        blas_threads (int): Hilos de BLAS/OpenMP por worker (threadpoolctl)
+    """
+
+    def __init__(self, kind: str = 'thread', max_workers: Optional[int] = None, max_queue: int = 64,
+                 timeout: float = 5.0, blas_threads: int = 1):
+        self.kind = kind
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.capacity = self.max_workers + max_queue
+        self.timeout = timeout
+
+        if kind == 'process':
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers, initializer=_init_process_worker, initargs=(blas_threads,)
+            )
+        elif kind == 'thread':
+            # Los límites de threadpoolctl son de todo el proceso, así que se aplican una vez aquí
+            _limit_native_threads(blas_threads)
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='inference')
+        else:
+            raise ValueError(f"Tipo de pool desconocido: {kind}")
+
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    def _acquire(self) -> bool:
+        with self._lock:
+            if self._in_flight >= self.capacity:
+                return False
+            self._in_flight += 1
+            return True
+
+    def _release(self, _future=None):
+        with self._lock:
+            self._in_flight -= 1
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    async def predict_crop(self, data: Dict, fields: Optional[frozenset] = None, use_grid: bool = False) -> Dict:
+        """
+        Ejecuta predict_crop en el pool sin bloquear el event loop
+
+        Args:
+            data (dict): Muestra validada
+            fields (frozenset): Campos del resultado a incluir (None = todos)
+            use_grid (bool): Acepta la respuesta aproximada de la malla precalculada
+
+        Raises:
+            InferenceRejected: Si el pool y su cola están llenos
+            InferenceTimeout: Si la predicción excede el tiempo límite
+        """
+        if not self._acquire():
+            raise InferenceRejected()
+
+        try:
+            future = self._executor.submit(_predict_crop, data, fields, use_grid)
+        except Exception:
+            self._release()
+            raise
+        future.add_done_callback(self._release)
+
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            raise InferenceTimeout()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+_executor: Optional[InferenceExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_inference_executor() -> InferenceExecutor:
+    """Devuelve el pool de inferencia del proceso, creado en el primer uso según settings"""
+    global _executor
+
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                pool_settings = settings.ML_INFERENCE_POOL
+                _executor = InferenceExecutor(
+                    kind=pool_settings.get('KIND', 'thread'),
+                    max_workers=pool_settings.get('MAX_WORKERS'),
+                    max_queue=pool_settings.get('MAX_QUEUE', 64),
+                    timeout=pool_settings.get('TIMEOUT', 5.0),
+                    blas_threads=pool_settings.get('BLAS_THREADS', 1)
+                )
+                logger.info(
+                    f"Pool de inferencia '{_executor.kind}' con {_executor.max_workers} workers "
+                    f"y capacidad {_executor.capacity}"
+                )
+
+    return _executor
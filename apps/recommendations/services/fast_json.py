@@ -0,0 +1,109 @@
+import json
+import math
+from typing import Dict, Optional, Tuple
+
+from rest_framework.fields import Field, FloatField
+
+from .features import FEATURES
+
+# orjson está en requirements.txt; si falta se usa json con las mismas opciones que el JSONRenderer de DRF
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Mismo límite que FloatField de DRF para cadenas numéricas
+_MAX_STRING_LENGTH = FloatField.MAX_STRING_LENGTH
+
+
+class InvalidPayload(Exception):
+    """El cuerpo no es un objeto JSON que el camino rápido sepa validar; se delega a DRF"""
+
+
+def loads(body: bytes) -> Dict:
+    """Decodifica un objeto JSON; rechaza NaN/Infinity como el JSONParser estricto de DRF"""
+    try:
+        if orjson is not None:
+            payload = orjson.loads(body)
+        else:
+            payload = json.loads(body, parse_constant=_reject_constant)
+    except ValueError as e:
+        raise InvalidPayload(str(e))
+
+    if not isinstance(payload, dict):
+        raise InvalidPayload('Se esperaba un objeto JSON')
+    return payload
+
+
+def _reject_constant(constant: str):
+    raise ValueError(f'Valor JSON no válido: {constant}')
+
+
+def dumps(data: Dict) -> bytes:
+    """Codifica la respuesta con la misma semántica que el JSONRenderer de DRF (compacto, UTF-8, sin NaN)"""
+    # DRF escapa los separadores de línea U+2028/U+2029 para que el JSON sea JavaScript válido
+    if orjson is not None:
+        content = orjson.dumps(data)
+        if b'\xe2\x80\xa8' in content or b'\xe2\x80\xa9' in content:
+            content = content.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return content
+
+    content = json.dumps(data, ensure_ascii=False, allow_nan=False, separators=(',', ':'))
+    return content.replace('\u2028', '\\u2028').replace('\u2029', '\\u2029').encode('utf-8')
+
+
+def validate_input(payload: Dict) -> Tuple[Dict, Optional[Dict]]:
+    """
+    Valida las siete características con las mismas reglas y mensajes que CropInputSerializer
+
+    La usan también las filas de predict_crops, así que un lote acepta y rechaza lo mismo que
+    el endpoint de una muestra: textos numéricos sí; booleanos, NaN e infinitos no.
+
+    Returns:
+        tuple: (datos convertidos a float en el orden del modelo, errores por campo o None)
+    """
+    data, errors = {}, {}
+    for feature in FEATURES:
+        if feature.name not in payload:
+            errors[feature.name] = [str(Field.default_error_messages['required'])]
+            continue
+
+        value = payload[feature.name]
+        if value is None:
+            errors[feature.name] = [str(Field.default_error_messages['null'])]
+            continue
+
+        if isinstance(value, bool):
+            errors[feature.name] = [str(FloatField.default_error_messages['invalid'])]
+            continue
+
+        if isinstance(value, str) and len(value) > _MAX_STRING_LENGTH:
+            errors[feature.name] = [str(FloatField.default_error_messages['max_string_length'])]
+            continue
+
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            errors[feature.name] = [str(FloatField.default_error_messages['invalid'])]
+            continue
+        except OverflowError:
+            errors[feature.name] = [str(FloatField.default_error_messages['overflow'])]
+            continue
+
+        if not math.isfinite(value):
+            errors[feature.name] = [str(FloatField.default_error_messages['invalid'])]
+            continue
+
+        # DRF ejecuta todos los validadores: primero el máximo y luego el mínimo
+        field_errors = []
+        if value > feature.max_value:
+            field_errors.append(str(FloatField.default_error_messages['max_value']).format(max_value=feature.max_value))
+        if value < feature.min_value:
+            field_errors.append(str(FloatField.default_error_messages['min_value']).format(min_value=feature.min_value))
+
+        if field_errors:
+            errors[feature.name] = field_errors
+        else:
+            data[feature.name] = value
+
+    return data, errors or None
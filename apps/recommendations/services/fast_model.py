@@ -0,0 +1,147 @@
+import copy
+import io
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from .compiled_forest import CompiledForest, export_forest
+from .features import FEATURE_COLUMNS
+
+# Variantes por defecto: subconjuntos de árboles del modelo actual y modelos reentrenados
+# con profundidad limitada o poda por complejidad de costo (ccp_alpha)
+DEFAULT_TREES = (10, 25, 50)
+DEFAULT_DEPTHS = (6, 10)
+DEFAULT_CCP_ALPHAS = (0.002,)
+
+
+def tree_subset(model, n_trees: int):
+    """Copia del bosque con solo sus primeros n_trees árboles (sin reentrenar)"""
+    subset = copy.copy(model)
+    subset.estimators_ = model.estimators_[:n_trees]
+    subset.n_estimators = len(subset.estimators_)
+    return subset
+
+
+def retrain(model, features, labels, **params):
+    """Entrena un bosque con los hiperparámetros del modelo actual salvo los indicados"""
+    from sklearn.base import clone
+    return clone(model).set_params(**params).fit(features, labels)
+
+
+def candidate_specs(model, trees=DEFAULT_TREES, depths=DEFAULT_DEPTHS, ccp_alphas=DEFAULT_CCP_ALPHAS) -> List[Dict]:
+    """
+    Lista de variantes a evaluar
+
+    Returns:
+        list: Un dict por variante con name, kind ('current', 'subset' o 'retrained') y params
+    """
+    n_estimators = len(model.estimators_)
+    specs = [{'name': 'current', 'kind': 'current', 'params': {}}]
+    specs += [
+        {'name': f'trees{n}', 'kind': 'subset', 'params': {'n_estimators': n}}
+        for n in trees if n < n_estimators
+    ]
+    specs += [
+        {'name': f'depth{depth}-trees{n}', 'kind': 'retrained', 'params': {'n_estimators': n, 'max_depth': depth}}
+        for depth in depths for n in trees
+    ]
+    specs += [
+        {'name': f'ccp{alpha:g}-trees{n}', 'kind': 'retrained', 'params': {'n_estimators': n, 'ccp_alpha': alpha}}
+        for alpha in ccp_alphas for n in trees
+    ]
+    return specs
+
+
+def build_candidate(model, spec: Dict, features, labels):
+    """Construye la variante descrita por spec (features/labels solo se usan al reentrenar)"""
+    if spec['kind'] == 'current':
+        return model
+    if spec['kind'] == 'subset':
+        return tree_subset(model, spec['params']['n_estimators'])
+    return retrain(model, features, labels, **spec['params'])
+
+
+def _serving_estimator(model):
+    # Mismo camino que el servicio: arreglo NumPy sin validar nombres de columnas
+    estimator = copy.copy(model)
+    if hasattr(estimator, 'feature_names_in_'):
+        del estimator.feature_names_in_
+    return estimator
+
+
+def latency_percentiles(predict_proba: Callable, rows: np.ndarray, warmup: int = 20) -> Dict:
+    """Latencia de predict_proba fila por fila, en milisegundos"""
+    for row in rows[:warmup]:
+        predict_proba(row[None, :])
+
+    timings = np.empty(len(rows))
+    for i, row in enumerate(rows):
+        start = time.perf_counter()
+        predict_proba(row[None, :])
+        timings[i] = time.perf_counter() - start
+
+    timings *= 1000
+    return {
+        'p50_ms': round(float(np.percentile(timings, 50)), 3),
+        'p99_ms': round(float(np.percentile(timings, 99)), 3),
+    }
+
+
+def model_size(model) -> Dict:
+    """Nodos, profundidad máxima y tamaño serializado del bosque"""
+    from joblib import dump
+
+    buffer = io.BytesIO()
+    dump(model, buffer)
+    return {
+        'trees': len(model.estimators_),
+        'nodes': int(sum(estimator.tree_.node_count for estimator in model.estimators_)),
+        'max_depth': int(max(estimator.tree_.max_depth for estimator in model.estimators_)),
+        'size_kb': round(buffer.tell() / 1024, 1),
+    }
+
+
+def evaluate(model, reference, features: np.ndarray, labels: np.ndarray, latency_rows: np.ndarray,
+             holdout: Optional[tuple] = None, compiled: bool = True) -> Dict:
+    """
+    Evalúa una variante contra el modelo actual
+
+    Args:
+        model: Variante a evaluar
+        reference: Modelo actual (para medir la coincidencia de predicciones)
+        features (np.ndarray): Características del dataset completo
+        labels (np.ndarray): Etiquetas codificadas del dataset completo
+        latency_rows (np.ndarray): Filas para medir la latencia por muestra
+        holdout (tuple): (features, labels) no vistos por la variante, si aplica
+        compiled (bool): Mide también la latencia con el backend compilado
+
+    Returns:
+        dict: accuracy, agreement, holdout_accuracy, latencias p50/p99 (sklearn y compilado) y tamaño
+    """
+    estimator = _serving_estimator(model)
+    predicted = estimator.predict(features)
+    reference_predicted = _serving_estimator(reference).predict(features)
+
+    result = {
+        **model_size(model),
+        'accuracy': round(float(np.mean(predicted == labels)), 4),
+        'agreement': round(float(np.mean(predicted == reference_predicted)), 4),
+        'holdout_accuracy': None,
+    }
+    if holdout is not None:
+        holdout_features, holdout_labels = holdout
+        result['holdout_accuracy'] = round(float(np.mean(estimator.predict(holdout_features) == holdout_labels)), 4)
+
+    result.update(latency_percentiles(estimator.predict_proba, latency_rows))
+
+    if compiled:
+        with tempfile.TemporaryDirectory() as directory:
+            export_forest(model, directory, FEATURE_COLUMNS)
+            forest = CompiledForest(directory, mmap_mode=None)
+            compiled_latency = latency_percentiles(forest.predict_proba, latency_rows)
+        result['compiled_p50_ms'] = compiled_latency['p50_ms']
+        result['compiled_p99_ms'] = compiled_latency['p99_ms']
+
+    return result
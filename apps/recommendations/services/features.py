@@ -0,0 +1,31 @@
+from typing import NamedTuple
+
+
+class FeatureRange(NamedTuple):
+    """Característica de entrada del modelo con su rango válido y sus textos para formularios"""
+    name: str
+    display_name: str
+    label: str
+    min_value: float
+    max_value: float
+    help_text: str
+
+
+# Tabla única de rangos (basados en el dataset original), en el orden de entrenamiento del modelo.
+# La usan el formulario de la página, los serializers de la API y la validación del servicio.
+FEATURES = [
+    FeatureRange('N', 'Nitrógeno', 'Nitrógeno (N)', 0, 140, 'Nivel de nitrógeno en el suelo'),
+    FeatureRange('P', 'Fósforo', 'Fósforo (P)', 5, 145, 'Nivel de fósforo en el suelo'),
+    FeatureRange('K', 'Potasio', 'Potasio (K)', 5, 205, 'Nivel de potasio en el suelo'),
+    FeatureRange('temperature', 'Temperatura', 'Temperatura (°C)', 8.83, 43.7,
+                 'Temperatura promedio en grados Celsius'),
+    FeatureRange('humidity', 'Humedad', 'Humedad (%)', 14.3, 100, 'Nivel de humedad relativa'),
+    FeatureRange('ph', 'pH', 'pH', 3.5, 9.94, 'Nivel de pH del suelo'),
+    FeatureRange('rainfall', 'Precipitación', 'Precipitación (mm)', 0, 299, 'Precipitación pluvial en milímetros'),
+]
+
+# Orden de columnas con el que fue entrenado el modelo
+FEATURE_COLUMNS = [feature.name for feature in FEATURES]
+
+# Rangos válidos de entrada: (mínimo, máximo, nombre)
+INPUT_RANGES = {feature.name: (feature.min_value, feature.max_value, feature.display_name) for feature in FEATURES}
@@ -0,0 +1,307 @@
+import bisect
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+logger = logging.getLogger('predictions')
+
+# Límites superiores de los buckets en segundos (el último bucket, +Inf, es implícito)
+LATENCY_BUCKETS = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0
+)
+_BUCKETS_NS = [int(bound * 1e9) for bound in LATENCY_BUCKETS]
+
+# Etapas medidas en predict_crop / predict_crops
+STAGES = ('validation', 'cache', 'input_preparation', 'model', 'label_decoding', 'response_building', 'total')
+
+HISTOGRAM_NAME = 'cultivai_prediction_stage_seconds'
+COUNTER_NAME = 'cultivai_predictions_total'
+
+# Acumulado de los workers que ya terminaron, dentro del directorio compartido
+RETIRED_FILE = 'retired.json'
+_LOCK_FILE = '.lock'
+
+
+def _process_alive(pid: int) -> bool:
+    """Indica si hay un proceso con ese pid en esta máquina (sin os.kill fuera de POSIX se asume vivo)"""
+    if os.name != 'posix':
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class PredictionMetrics:
+    """
+    Histogramas de latencia por etapa de predicción, por worker y combinados entre workers
+
+    Cada proceso acumula en memoria; si se configura un directorio, cada worker vuelca
+    su estado a <directorio>/<pid>-<inicio>.json (como máximo cada flush_interval segundos)
+    y el endpoint /metrics suma los archivos de todos los workers. El inicio del proceso va en
+    el nombre para que un worker nuevo que reutiliza un pid no pise el archivo del anterior.
+    Los archivos de workers que ya terminaron se suman a retired.json y se borran, así que
+    los contadores no retroceden y el directorio no crece con cada reinicio.
+
+    Args:
+        directory (str): Carpeta compartida entre los workers de una misma máquina
+            (None = solo este proceso)
+        flush_interval (float): Segundos mínimos entre volcados a disco
+    """
+
+    def __init__(self, directory: Optional[str] = None, flush_interval: float = 5.0):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        # Los workers heredan la memoria del proceso padre al hacer fork; cada uno empieza de cero
+        self._pid = os.getpid()
+        self._started_ns = time.time_ns()
+        self._histograms: Dict[tuple, list] = {}
+        self._counters: Dict[tuple, int] = {}
+        self._last_flush = time.monotonic()
+
+    def observe(self, model_version: Optional[str], operation: str, stages_ns: Dict[str, int], outcome: str):
+        """
+        Registra una predicción
+
+        Args:
+            model_version (str): Versión del modelo que respondió
+            operation (str): 'single' o 'batch'
+            stages_ns (dict): Nanosegundos por etapa (perf_counter_ns)
+            outcome (str): 'success', 'cache_hit', 'invalid' o 'error'
+        """
+        version = model_version or 'none'
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset()
+
+            for stage, elapsed_ns in stages_ns.items():
+                key = (operation, stage, version)
+                histogram = self._histograms.get(key)
+                if histogram is None:
+                    histogram = self._histograms[key] = [[0] * (len(_BUCKETS_NS) + 1), 0, 0]
+                histogram[0][bisect.bisect_left(_BUCKETS_NS, elapsed_ns)] += 1
+                histogram[1] += elapsed_ns
+                histogram[2] += 1
+
+            counter_key = (operation, version, outcome)
+            self._counters[counter_key] = self._counters.get(counter_key, 0) + 1
+
+            flush_due = self.directory and time.monotonic() - self._last_flush >= self.flush_interval
+            if flush_due:
+                self._last_flush = time.monotonic()
+
+        if flush_due:
+            self.flush()
+
+    def snapshot(self) -> Dict:
+        """Estado de este proceso en un formato serializable"""
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset()
+            return {
+                'pid': self._pid,
+                'started_ns': self._started_ns,
+                'histograms': [
+                    {'operation': operation, 'stage': stage, 'model_version': version,
+                     'buckets': list(buckets), 'sum_ns': sum_ns, 'count': count}
+                    for (operation, stage, version), (buckets, sum_ns, count) in self._histograms.items()
+                ],
+                'counters': [
+                    {'operation': operation, 'model_version': version, 'outcome': outcome, 'value': value}
+                    for (operation, version, outcome), value in self._counters.items()
+                ],
+            }
+
+    def flush(self):
+        """Vuelca el estado de este worker a su archivo (escritura atómica)"""
+        if not self.directory:
+            return
+
+        snapshot = self.snapshot()
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{snapshot['pid']}-{snapshot['started_ns']}.json")
+        try:
+            _write_json(path, snapshot)
+        except OSError as e:
+            logger.warning(f"No se pudieron guardar las métricas en {path}: {e}")
+
+    def collect(self) -> List[Dict]:
+        """
+        Estados de todos los workers (o solo de este proceso si no hay directorio compartido)
+
+        Los archivos de procesos que ya no existen se pasan al acumulado retired.json, que
+        se devuelve como un estado más.
+        """
+        if not self.directory:
+            return [self.snapshot()]
+
+        self.flush()
+        with _directory_lock(self.directory) as locked:
+            if locked:
+                self._retire_dead_workers()
+
+            snapshots = []
+            for path in glob.glob(os.path.join(self.directory, '*.json')):
+                snapshot = _read_json(path)
+                # Un archivo a medio escribir por otro worker se leerá en la próxima consulta
+                if snapshot is not None:
+                    snapshots.append(snapshot)
+        return snapshots
+
+    def _retire_dead_workers(self):
+        retired_path = os.path.join(self.directory, RETIRED_FILE)
+        dead = []
+        for path in glob.glob(os.path.join(self.directory, '*-*.json')):
+            snapshot = _read_json(path)
+            if snapshot is not None and not _process_alive(snapshot['pid']):
+                dead.append((path, snapshot))
+        if not dead:
+            return
+
+        retired = _read_json(retired_path) or {'pid': None, 'histograms': [], 'counters': []}
+        merged = merge_snapshots([retired] + [snapshot for _, snapshot in dead])
+        merged['retired_workers'] = retired.get('retired_workers', 0) + len(dead)
+        try:
+            # Primero el acumulado y después el borrado: si algo falla, como mucho un worker
+            # queda en ambos hasta la siguiente consulta, pero nunca se pierde su cuenta
+            _write_json(retired_path, merged)
+            for path, _ in dead:
+                os.remove(path)
+        except OSError as e:
+            logger.warning(f"No se pudieron retirar las métricas de workers terminados: {e}")
+
+
+def _read_json(path: str) -> Optional[Dict]:
+    try:
+        with open(path) as json_file:
+            return json.load(json_file)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json(path: str, data: Dict):
+    """Escritura atómica: a un temporal y luego renombrado"""
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as json_file:
+        json.dump(data, json_file)
+    os.replace(tmp_path, path)
+
+
+@contextmanager
+def _directory_lock(directory: str):
+    """
+    Lock de archivo del directorio de métricas (fcntl)
+
+    Solo lo toma collect() para retirar workers, así que observe() nunca espera.
+    Produce False si no se pudo tomar (sin fcntl, por ejemplo) y entonces no se retira nada.
+    """
+    try:
+        import fcntl
+        lock_file = open(os.path.join(directory, _LOCK_FILE), 'a')
+    except (ImportError, OSError):
+        yield False
+        return
+
+    # Cerrar el archivo suelta el lock
+    with lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        except OSError:
+            yield False
+            return
+        yield True
+
+
+def _sum_snapshots(snapshots: List[Dict]) -> tuple:
+    histograms: Dict[tuple, list] = {}
+    counters: Dict[tuple, int] = {}
+    for snapshot in snapshots:
+        for histogram in snapshot.get('histograms', []):
+            key = (histogram['operation'], histogram['stage'], histogram['model_version'])
+            merged = histograms.setdefault(key, [[0] * (len(_BUCKETS_NS) + 1), 0, 0])
+            merged[0] = [a + b for a, b in zip(merged[0], histogram['buckets'])]
+            merged[1] += histogram['sum_ns']
+            merged[2] += histogram['count']
+        for counter in snapshot.get('counters', []):
+            key = (counter['operation'], counter['model_version'], counter['outcome'])
+            counters[key] = counters.get(key, 0) + counter['value']
+    return histograms, counters
+
+
+def merge_snapshots(snapshots: List[Dict]) -> Dict:
+    """Suma varios estados en uno solo, con el mismo formato que PredictionMetrics.snapshot()"""
+    histograms, counters = _sum_snapshots(snapshots)
+    return {
+        'pid': None,
+        'histograms': [
+            {'operation': operation, 'stage': stage, 'model_version': version,
+             'buckets': buckets, 'sum_ns': sum_ns, 'count': count}
+            for (operation, stage, version), (buckets, sum_ns, count) in histograms.items()
+        ],
+        'counters': [
+            {'operation': operation, 'model_version': version, 'outcome': outcome, 'value': value}
+            for (operation, version, outcome), value in counters.items()
+        ],
+    }
+
+
+def _labels(**labels) -> str:
+    return ','.join(f'{name}="{value}"' for name, value in labels.items())
+
+
+def render_prometheus(snapshots: List[Dict], models: List[Dict]) -> str:
+    """
+    Genera el formato de texto de Prometheus sumando los estados de todos los workers
+
+    Args:
+        snapshots (list): Estados devueltos por PredictionMetrics.collect()
+        models (list): Modelos en servicio en este proceso: {'model_version', 'backend'}
+    """
+    histograms, counters = _sum_snapshots(snapshots)
+
+    lines = [
+        f'# HELP {HISTOGRAM_NAME} Latencia de predicción por etapa',
+        f'# TYPE {HISTOGRAM_NAME} histogram',
+    ]
+    bounds = [repr(bound) for bound in LATENCY_BUCKETS] + ['+Inf']
+    for (operation, stage, version), (buckets, sum_ns, count) in sorted(histograms.items()):
+        labels = _labels(operation=operation, stage=stage, model_version=version)
+        cumulative = 0
+        for bound, bucket in zip(bounds, buckets):
+            cumulative += bucket
+            lines.append(f'{HISTOGRAM_NAME}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{HISTOGRAM_NAME}_sum{{{labels}}} {sum_ns / 1e9:.9f}')
+        lines.append(f'{HISTOGRAM_NAME}_count{{{labels}}} {count}')
+
+    lines += [
+        f'# HELP {COUNTER_NAME} Predicciones por resultado',
+        f'# TYPE {COUNTER_NAME} counter',
+    ]
+    for (operation, version, outcome), value in sorted(counters.items()):
+        lines.append(f'{COUNTER_NAME}{{{_labels(operation=operation, model_version=version, outcome=outcome)}}} {value}')
+
+    lines += [
+        '# HELP cultivai_model_info Modelo en servicio en el worker que respondió',
+        '# TYPE cultivai_model_info gauge',
+    ]
+    for model in models:
+        lines.append(f'cultivai_model_info{{{_labels(**model)}}} 1')
+
+    lines += [
+        '# HELP cultivai_metrics_workers Workers vivos que han reportado métricas',
+        '# TYPE cultivai_metrics_workers gauge',
+        f"cultivai_metrics_workers {sum(1 for snapshot in snapshots if snapshot.get('pid') is not None)}",
+    ]
+    return '\n'.join(lines) + '\n'
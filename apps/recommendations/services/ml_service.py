@@ -1,14 +1,155 @@
+import copy
+import hashlib
 import logging
 import os
+import threading
 import time
-from typing import Dict, List
+from typing import TYPE_CHECKING, Dict, List, Optional
 
 import numpy as np
-import pandas as pd
-from joblib import load
+
+from .compiled_forest import COMPILED_META_FILE, CompiledForest
+from .crop_knowledge import DEFAULT_KNOWLEDGE_PATH, RECOMMENDATION_FIELDS, CropKnowledgeBase
+from .fast_json import validate_input
+from .features import FEATURE_COLUMNS, INPUT_RANGES
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 logger = logging.getLogger('predictions')
 
+# Campos que puede pedir un cliente con fields=; 'success' siempre se incluye
+RESULT_FIELDS = (
+    'predicted_crop', 'predicted_crop_spanish', 'confidence_score', 'confidence_percentage', 'confidence_level',
+    'top_recommendations', 'all_probabilities', 'model_version', 'prediction_time_ms', 'input_data',
+    'recommendations'
+)
+
+# 'recommendations' (textos agronómicos y advertencias) solo se incluye si se pide
+DEFAULT_RESULT_FIELDS = frozenset(RESULT_FIELDS) - {'recommendations'}
+
+# Respuesta compacta (compact=1): solo el cultivo y su confianza
+COMPACT_FIELDS = frozenset({'predicted_crop', 'confidence_score'})
+
+
+def parse_result_fields(fields: Optional[str] = None, compact: Optional[str] = None,
+                        recommendations: Optional[str] = None) -> Optional[frozenset]:
+    """
+    Interpreta las opciones fields=, compact= y recommendations= de la petición
+
+    Returns:
+        frozenset: Campos pedidos, o None para la respuesta completa
+
+    Raises:
+        ValueError: Si se pide un campo desconocido
+    """
+    requested = None
+    if fields:
+        requested = frozenset(field.strip() for field in fields.split(',') if field.strip())
+        unknown = sorted(requested - set(RESULT_FIELDS))
+        if unknown:
+            raise ValueError(f"Campos desconocidos: {', '.join(unknown)}. Disponibles: {', '.join(RESULT_FIELDS)}")
+    elif compact in ('1', 'true', 'True'):
+        requested = COMPACT_FIELDS
+
+    if recommendations in ('1', 'true', 'True'):
+        requested = (requested or DEFAULT_RESULT_FIELDS) | {'recommendations'}
+
+    return requested
+
+
+def _wants_recommendations(fields: Optional[frozenset]) -> bool:
+    return fields is not None and 'recommendations' in fields
+
+
+def _select_fields(result: Dict, fields: Optional[frozenset]) -> Dict:
+    if fields is None:
+        return result
+    return {key: value for key, value in result.items() if key == 'success' or key in fields}
+
+
+def _artifact_signature(paths: List[str]) -> tuple:
+    """Firma barata (mtime, tamaño) de los artefactos para detectar cambios en disco"""
+    signature = []
+    for path in paths:
+        stat = os.stat(path)
+        signature.append((stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+
+def _artifact_version(paths: List[str]) -> str:
+    """Versión del modelo: hash del contenido de los artefactos"""
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, 'rb') as artifact:
+            for chunk in iter(lambda: artifact.read(1 << 20), b''):
+                digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+
+class ModelSlot:
+    """
+    Versión cargada del modelo con todas sus tablas precalculadas
+
+    Un slot no se modifica después de construirse; el servicio lo reemplaza completo
+    al recargar, así cada predicción usa de principio a fin una sola versión.
+
+    Args:
+        model: Estimador sklearn entrenado
+        label_encoder: Encoder de etiquetas
+        translations (dict): Traducciones al español de las clases
+        use_dataframe_input (bool): Usa pd.DataFrame como entrada del modelo
+        version (str): Versión de los artefactos
+        signature (tuple): Firma de los archivos de los que se cargó
+        knowledge_path (str): Archivo de la base de conocimiento de cultivos
+    """
+
+    def __init__(self, model, label_encoder, translations: Dict, use_dataframe_input: bool,
+                 version: str, signature: tuple, knowledge_path: str = DEFAULT_KNOWLEDGE_PATH):
+        self.model = model
+        self.label_encoder = label_encoder
+        self.version = version
+        self.signature = signature
+        self.loaded_at = time.time()
+
+        # Tablas de etiquetas (una entrada por columna de predict_proba)
+        class_names = label_encoder.inverse_transform(model.classes_)
+        self.class_names = [str(name) for name in class_names]
+        self.class_names_spanish = [translations.get(name, name) for name in self.class_names]
+        self.knowledge = CropKnowledgeBase(self.class_names, knowledge_path)
+
+        self.use_dataframe_input = use_dataframe_input
+        self.backend = 'compiled' if isinstance(model, CompiledForest) else 'sklearn'
+        self.inference_model = self._prepare_inference_model()
+
+    def _prepare_inference_model(self):
+        """
+        Prepara el estimador para el camino rápido con arreglos NumPy
+
+        sklearn valida en cada llamada los nombres de columnas (feature_names_in_) y advierte si
+        recibe un arreglo sin nombres. Los nombres se verifican una sola vez aquí contra
+        FEATURE_COLUMNS y se retiran de una copia superficial del modelo (los árboles se comparten),
+        de modo que el orden de columnas del buffer queda garantizado.
+        """
+        feature_names = getattr(self.model, 'feature_names_in_', None)
+
+        if self.use_dataframe_input:
+            return self.model
+
+        if feature_names is not None and list(feature_names) != FEATURE_COLUMNS:
+            logger.warning(
+                f"Columnas del modelo {list(feature_names)} distintas de {FEATURE_COLUMNS}; "
+                "se usa el modo de compatibilidad con DataFrame"
+            )
+            self.use_dataframe_input = True
+            return self.model
+
+        inference_model = copy.copy(self.model)
+        if feature_names is not None:
+            del inference_model.feature_names_in_
+        return inference_model
+
+
 class CropRecommendationService:
     """
     Servicio de recomendaciones de cultivos basado en Machine Learning
@@ -17,17 +158,45 @@ class CropRecommendationService:
     Args:
         model_path (str): Ruta al modelo ML entrenado
         encoder_path (str): Ruta al encoder de etiquetas
+        use_dataframe_input (bool): Usa el modo de compatibilidad con pd.DataFrame en lugar de arreglos NumPy
+        mmap_mode (str): Modo de memory-map de joblib para los arreglos del modelo (por ejemplo 'r')
+        backend (str): 'sklearn' o 'compiled' (bosque exportado con export_forest en compiled_dir)
+        compiled_dir (str): Carpeta del bosque compilado
+        knowledge_path (str): Archivo JSON de la base de conocimiento de cultivos
     """
 
-    def __init__(self, model_path: str, encoder_path: str):
-        self.model = None
-        self.label_encoder = None
-        self.model_loaded = False
-        self.model_version = "1.0"
+    def __init__(self, model_path: str, encoder_path: str, use_dataframe_input: bool = False,
+                 mmap_mode: Optional[str] = None, backend: str = 'sklearn', compiled_dir: Optional[str] = None,
+                 knowledge_path: str = DEFAULT_KNOWLEDGE_PATH):
+        # Versión del modelo en servicio; se reemplaza de forma atómica al recargar
+        self._slot: Optional[ModelSlot] = None
+        self._reload_lock = threading.Lock()
+        self._watcher = None
+        self._watcher_pid = None
+
+        self.use_dataframe_input = use_dataframe_input
+        self._input_buffers = threading.local()
+
+        # Caché opcional de resultados (PredictionCache), asignada por el registro según settings
+        self.prediction_cache = None
+
+        # Agrupador opcional de predicciones concurrentes (PredictionBatcher), asignado por el registro
+        self.batcher = None
+
+        # Malla opcional de probabilidades precalculadas (PredictionGrid), asignada por el registro
+        self.grid = None
+
+        # Histogramas opcionales de latencia por etapa (PredictionMetrics), asignados por el registro
+        self.metrics = None
 
         # Guardar rutas de modelo y encoder
         self.model_path = model_path
         self.encoder_path = encoder_path
+        self.mmap_mode = mmap_mode
+        self.backend = backend
+        self.compiled_dir = compiled_dir
+        self.knowledge_path = knowledge_path
+        self.load_stats = {}
 
         # Diccionario de traducciones
         self.translations = {
@@ -58,7 +227,40 @@ class CropRecommendationService:
         # Cargar modelo al inicializar
         self._load_model()
 
+    @property
+    def model(self):
+        return self._slot.model if self._slot is not None else None
+
+    @property
+    def label_encoder(self):
+        return self._slot.label_encoder if self._slot is not None else None
+
+    @property
+    def model_loaded(self) -> bool:
+        return self._slot is not None
+
+    @property
+    def model_version(self) -> Optional[str]:
+        return self._slot.version if self._slot is not None else None
+
+    @property
+    def class_names(self) -> List[str]:
+        return self._slot.class_names if self._slot is not None else []
+
+    @property
+    def class_names_spanish(self) -> List[str]:
+        return self._slot.class_names_spanish if self._slot is not None else []
+
     def _load_model(self):
+        """Carga el modelo y lo pone en servicio"""
+        slot = self._load_slot()
+        if slot is None:
+            return False
+
+        self._slot = slot
+        return True
+
+    def _load_slot(self) -> Optional[ModelSlot]:
         """Carga el modelo y el label encoder desde archivos joblib"""
         try:
             # Usar los paths proporcionados
@@ -68,138 +270,480 @@ class CropRecommendationService:
             # Verificar que los archivos existen
             if not os.path.exists(model_path):
                 logger.error(f"Modelo no encontrado en: {model_path}")
-                return False
+                return None
 
             if not os.path.exists(encoder_path):
                 logger.error(f"Label encoder no encontrado en: {encoder_path}")
-                return False
+                return None
+
+            # La firma se toma antes de leer: si los archivos cambian durante la carga se recargará otra vez
+            signature = _artifact_signature([model_path, encoder_path])
+            version = _artifact_version([model_path, encoder_path])
+
+            # joblib (y sklearn al deserializar) se importan en la primera carga, no al importar el módulo
+            from joblib import load
 
-            # Cargar modelo y encoder
-            self.model = load(model_path)
-            self.label_encoder = load(encoder_path)
-            self.model_loaded = True
+            # Cargar modelo y encoder; el bosque compilado evita deserializar el modelo sklearn
+            model = self._load_compiled_model(model_path) if self.backend == 'compiled' else None
+            if model is None:
+                model = load(model_path, mmap_mode=self.mmap_mode)
+            label_encoder = load(encoder_path)
+            slot = ModelSlot(
+                model, label_encoder, self.translations, self.use_dataframe_input, version, signature,
+                self.knowledge_path
+            )
 
-            logger.info("Modelo ML cargado exitosamente")
-            return True
+            logger.info(f"Modelo ML cargado exitosamente (versión {version})")
+            return slot
 
         except Exception as e:
             logger.error(f"Error cargando modelo ML: {e}")
-            self.model_loaded = False
-            return False
+            return None
+
+    def _load_compiled_model(self, model_path: str) -> Optional[CompiledForest]:
+        """Carga el bosque compilado si corresponde al modelo actual; None para usar el modelo sklearn"""
+        if not self.compiled_dir or not os.path.exists(os.path.join(self.compiled_dir, COMPILED_META_FILE)):
+            logger.warning(f"Bosque compilado no encontrado en {self.compiled_dir}; se usa el modelo sklearn")
+            return None
+
+        try:
+            forest = CompiledForest(self.compiled_dir, mmap_mode='r')
+        except Exception as e:
+            logger.warning(f"Error cargando bosque compilado: {e}; se usa el modelo sklearn")
+            return None
+
+        if forest.source_version != _artifact_version([model_path]) or forest.feature_names != FEATURE_COLUMNS:
+            logger.warning(
+                "El bosque compilado no corresponde al modelo actual (ejecuta manage.py export_forest); "
+                "se usa el modelo sklearn"
+            )
+            return None
+
+        return forest
+
+    def reload(self, force: bool = False) -> bool:
+        """
+        Carga de nuevo los artefactos y los pone en servicio sin interrumpir predicciones
+
+        Las predicciones en curso terminan con el slot que ya tenían; las nuevas usan el nuevo.
+        Si la carga falla se mantiene la versión actual.
+
+        Args:
+            force (bool): Recarga aunque los archivos no hayan cambiado
+
+        Returns:
+            bool: True si se puso en servicio una nueva versión
+        """
+        with self._reload_lock:
+            current = self._slot
+            try:
+                signature = _artifact_signature([self.model_path, self.encoder_path])
+            except OSError as e:
+                logger.error(f"No se pudo leer los artefactos del modelo: {e}")
+                return False
+
+            if not force and current is not None and current.signature == signature:
+                return False
+
+            slot = self._load_slot()
+            if slot is None:
+                logger.error("Recarga fallida; se mantiene la versión actual del modelo")
+                return False
+
+            self._slot = slot
+
+        previous_version = current.version if current is not None else None
+        logger.info(f"Modelo ML recargado: {previous_version} -> {slot.version}")
+        return True
+
+    def reload_in_background(self, force: bool = True) -> threading.Thread:
+        """Lanza la recarga en un hilo para no bloquear a quien la solicita"""
+        thread = threading.Thread(target=self.reload, kwargs={'force': force}, name='model-reload', daemon=True)
+        thread.start()
+        return thread
+
+    def start_watcher(self, interval: float):
+        """
+        Vigila model_path y encoder_path y recarga el modelo cuando cambian
+
+        Solo se recarga cuando la firma de los archivos se mantiene estable entre dos
+        revisiones, para no cargar un artefacto a medio escribir.
+
+        Args:
+            interval (float): Segundos entre revisiones
+        """
+        if self._watcher is not None and self._watcher.is_alive() and self._watcher_pid == os.getpid():
+            return
+
+        self._watcher_pid = os.getpid()
+        self._watcher = threading.Thread(target=self._watch, args=(interval,), name='model-watcher', daemon=True)
+        self._watcher.start()
+
+    def watcher_running(self) -> bool:
+        """Indica si el vigilante de artefactos corre en este proceso (los hilos no sobreviven a un fork)"""
+        return self._watcher is not None and self._watcher_pid == os.getpid() and self._watcher.is_alive()
+
+    def _watch(self, interval: float):
+        previous_signature = None
+        while True:
+            time.sleep(interval)
+            try:
+                signature = _artifact_signature([self.model_path, self.encoder_path])
+            except OSError:
+                previous_signature = None
+                continue
+
+            current = self._slot
+            changed = current is None or current.signature != signature
+            if changed and signature == previous_signature:
+                self.reload()
+            previous_signature = signature
 
     def is_model_available(self) -> bool:
         """Verifica si el modelo está disponible para predicciones"""
-        return self.model_loaded and self.model is not None and self.label_encoder is not None
+        return self._slot is not None
 
-    def predict_crop(self, data_received: Dict) -> Dict:
+    def predict_crop(self, data_received: Dict, fields: Optional[frozenset] = None, use_grid: bool = False) -> Dict:
         """
         Realiza predicción de cultivo basada en datos de sensores
 
         Args:
             data_received (dict): Datos con keys: N, P, K, temperature, humidity, ph, rainfall
+            fields (frozenset): Campos del resultado a incluir (None = todos); los no pedidos no se calculan
+            use_grid (bool): Acepta una respuesta aproximada de la malla precalculada (ML_GRID) si la
+                celda es confiable; sin esto siempre responde el modelo
 
         Returns:
-            dict: Resultado de la predicción con confianza y recomendaciones
+            dict: Resultado de la predicción con confianza y recomendaciones; si los datos son
+                inválidos, 'error' con el resumen y 'errors' con los mensajes por campo
         """
 
-        if not self.is_model_available():
+        # Toda la predicción usa la misma versión aunque haya una recarga en curso
+        slot = self._slot
+        if slot is None:
             return {
                 'success': False,
                 'errors': 'Modelo ML no disponible',
                 'predicted_crop': None
             }
 
+        # Tiempos por etapa en nanosegundos (perf_counter_ns) para las métricas
+        stages = {}
+        start_ns = time.perf_counter_ns()
         try:
-            start_time = time.time()
-
             # Validar datos de entrada
             validation_result = self._validate_input_data(data_received)
+            checkpoint = time.perf_counter_ns()
+            stages['validation'] = checkpoint - start_ns
             if not validation_result['valid']:
+                self._record_metrics(slot, 'single', stages, start_ns, 'invalid')
+                # Los errores quedan por campo (como los del serializer); el resumen va aparte
                 return {
                     'success': False,
-                    'errors': f"Datos inválidos: {validation_result['errors']}",
+                    'error': 'Datos inválidos',
+                    'errors': validation_result['errors'],
                     'predicted_crop': None
                 }
+            data_received = validation_result['data']
+
+            # Consultar la caché con las entradas redondeadas y la versión servida
+            cache_key = None
+            if self.prediction_cache is not None:
+                cache_key = self.prediction_cache.make_key(data_received, slot.version)
+                cached_result = self.prediction_cache.get(cache_key)
+                now = time.perf_counter_ns()
+                stages['cache'], checkpoint = now - checkpoint, now
+                if cached_result is not None:
+                    self._record_metrics(slot, 'single', stages, start_ns, 'cache_hit')
+                    result = {
+                        **cached_result,
+                        'model_version': slot.version,
+                        'prediction_time_ms': (now - start_ns) // 1_000_000,
+                        'input_data': data_received
+                    }
+                    if _wants_recommendations(fields):
+                        result['recommendations'] = self._recommendation(slot, result, data_received)
+                    return _select_fields(result, fields)
+
+            # La malla solo responde si se pidió, fue construida con esta versión y la celda es confiable
+            probabilities = None
+            if use_grid and self.grid is not None and self.grid.model_version == slot.version:
+                probabilities = self.grid.lookup(data_received)
+                # Un resultado aproximado no se guarda en la caché que comparten las peticiones exactas
+                if probabilities is not None:
+                    cache_key = None
+
+            # Realizar predicción: una sola pasada del bosque, la clase es el argmax
+            if probabilities is None and self.batcher is not None:
+                probabilities = self.batcher.predict_proba(slot, data_received)
+            elif probabilities is None:
+                model_input = self._prepare_model_input(slot, data_received)
+                now = time.perf_counter_ns()
+                stages['input_preparation'], checkpoint = now - checkpoint, now
+                probabilities = slot.inference_model.predict_proba(model_input)[0]
+            now = time.perf_counter_ns()
+            stages['model'], checkpoint = now - checkpoint, now
+
+            # Con caché se calcula el resultado completo para poder guardarlo
+            result = self._build_result(slot, probabilities, fields if cache_key is None else None)
+            crop_spanish = result['predicted_crop_spanish']
+            confidence = result['confidence_score']
+            now = time.perf_counter_ns()
+            stages['label_decoding'], checkpoint = now - checkpoint, now
+
+            if cache_key is not None:
+                self.prediction_cache.set(cache_key, result)
+
+            if _wants_recommendations(fields):
+                result['recommendations'] = self._recommendation(slot, result, data_received)
+
+            result.update({
+                'model_version': slot.version,
+                'prediction_time_ms': (time.perf_counter_ns() - start_ns) // 1_000_000,
+                'input_data': data_received
+            })
+            result = _select_fields(result, fields)
+            stages['response_building'] = time.perf_counter_ns() - checkpoint
+            self._record_metrics(slot, 'single', stages, start_ns, 'success')
 
-            # Preparar datos para el modelo
-            input_df = self._prepare_model_input(data_received)
+            logger.info(f"Predicción exitosa: {crop_spanish} ({confidence:.2%})")
+            return result
 
-            # Realizar predicción
-            prediction = self.model.predict(input_df)[0]
-            probabilities = self.model.predict_proba(input_df)[0]
+        except Exception as e:
+            logger.error(f"Error en predicción: {e}")
+            self._record_metrics(slot, 'single', stages, start_ns, 'error')
+            return {
+                'success': False,
+                'errors': f'Error interno en predicción: {str(e)}',
+                'predicted_crop': None
+            }
 
-            # Obtener nombre del cultivo
-            crop_name = self.label_encoder.inverse_transform([prediction])[0]
-            crop_spanish = self.translations.get(crop_name, crop_name)
+    def _record_metrics(self, slot: ModelSlot, operation: str, stages: Dict[str, int], start_ns: int, outcome: str):
+        """Registra los tiempos por etapa y el total en los histogramas, si están activos"""
+        if self.metrics is None:
+            return
+        stages['total'] = time.perf_counter_ns() - start_ns
+        self.metrics.observe(slot.version, operation, stages, outcome)
 
-            # Calcular confianza y top recomendaciones
-            confidence = float(np.max(probabilities))
-            top_recommendations = self._get_top_recommendations(probabilities)
+    def predict_crops(self, batch: List[Dict], fields: Optional[frozenset] = None) -> Dict:
+        """
+        Realiza predicciones para un lote de muestras con una sola llamada al modelo
 
-            # Tiempo de procesamiento
-            prediction_time = int((time.time() - start_time) * 1000)
+        Las filas inválidas se reportan junto a las exitosas sin hacer fallar el lote, con los
+        errores por campo que daría el endpoint de una muestra.
+
+        Args:
+            batch (list): Lista de diccionarios con keys: N, P, K, temperature, humidity, ph, rainfall
+            fields (frozenset): Campos de cada resultado a incluir (None = todos)
+
+        Returns:
+            dict: Resultados por fila (en el mismo orden de entrada) y resumen del lote
+        """
+
+        slot = self._slot
+        if slot is None:
+            return {
+                'success': False,
+                'errors': 'Modelo ML no disponible',
+                'results': []
+            }
 
-            result = {
+        stages = {}
+        start_ns = time.perf_counter_ns()
+        try:
+            results = [None] * len(batch)
+            valid_indices, batch_errors, batch = self._validate_batch(batch)
+            for i, errors in batch_errors.items():
+                results[i] = {
+                    'index': i,
+                    'success': False,
+                    'errors': errors,
+                    'predicted_crop': None
+                }
+            checkpoint = time.perf_counter_ns()
+            stages['validation'] = checkpoint - start_ns
+
+            if valid_indices:
+                # Una sola matriz y una sola pasada del modelo para todas las filas válidas
+                model_input = self._prepare_batch_input(slot, [batch[i] for i in valid_indices])
+                now = time.perf_counter_ns()
+                stages['input_preparation'], checkpoint = now - checkpoint, now
+
+                probabilities = slot.inference_model.predict_proba(model_input)
+                now = time.perf_counter_ns()
+                stages['model'], checkpoint = now - checkpoint, now
+
+                # Textos y advertencias de todo el lote con operaciones de arreglos
+                recommendations = None
+                if _wants_recommendations(fields):
+                    recommendations = slot.knowledge.recommendations(
+                        np.argmax(probabilities, axis=1), np.asarray(model_input, dtype=np.float64)
+                    )
+
+                for row, i in enumerate(valid_indices):
+                    result = self._build_result(slot, probabilities[row], fields)
+                    result['input_data'] = batch[i]
+                    if recommendations is not None:
+                        result['recommendations'] = recommendations[row]
+                    results[i] = {'index': i, **_select_fields(result, fields)}
+                now = time.perf_counter_ns()
+                stages['label_decoding'], checkpoint = now - checkpoint, now
+
+            response = {
                 'success': True,
-                'predicted_crop': crop_name,
-                'predicted_crop_spanish': crop_spanish,
-                'confidence_score': confidence,
-                'confidence_percentage': round(confidence * 100, 1),
-                'confidence_level': self._get_confidence_level(confidence),
-                'top_recommendations': top_recommendations,
-                'all_probabilities': self._get_all_probabilities(probabilities),
-                'model_version': self.model_version,
-                'prediction_time_ms': prediction_time,
-                'input_data': data_received
+                'total': len(batch),
+                'successful': len(valid_indices),
+                'failed': len(batch) - len(valid_indices),
+                'model_version': slot.version,
+                'prediction_time_ms': (time.perf_counter_ns() - start_ns) // 1_000_000,
+                'results': results
             }
+            stages['response_building'] = time.perf_counter_ns() - checkpoint
+            self._record_metrics(slot, 'batch', stages, start_ns, 'success' if valid_indices else 'invalid')
 
-            logger.info(f"Predicción exitosa: {crop_spanish} ({confidence:.2%})")
-            return result
+            logger.info(f"Predicción por lote: {len(valid_indices)}/{len(batch)} filas válidas")
+            return response
 
         except Exception as e:
-            logger.error(f"Error en predicción: {e}")
+            logger.error(f"Error en predicción por lote: {e}")
+            self._record_metrics(slot, 'batch', stages, start_ns, 'error')
             return {
                 'success': False,
                 'errors': f'Error interno en predicción: {str(e)}',
-                'predicted_crop': None
+                'results': []
             }
 
-    def _validate_input_data(self, data: Dict) -> Dict:
-        """Valida que los datos de entrada estén completos y en rangos válidos"""
-
-        errors = []
-        required_fields = ['N', 'P', 'K', 'temperature', 'humidity', 'ph', 'rainfall']
-
-        # Verificar campos requeridos
-        for field in required_fields:
-            if field not in data or data[field] is None:
-                errors.append(f"Campo requerido faltante: {field}")
-
-        if errors:
-            return {'valid': False, 'errors': errors}
-
-        # Validar rangos (basados en el dataset original)
-        ranges = {
-            'N': (0, 140, 'Nitrógeno'),
-            'P': (5, 145, 'Fósforo'),
-            'K': (5, 205, 'Potasio'),
-            'temperature': (8.83, 43.7, 'Temperatura'),
-            'humidity': (14.3, 100, 'Humedad'),
-            'ph': (3.5, 9.94, 'pH'),
-            'rainfall': (0, 299, 'Precipitación')
+    def _build_result(self, slot: ModelSlot, probabilities: np.ndarray, fields: Optional[frozenset] = None) -> Dict:
+        """
+        Construye el resultado de una predicción a partir de sus probabilidades
+
+        top_recommendations y all_probabilities solo se calculan si están en fields (o si fields es None).
+        """
+
+        # La clase predicha es la de mayor probabilidad (equivalente a model.predict)
+        prediction = int(np.argmax(probabilities))
+
+        # Calcular confianza y top recomendaciones
+        confidence = float(probabilities[prediction])
+
+        result = {
+            'success': True,
+            'predicted_crop': slot.class_names[prediction],
+            'predicted_crop_spanish': slot.class_names_spanish[prediction],
+            'confidence_score': confidence,
+            'confidence_percentage': round(confidence * 100, 1),
+            'confidence_level': self._get_confidence_level(confidence)
         }
+        if fields is None or 'top_recommendations' in fields:
+            result['top_recommendations'] = self._get_top_recommendations(slot, probabilities)
+        if fields is None or 'all_probabilities' in fields:
+            result['all_probabilities'] = self._get_all_probabilities(slot, probabilities)
+        return result
+
+    def _validate_batch(self, batch: List) -> tuple:
+        """
+        Valida cada fila de un lote con las reglas de CropInputSerializer
+
+        Returns:
+            tuple: (índices válidos, errores por campo de cada fila inválida, filas convertidas a float;
+            las inválidas quedan como llegaron)
+        """
+        valid_indices, errors_by_index, rows = [], {}, list(batch)
+        for i, data_received in enumerate(batch):
+            if not isinstance(data_received, dict):
+                errors_by_index[i] = {'non_field_errors': ['Cada muestra debe ser un objeto']}
+                continue
+
+            data, errors = validate_input(data_received)
+            if errors:
+                errors_by_index[i] = errors
+            else:
+                valid_indices.append(i)
+                rows[i] = data
+        return valid_indices, errors_by_index, rows
+
+    def predict_proba_matrix(self, batch: List[Dict]) -> Dict:
+        """
+        Probabilidades de un lote como matriz, para clientes masivos (salida binaria o de arreglos)
+
+        Returns:
+            dict: success, model_version, classes (orden de las columnas), probabilities
+            (np.ndarray float64 de forma (len(batch), clases), filas inválidas en NaN) y errors por índice;
+            los valores son los mismos que all_probabilities, la reducción a float32 es solo de la salida binaria
+        """
+        slot = self._slot
+        if slot is None:
+            return {'success': False, 'errors': 'Modelo ML no disponible'}
+
+        try:
+            valid_indices, errors_by_index, batch = self._validate_batch(batch)
+            probabilities = np.full((len(batch), len(slot.class_names)), np.nan, dtype=np.float64)
+            if valid_indices:
+                model_input = self._prepare_batch_input(slot, [batch[i] for i in valid_indices])
+                probabilities[valid_indices] = slot.inference_model.predict_proba(model_input)
+
+            return {
+                'success': True,
+                'model_version': slot.version,
+                'classes': slot.class_names,
+                'probabilities': probabilities,
+                'errors': errors_by_index
+            }
+
+        except Exception as e:
+            logger.error(f"Error en predicción por lote: {e}")
+            return {'success': False, 'errors': f'Error interno en predicción: {str(e)}'}
+
+    def _validate_input_data(self, data: Dict) -> Dict:
+        """
+        Valida que los datos de entrada estén completos y en rangos válidos
+
+        Returns:
+            dict: valid, errors (por campo) y data (valores convertidos a float si es válido)
+        """
+        if not isinstance(data, dict):
+            return {'valid': False, 'errors': {'non_field_errors': ['La muestra debe ser un objeto']}, 'data': None}
+
+        values, errors = validate_input(data)
+        return {'valid': errors is None, 'errors': errors or {}, 'data': values if errors is None else None}
+
+    def _prepare_model_input(self, slot: ModelSlot, data_received: Dict):
+        """
+        Prepara los datos en el formato esperado por el modelo
 
-        for field, (min_val, max_val, name) in ranges.items():
-            value = data[field]
-            if not isinstance(value, (int, float)):
-                errors.append(f"{name} debe ser numérico")
-            elif value < min_val or value > max_val:
-                errors.append(f"{name}: valor {value} fuera del rango [{min_val}, {max_val}]")
+        En el modo rápido llena un buffer float64 preasignado (uno por hilo) en el orden
+        de FEATURE_COLUMNS; sklearn lo copia al convertirlo, así que puede reutilizarse.
+        """
+
+        if slot.use_dataframe_input:
+            return self._prepare_dataframe_input(data_received)
+
+        buffer = getattr(self._input_buffers, 'row', None)
+        if buffer is None:
+            buffer = self._input_buffers.row = np.empty((1, len(FEATURE_COLUMNS)), dtype=np.float64)
+
+        row = buffer[0]
+        for i, column in enumerate(FEATURE_COLUMNS):
+            row[i] = data_received[column]
+
+        return buffer
+
+    def _prepare_batch_input(self, slot: ModelSlot, batch: List[Dict]):
+        """Prepara una matriz con una fila por muestra en el orden de FEATURE_COLUMNS"""
 
-        return {'valid': len(errors) == 0, 'errors': errors}
+        matrix = np.array(
+            [[data_received[column] for column in FEATURE_COLUMNS] for data_received in batch],
+            dtype=np.float64
+        )
 
-    def _prepare_model_input(self, data_received: Dict) -> pd.DataFrame:
-        """Prepara los datos en el formato esperado por el modelo"""
+        if slot.use_dataframe_input:
+            import pandas as pd
+            return pd.DataFrame(matrix, columns=FEATURE_COLUMNS)
+        return matrix
+
+    def _prepare_dataframe_input(self, data_received: Dict) -> 'pd.DataFrame':
+        """Prepara los datos como pd.DataFrame (modo de compatibilidad)"""
+        import pandas as pd
 
         input_data = [
             data_received['N'],
@@ -211,41 +755,34 @@ class CropRecommendationService:
             data_received['rainfall']
         ]
 
-        columns = ['N', 'P', 'K', 'temperature', 'humidity', 'ph', 'rainfall']
-
-        return pd.DataFrame([input_data], columns=columns)
+        return pd.DataFrame([input_data], columns=FEATURE_COLUMNS)
 
-    def _get_top_recommendations(self, probabilities: np.ndarray, top_n: int = 3) -> List[Dict]:
+    def _get_top_recommendations(self, slot: ModelSlot, probabilities: np.ndarray, top_n: int = 3) -> List[Dict]:
         """Obtiene las top N recomendaciones con sus probabilidades"""
 
-        # Obtener índices ordenados por probabilidad descendente
-        top_indices = np.argsort(probabilities)[::-1][:top_n]
+        # Seleccionar las top N sin ordenar todo el vector y ordenar solo esas
+        top_n = min(top_n, len(probabilities))
+        top_indices = np.argpartition(probabilities, -top_n)[-top_n:]
+        top_indices = top_indices[np.argsort(-probabilities[top_indices], kind='stable')]
 
         recommendations = []
         for i, idx in enumerate(top_indices):
-            crop_name = self.label_encoder.inverse_transform([idx])[0]
-            crop_spanish = self.translations.get(crop_name, crop_name)
             probability = float(probabilities[idx])
 
             recommendations.append({
                 'rank': i + 1,
-                'crop': crop_name,
-                'crop_spanish': crop_spanish,
+                'crop': slot.class_names[idx],
+                'crop_spanish': slot.class_names_spanish[idx],
                 'probability': probability,
                 'percentage': round(probability * 100, 1)
             })
 
         return recommendations
 
-    def _get_all_probabilities(self, probabilities: np.ndarray) -> Dict:
+    def _get_all_probabilities(self, slot: ModelSlot, probabilities: np.ndarray) -> Dict:
         """Convierte todas las probabilidades en un diccionario"""
 
-        all_probs = {}
-        for i, prob in enumerate(probabilities):
-            crop_name = self.label_encoder.inverse_transform([i])[0]
-            all_probs[crop_name] = float(prob)
-
-        return all_probs
+        return dict(zip(slot.class_names, probabilities.tolist()))
 
     def _get_confidence_level(self, confidence: float) -> str:
         """Categoriza el nivel de confianza"""
@@ -269,69 +806,12 @@ class CropRecommendationService:
         Returns:
             dict: Recomendaciones textuales
         """
+        slot = self._slot
+        if slot is None:
+            return dict.fromkeys(RECOMMENDATION_FIELDS, '')
 
-        recommendations = {
-            'planting_season': '',
-            'irrigation_recommendation': '',
-            'fertilization_recommendation': '',
-            'pest_control_tips': '',
-            'expected_yield': '',
-            'growth_duration': '',
-            'soil_warnings': '',
-            'climate_warnings': ''
-        }
+        return slot.knowledge.recommendation(slot.knowledge.class_index.get(crop_name), data_recived)
 
-        # Base de conocimiento simple para cultivos comunes
-        crop_info = {
-            'rice': {
-                'planting_season': 'Época de lluvias (junio-julio)',
-                'irrigation_recommendation': 'Mantener suelo inundado durante crecimiento',
-                'fertilization_recommendation': 'Aplicar nitrógeno en 3 etapas',
-                'growth_duration': '120-150 días',
-                'expected_yield': '4-6 toneladas/hectárea'
-            },
-            'maize': {
-                'planting_season': 'Inicio de temporada de lluvias',
-                'irrigation_recommendation': 'Riego regular, evitar encharcamiento',
-                'fertilization_recommendation': 'NPK 20-10-10 al momento de siembra',
-                'growth_duration': '90-120 días',
-                'expected_yield': '3-5 toneladas/hectárea'
-            },
-            'cotton': {
-                'planting_season': 'Abril-mayo',
-                'irrigation_recommendation': 'Riego por goteo recomendado',
-                'fertilization_recommendation': 'Alto requerimiento de potasio',
-                'growth_duration': '180-200 días',
-                'expected_yield': '1-2 toneladas/hectárea'
-            }
-        }
-
-        if crop_name in crop_info:
-            recommendations.update(crop_info[crop_name])
-
-        # Advertencias basadas en condiciones actuales
-        temp = data_recived.get('temperature', 25)
-        humidity = data_recived.get('humidity', 50)
-        ph = data_recived.get('ph', 7)
-
-        warnings = []
-
-        if temp > 35:
-            warnings.append("Temperatura alta - considerar sombra o riego adicional")
-        elif temp < 15:
-            warnings.append("Temperatura baja - puede retrasar germinación")
-
-        if humidity > 80:
-            warnings.append("Humedad alta - riesgo de enfermedades fúngicas")
-        elif humidity < 30:
-            warnings.append("Humedad baja - aumentar frecuencia de riego")
-
-        if ph < 6:
-            warnings.append("Suelo ácido - considerar aplicar cal")
-        elif ph > 8:
-            warnings.append("Suelo alcalino - añadir materia orgánica")
-
-        if warnings:
-            recommendations['climate_warnings'] = '; '.join(warnings)
-
-        return recommendations
+    def _recommendation(self, slot: ModelSlot, result: Dict, data_received: Dict) -> Dict:
+        """Recomendaciones del cultivo predicho en un resultado"""
+        return slot.knowledge.recommendation(slot.knowledge.class_index[result['predicted_crop']], data_received)
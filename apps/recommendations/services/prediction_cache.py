@@ -0,0 +1,141 @@
+import copy
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Union
+
+from .features import FEATURE_COLUMNS
+
+logger = logging.getLogger('predictions')
+
+
+class PredictionCache:
+    """
+    Caché LRU en proceso de resultados de predicción con TTL
+
+    La clave son las siete entradas redondeadas a la precisión configurada más la versión
+    del modelo, así lecturas casi idénticas de una estación comparten resultado y una
+    recarga del modelo invalida todo lo anterior. Opcionalmente usa el framework de caché
+    de Django como segundo nivel para compartir aciertos entre workers.
+
+    Los resultados se copian a fondo al guardarlos y al devolverlos: quien modifique un
+    resultado (listas o diccionarios anidados incluidos) no altera los aciertos siguientes.
+
+    Args:
+        max_entries (int): Número máximo de resultados en memoria (se expulsa el menos usado)
+        ttl (float): Segundos que un resultado sigue siendo válido
+        precision (int | dict): Decimales de redondeo, global o por característica
+        django_cache_alias (str): Alias de settings.CACHES para el segundo nivel (None lo desactiva)
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 300,
+                 precision: Union[int, Dict[str, int]] = 1, django_cache_alias: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        if isinstance(precision, dict):
+            self.precisions = [precision.get(column, 1) for column in FEATURE_COLUMNS]
+        else:
+            self.precisions = [precision] * len(FEATURE_COLUMNS)
+        self.django_cache_alias = django_cache_alias
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def make_key(self, data: Dict, model_version: str) -> tuple:
+        """Clave de caché: entradas redondeadas y versión del modelo"""
+        return (model_version,) + tuple(
+            round(float(data[column]), digits) for column, digits in zip(FEATURE_COLUMNS, self.precisions)
+        )
+
+    def get(self, key: tuple) -> Optional[Dict]:
+        """Devuelve el resultado guardado para la clave o None si no está o expiró"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, result = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return copy.deepcopy(result)
+
+                del self._entries[key]
+                self.expirations += 1
+
+        # La caché de Django ya devuelve una copia nueva (serializada) en cada lectura
+        result = self._shared_get(key)
+        if result is not None:
+            self._store(key, copy.deepcopy(result), now)
+            with self._lock:
+                self.shared_hits += 1
+            return result
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key: tuple, result: Dict):
+        """Guarda una copia del resultado en memoria y, si está configurado, en la caché de Django"""
+        self._store(key, copy.deepcopy(result), time.monotonic())
+        self._shared_set(key, result)
+
+    def _store(self, key: tuple, result: Dict, now: float):
+        with self._lock:
+            self._entries[key] = (now + self.ttl, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def _shared_key(self, key: tuple) -> str:
+        return 'prediction:' + ':'.join(str(part) for part in key)
+
+    def _shared_get(self, key: tuple) -> Optional[Dict]:
+        if self.django_cache_alias is None:
+            return None
+
+        from django.core.cache import caches
+        try:
+            return caches[self.django_cache_alias].get(self._shared_key(key))
+        except Exception as e:
+            logger.warning(f"Caché compartida no disponible: {e}")
+            return None
+
+    def _shared_set(self, key: tuple, result: Dict):
+        if self.django_cache_alias is None:
+            return
+
+        from django.core.cache import caches
+        try:
+            caches[self.django_cache_alias].set(self._shared_key(key), result, timeout=self.ttl)
+        except Exception as e:
+            logger.warning(f"Caché compartida no disponible: {e}")
+
+    def clear(self):
+        """Vacía la caché en memoria (la de Django expira sola por TTL y versión)"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        """Contadores de aciertos, fallos y expulsiones para ajustar la precisión"""
+        with self._lock:
+            lookups = self.hits + self.shared_hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'precision': dict(zip(FEATURE_COLUMNS, self.precisions)),
+                'hits': self.hits,
+                'shared_hits': self.shared_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'hit_rate': round((self.hits + self.shared_hits) / lookups, 4) if lookups else 0.0
+            }
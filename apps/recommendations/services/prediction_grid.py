@@ -0,0 +1,266 @@
+import itertools
+import json
+import logging
+import os
+from typing import Callable, Dict, List, Optional, Union
+
+import numpy as np
+
+logger = logging.getLogger('predictions')
+
+GRID_META_FILE = 'meta.json'
+# 2: la confiabilidad de cada celda se mide contra el modelo en puntos interiores
+GRID_FORMAT_VERSION = 2
+
+# Las probabilidades se guardan cuantizadas en uint8 (error máximo 1/510 por clase)
+_QUANTIZATION = 255
+
+# Vértices precalculados por llamada a predict_proba al construir la malla
+_BUILD_CHUNK_ROWS = 65536
+
+# Celdas verificadas por bloque (cada una aporta samples_per_cell filas a predict_proba)
+_VERIFY_CHUNK_CELLS = 4096
+
+
+def _corner_offsets(n_features: int) -> np.ndarray:
+    """Desplazamientos de los 2^d vértices de una celda"""
+    return np.array(list(itertools.product((0, 1), repeat=n_features)), dtype=np.intp)
+
+
+def _estimate(probabilities: np.ndarray, cells: np.ndarray, fractions: np.ndarray, interpolate: bool) -> np.ndarray:
+    """
+    Probabilidades según la malla para varios puntos
+
+    Args:
+        probabilities (np.ndarray): Probabilidades cuantizadas por vértice (ejes..., clases)
+        cells (np.ndarray): Celda de cada punto (puntos x características)
+        fractions (np.ndarray): Posición dentro de la celda, en [0, 1] por eje
+        interpolate (bool): Interpolación multilineal o vértice más cercano
+
+    Returns:
+        np.ndarray: Matriz (puntos x clases) normalizada por fila
+    """
+    if interpolate:
+        offsets = _corner_offsets(cells.shape[1])
+        corners = cells[:, None, :] + offsets[None, :, :]
+        weights = np.where(offsets[None, :, :], fractions[:, None, :], 1.0 - fractions[:, None, :]).prod(axis=2)
+        values = probabilities[tuple(np.moveaxis(corners, -1, 0))].astype(np.float64)
+        estimate = np.einsum('pk,pkc->pc', weights, values)
+    else:
+        nearest = np.rint(cells + fractions).astype(np.intp)
+        estimate = probabilities[tuple(nearest.T)].astype(np.float64)
+    return estimate / estimate.sum(axis=1, keepdims=True)
+
+
+def build_grid(predict_proba: Callable, directory: str, ranges: Dict[str, tuple], points: Union[int, Dict[str, int]],
+               n_classes: int, max_error: float, model_version: Optional[str] = None, interpolate: bool = True,
+               samples_per_cell: int = 4, seed: int = 0, validation_points: Optional[np.ndarray] = None) -> Dict:
+    """
+    Precalcula las probabilidades del modelo en una malla regular sobre la caja de entrada
+
+    Además de las probabilidades en cada vértice se marca, por celda, si la malla es
+    confiable. Primero se descartan las celdas cuyos vértices no predicen la misma clase;
+    en las demás se compara la malla con el modelo en el centro de la celda y en
+    samples_per_cell - 1 puntos interiores al azar, y la celda solo es confiable si el
+    error absoluto de todas las probabilidades en esos puntos es a lo sumo max_error.
+    Es una cota medida, no garantizada: un cambio del bosque entre los puntos muestreados
+    no se detecta. Por eso también se pueden pasar puntos reales (por ejemplo, el dataset de
+    referencia): una celda que contenga alguno con error mayor a max_error deja de ser confiable.
+    Las celdas no confiables se resuelven con el modelo.
+
+    Args:
+        predict_proba (callable): predict_proba del modelo, recibe una matriz en el orden de ranges
+        directory (str): Carpeta de salida
+        ranges (dict): (mínimo, máximo, ...) de cada característica, en el orden de entrada del modelo
+        points (int | dict): Vértices por eje, global o por característica
+        n_classes (int): Columnas de predict_proba
+        max_error (float): Error absoluto máximo de probabilidad medido en los puntos interiores
+        model_version (str): Versión del modelo con el que se construye
+        interpolate (bool): Modo de consulta con el que se mide el error (el mismo que usará lookup)
+        samples_per_cell (int): Puntos interiores comparados con el modelo por celda (al menos 1: el centro)
+        seed (int): Semilla de los puntos interiores al azar
+        validation_points (np.ndarray): Puntos adicionales (filas x características) comparados con el modelo
+
+    Returns:
+        dict: Metadatos de la malla
+    """
+    features = list(ranges)
+    shape = tuple(points[feature] if isinstance(points, dict) else points for feature in features)
+    if min(shape) < 2:
+        raise ValueError('Cada eje necesita al menos 2 vértices')
+    if samples_per_cell < 1:
+        raise ValueError('samples_per_cell debe ser al menos 1')
+
+    axes = [np.linspace(ranges[feature][0], ranges[feature][1], n) for feature, n in zip(features, shape)]
+    n_vertices = int(np.prod(shape))
+
+    os.makedirs(directory, exist_ok=True)
+    probabilities = np.lib.format.open_memmap(
+        os.path.join(directory, 'probabilities.npy'), mode='w+', dtype=np.uint8, shape=shape + (n_classes,)
+    )
+    flat_probabilities = probabilities.reshape(n_vertices, n_classes)
+    top_class = np.empty(n_vertices, dtype=np.int16)
+    top_probability = np.empty(n_vertices, dtype=np.float64)
+
+    for start in range(0, n_vertices, _BUILD_CHUNK_ROWS):
+        indices = np.unravel_index(np.arange(start, min(start + _BUILD_CHUNK_ROWS, n_vertices)), shape)
+        vertices = np.column_stack([axis[index] for axis, index in zip(axes, indices)])
+        chunk = predict_proba(vertices)
+
+        end = start + len(chunk)
+        flat_probabilities[start:end] = np.rint(chunk * _QUANTIZATION)
+        top_class[start:end] = np.argmax(chunk, axis=1)
+        top_probability[start:end] = chunk[np.arange(len(chunk)), top_class[start:end]]
+
+    probabilities.flush()
+    del flat_probabilities
+
+    # Descarte barato: celdas cuyos 2^d vértices no predicen la misma clase
+    top_class = top_class.reshape(shape)
+    cell_shape = tuple(n - 1 for n in shape)
+    base = tuple(slice(0, n) for n in cell_shape)
+
+    reliable = np.ones(cell_shape, dtype=bool)
+    for offset in itertools.product((0, 1), repeat=len(shape)):
+        corner = tuple(slice(o, o + n) for o, n in zip(offset, cell_shape))
+        reliable &= top_class[corner] == top_class[base]
+    candidates = int(reliable.sum())
+
+    # Error medido contra el modelo en puntos interiores de cada celda candidata
+    lower = np.array([axis[0] for axis in axes], dtype=np.float64)
+    step = np.array([axis[1] - axis[0] for axis in axes], dtype=np.float64)
+    rng = np.random.default_rng(seed)
+    flat_reliable = reliable.reshape(-1)
+    measured_error = 0.0
+    candidate_ids = np.flatnonzero(flat_reliable)
+    for start in range(0, len(candidate_ids), _VERIFY_CHUNK_CELLS):
+        ids = candidate_ids[start:start + _VERIFY_CHUNK_CELLS]
+        cells = np.column_stack(np.unravel_index(ids, cell_shape))
+        fractions = np.concatenate([
+            np.full((1, len(ids), len(shape)), 0.5),
+            rng.random((samples_per_cell - 1, len(ids), len(shape)))
+        ]).reshape(-1, len(shape))
+        cells = np.tile(cells, (samples_per_cell, 1))
+
+        expected = predict_proba(lower + (cells + fractions) * step)
+        errors = np.abs(_estimate(probabilities, cells, fractions, interpolate) - expected).max(axis=1)
+        cell_errors = errors.reshape(samples_per_cell, len(ids)).max(axis=0)
+
+        accepted = cell_errors <= max_error
+        flat_reliable[ids[~accepted]] = False
+        if accepted.any():
+            measured_error = max(measured_error, float(cell_errors[accepted].max()))
+
+    # Puntos reales: una celda con algún punto fuera de la tolerancia deja de ser confiable
+    if validation_points is not None and len(validation_points):
+        position = (np.asarray(validation_points, dtype=np.float64) - lower) / step
+        inside = np.all((position >= 0) & (position <= np.array(shape) - 1), axis=1)
+        position = position[inside]
+        cells = np.minimum(position.astype(np.intp), np.array(cell_shape) - 1)
+        ids = np.ravel_multi_index(tuple(cells.T), cell_shape)
+        checked = flat_reliable[ids]
+        if checked.any():
+            cells, ids, position = cells[checked], ids[checked], position[checked]
+            expected = predict_proba(lower + position * step)
+            errors = np.abs(_estimate(probabilities, cells, position - cells, interpolate) - expected).max(axis=1)
+            flat_reliable[ids[errors > max_error]] = False
+            kept = flat_reliable[ids]
+            if kept.any():
+                measured_error = max(measured_error, float(errors[kept].max()))
+
+    del probabilities
+    np.save(os.path.join(directory, 'reliable.npy'), reliable)
+
+    meta = {
+        'format_version': GRID_FORMAT_VERSION,
+        'features': features,
+        'axes': {feature: [float(axis[0]), float(axis[-1]), len(axis)] for feature, axis in zip(features, axes)},
+        'n_classes': n_classes,
+        'max_error': max_error,
+        'interpolate': interpolate,
+        'samples_per_cell': samples_per_cell,
+        'model_version': model_version,
+        'candidate_fraction': round(candidates / reliable.size, 4),
+        'reliable_fraction': round(float(reliable.mean()), 4),
+        'measured_max_error': round(measured_error, 4),
+    }
+    # Los metadatos se escriben al final: sin ellos la malla no se considera completa
+    with open(os.path.join(directory, GRID_META_FILE), 'w') as meta_file:
+        json.dump(meta, meta_file, indent=2)
+
+    return meta
+
+
+class PredictionGrid:
+    """
+    Consulta O(1) de probabilidades precalculadas con build_grid
+
+    lookup() ubica la celda de la muestra y, si es confiable, devuelve las probabilidades
+    del vértice más cercano o interpoladas (multilineal) entre los vértices de la celda.
+    Devuelve None cuando hay que usar el modelo.
+
+    Args:
+        directory (str): Carpeta de la malla
+        interpolate (bool): Interpola entre vértices en lugar de usar el más cercano (por defecto,
+            el modo con el que se midió el error al construirla)
+        mmap_mode (str): Modo de np.load; 'r' mapea la malla sin leerla completa a memoria
+    """
+
+    def __init__(self, directory: str, interpolate: Optional[bool] = None, mmap_mode: Optional[str] = 'r'):
+        with open(os.path.join(directory, GRID_META_FILE)) as meta_file:
+            self.meta = json.load(meta_file)
+
+        if self.meta.get('format_version') != GRID_FORMAT_VERSION:
+            raise ValueError(f"Formato de malla no soportado: {self.meta.get('format_version')}")
+
+        if interpolate is None:
+            interpolate = self.meta['interpolate']
+        elif interpolate != self.meta['interpolate']:
+            logger.warning(
+                f"La malla en {directory} se verificó con interpolate={self.meta['interpolate']}; "
+                f"con interpolate={interpolate} su error no está medido"
+            )
+
+        self.directory = directory
+        self.interpolate = interpolate
+        self.features: List[str] = self.meta['features']
+        self.model_version = self.meta.get('model_version')
+        self.probabilities = np.load(os.path.join(directory, 'probabilities.npy'), mmap_mode=mmap_mode)
+        self.reliable = np.load(os.path.join(directory, 'reliable.npy'), mmap_mode=mmap_mode)
+
+        axes = [self.meta['axes'][feature] for feature in self.features]
+        self._lower = np.array([axis[0] for axis in axes], dtype=np.float64)
+        self._points = np.array([axis[2] for axis in axes], dtype=np.intp)
+        self._step = (np.array([axis[1] for axis in axes], dtype=np.float64) - self._lower) / (self._points - 1)
+
+        self.hits = 0
+        self.fallbacks = 0
+
+    def lookup(self, data_received: Dict) -> Optional[np.ndarray]:
+        """Probabilidades de la muestra según la malla, o None si debe resolverla el modelo"""
+        position = (np.array([data_received[feature] for feature in self.features], dtype=np.float64)
+                    - self._lower) / self._step
+
+        if np.any(position < 0) or np.any(position > self._points - 1):
+            self.fallbacks += 1
+            return None
+
+        cell = np.minimum(position.astype(np.intp), self._points - 2)
+        if not self.reliable[tuple(cell)]:
+            self.fallbacks += 1
+            return None
+
+        self.hits += 1
+        return _estimate(self.probabilities, cell[None, :], (position - cell)[None, :], self.interpolate)[0]
+
+    def stats(self) -> Dict:
+        """Consultas resueltas por la malla y derivadas al modelo en este proceso"""
+        total = self.hits + self.fallbacks
+        return {
+            'interpolate': self.interpolate,
+            'reliable_fraction': self.meta.get('reliable_fraction'),
+            'measured_max_error': self.meta.get('measured_max_error'),
+            'hits': self.hits,
+            'fallbacks': self.fallbacks,
+            'hit_rate': round(self.hits / total, 4) if total else 0.0
+        }
@@ -0,0 +1,286 @@
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+import numpy as np
+
+from .features import FEATURE_COLUMNS
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+logger = logging.getLogger('analytics')
+
+DATASET_META_FILE = 'meta.json'
+DATASET_FORMAT_VERSION = 1
+LABEL_CODES_FILE = 'label_codes.npy'
+
+# Filas leídas del CSV por bloque al convertir (la memoria no depende del tamaño del archivo)
+CONVERT_CHUNK_SIZE = 200_000
+
+
+def source_signature(csv_path: str) -> List[int]:
+    """Firma (mtime, tamaño) del CSV de origen; cambia cuando el archivo cambia"""
+    stat = os.stat(csv_path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def _column_file(column: str) -> str:
+    return f'{column}.npy'
+
+
+@contextmanager
+def _conversion_lock(directory: str):
+    """
+    Lock de archivo junto a la carpeta de salida: una sola conversión a la vez entre procesos
+
+    Sin fcntl (Windows) no se bloquea; el renombrado final sigue sin dejar conversiones a medias.
+    """
+    try:
+        import fcntl
+    except ImportError:
+        fcntl = None
+
+    directory = os.path.abspath(directory)
+    parent = os.path.dirname(directory)
+    os.makedirs(parent, exist_ok=True)
+    with open(os.path.join(parent, f'.{os.path.basename(directory)}.lock'), 'a') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def convert_dataset(csv_path: str, directory: str, label_column: str = 'label',
+                    chunk_size: int = CONVERT_CHUNK_SIZE, force: bool = True) -> Dict:
+    """
+    Convierte el CSV de referencia a formato columnar: un .npy float64 por característica
+    y la etiqueta como arreglo de códigos enteros más la lista de cultivos en meta.json
+
+    Se lee por bloques en dos pasadas (contar filas y luego llenar los .npy preasignados),
+    así que la memoria no crece con el tamaño del CSV. La carpeta nueva se escribe aparte y
+    se pone en su lugar con un renombrado, así que los workers nunca ven una conversión a medias.
+    Las conversiones a la misma carpeta se serializan con un lock de archivo.
+
+    Args:
+        force (bool): Convierte aunque la carpeta ya esté al día; con False, un worker que esperó
+            el lock reutiliza la conversión que otro acaba de terminar
+
+    Returns:
+        dict: Metadatos escritos (rows, columns, label_classes, source_signature)
+    """
+    with _conversion_lock(directory):
+        signature = source_signature(csv_path)
+        if not force:
+            current = _open_if_current(directory, signature)
+            if current is not None:
+                return current.meta
+        return _write_dataset(csv_path, directory, signature, label_column, chunk_size)
+
+
+def _write_dataset(csv_path: str, directory: str, signature: List[int], label_column: str,
+                   chunk_size: int) -> Dict:
+    import pandas as pd
+
+    rows = sum(len(chunk) for chunk in pd.read_csv(csv_path, usecols=[label_column], chunksize=chunk_size))
+
+    parent = os.path.dirname(os.path.abspath(directory))
+    os.makedirs(parent, exist_ok=True)
+    tmp_directory = tempfile.mkdtemp(prefix='.dataset-', dir=parent)
+    try:
+        columns = {
+            column: np.lib.format.open_memmap(
+                os.path.join(tmp_directory, _column_file(column)), mode='w+', dtype=np.float64, shape=(rows,)
+            )
+            for column in FEATURE_COLUMNS
+        }
+        codes = np.empty(rows, dtype=np.int32)
+
+        # Los cultivos se numeran en orden de aparición, el mismo orden que groupby(sort=False)
+        label_classes: List[str] = []
+        class_index: Dict[str, int] = {}
+        start = 0
+        for chunk in pd.read_csv(csv_path, usecols=FEATURE_COLUMNS + [label_column], chunksize=chunk_size):
+            end = start + len(chunk)
+            for column in FEATURE_COLUMNS:
+                columns[column][start:end] = chunk[column].to_numpy(dtype=np.float64)
+
+            for label in pd.unique(chunk[label_column]):
+                if label not in class_index:
+                    class_index[label] = len(label_classes)
+                    label_classes.append(str(label))
+            codes[start:end] = chunk[label_column].map(class_index).to_numpy()
+            start = end
+
+        for array in columns.values():
+            array.flush()
+        code_dtype = np.uint8 if len(label_classes) <= 256 else np.int32
+        np.save(os.path.join(tmp_directory, LABEL_CODES_FILE), codes.astype(code_dtype))
+
+        meta = {
+            'format_version': DATASET_FORMAT_VERSION,
+            'source': os.path.basename(csv_path),
+            'source_signature': signature,
+            'rows': rows,
+            'columns': FEATURE_COLUMNS,
+            'label_column': label_column,
+            'label_classes': label_classes,
+        }
+        with open(os.path.join(tmp_directory, DATASET_META_FILE), 'w') as meta_file:
+            json.dump(meta, meta_file, indent=2)
+
+        # Reemplazo por renombrado: si ya existe, la carpeta anterior se aparta y luego se borra
+        # (los workers que la tienen mapeada siguen leyendo sus páginas hasta soltarla)
+        try:
+            os.replace(tmp_directory, directory)
+        except OSError:
+            old_directory = tempfile.mkdtemp(prefix='.dataset-old-', dir=parent)
+            try:
+                os.replace(directory, os.path.join(old_directory, 'dataset'))
+                os.replace(tmp_directory, directory)
+            except OSError:
+                # Sin lock de archivo otro proceso pudo instalar la misma conversión en medio
+                current = _open_if_current(directory, signature)
+                if current is None:
+                    raise
+                shutil.rmtree(tmp_directory, ignore_errors=True)
+                meta = current.meta
+            finally:
+                shutil.rmtree(old_directory, ignore_errors=True)
+    except Exception:
+        shutil.rmtree(tmp_directory, ignore_errors=True)
+        raise
+
+    logger.info(f"Dataset de referencia convertido a {directory} ({rows} filas)")
+    return meta
+
+
+class ReferenceDataset:
+    """
+    Dataset de referencia en formato columnar, abierto con memory-map de solo lectura
+
+    Las columnas se mapean en lugar de leerse, así que todos los workers comparten la
+    misma copia en la caché de páginas del sistema operativo.
+
+    Args:
+        directory (str): Carpeta escrita por convert_dataset
+        mmap_mode (str): Modo de np.load ('r' para compartir páginas, None para leer a memoria)
+    """
+
+    def __init__(self, directory: str, mmap_mode: Optional[str] = 'r'):
+        self.directory = directory
+        with open(os.path.join(directory, DATASET_META_FILE)) as meta_file:
+            self.meta = json.load(meta_file)
+
+        if self.meta.get('format_version') != DATASET_FORMAT_VERSION:
+            raise ValueError(f"Formato de dataset no compatible: {self.meta.get('format_version')}")
+
+        self.rows: int = self.meta['rows']
+        self.label_column: str = self.meta['label_column']
+        self.label_classes: List[str] = self.meta['label_classes']
+        self.columns: Dict[str, np.ndarray] = {
+            column: np.load(os.path.join(directory, _column_file(column)), mmap_mode=mmap_mode)
+            for column in self.meta['columns']
+        }
+        self.label_codes: np.ndarray = np.load(os.path.join(directory, LABEL_CODES_FILE), mmap_mode=mmap_mode)
+
+    @property
+    def source_signature(self) -> List[int]:
+        return self.meta['source_signature']
+
+    def features(self, columns: Optional[List[str]] = None) -> np.ndarray:
+        """Matriz (filas x características) en el orden indicado (por defecto FEATURE_COLUMNS)"""
+        return np.column_stack([self.columns[column] for column in columns or FEATURE_COLUMNS])
+
+    def labels(self) -> np.ndarray:
+        """Etiquetas como texto, decodificadas de los códigos"""
+        return np.asarray(self.label_classes, dtype=object)[self.label_codes]
+
+    def to_frame(self) -> 'pd.DataFrame':
+        """
+        DataFrame con las características y la etiqueta como categórica
+
+        Las columnas numéricas se pasan sin copiar (siguen respaldadas por el memory-map)
+        y la etiqueta usa los códigos enteros con la lista de cultivos como categorías.
+        """
+        import pandas as pd
+
+        data = {column: pd.Series(values, copy=False) for column, values in self.columns.items()}
+        data[self.label_column] = pd.Categorical.from_codes(
+            self.label_codes, categories=self.label_classes
+        )
+        return pd.DataFrame(data, copy=False)
+
+
+# (clave, dataset) abierto en este proceso; se reemplaza como una sola tupla
+_loaded = {'entry': None}
+_loaded_lock = threading.Lock()
+
+
+def load_reference_dataset(csv_path: Optional[str] = None, directory: Optional[str] = None,
+                           auto_build: bool = True) -> ReferenceDataset:
+    """
+    Devuelve el dataset de referencia con memory-map, convirtiéndolo si falta o si el CSV cambió
+
+    El resultado se conserva en el proceso mientras el CSV no cambie.
+
+    Args:
+        csv_path (str): CSV de origen (por defecto settings.DATASET_PATH)
+        directory (str): Carpeta columnar (por defecto settings.DATASET_COLUMNAR_DIR)
+        auto_build (bool): Convierte el CSV si la carpeta falta o está desactualizada
+
+    Raises:
+        FileNotFoundError: Si falta la conversión (o está desactualizada) y auto_build es False
+    """
+    from django.conf import settings
+
+    csv_path = csv_path or settings.DATASET_PATH
+    directory = directory or settings.DATASET_COLUMNAR_DIR
+    signature = source_signature(csv_path)
+    key = (csv_path, directory, tuple(signature))
+
+    entry = _loaded['entry']
+    if entry is not None and entry[0] == key:
+        return entry[1]
+
+    with _loaded_lock:
+        entry = _loaded['entry']
+        if entry is not None and entry[0] == key:
+            return entry[1]
+
+        dataset = _open_if_current(directory, signature)
+        if dataset is None:
+            if not auto_build:
+                raise FileNotFoundError(
+                    f"No hay una conversión actualizada de {csv_path} en {directory} (ejecuta manage.py convert_dataset)"
+                )
+            convert_dataset(csv_path, directory, force=False)
+            dataset = ReferenceDataset(directory)
+
+        _loaded['entry'] = (key, dataset)
+
+    return dataset
+
+
+def _open_if_current(directory: str, signature: List[int]) -> Optional[ReferenceDataset]:
+    if not os.path.exists(os.path.join(directory, DATASET_META_FILE)):
+        return None
+
+    try:
+        dataset = ReferenceDataset(directory)
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning(f"Dataset columnar inválido en {directory}: {e}; se convierte de nuevo")
+        return None
+
+    if dataset.source_signature != signature:
+        logger.info(f"El CSV de referencia cambió; se convierte de nuevo a {directory}")
+        return None
+    return dataset
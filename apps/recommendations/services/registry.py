@@ -0,0 +1,174 @@
+import logging
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+from django.conf import settings
+
+from .batcher import PredictionBatcher
+from .metrics import PredictionMetrics
+from .ml_service import CropRecommendationService
+from .prediction_cache import PredictionCache
+from .prediction_grid import GRID_META_FILE, PredictionGrid
+
+logger = logging.getLogger('predictions')
+
+# Servicios cargados en este proceso, uno por par (modelo, encoder)
+_services: Dict[tuple, CropRecommendationService] = {}
+_services_lock = threading.Lock()
+
+
+def _current_rss_bytes() -> Optional[int]:
+    """Devuelve la memoria residente del proceso en bytes (None si no se puede medir)"""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        pass
+
+    try:
+        import resource
+        import sys
+    except ImportError:
+        return None
+
+    # ru_maxrss es el pico de memoria (KB en Linux, bytes en macOS)
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+def serving_model_path() -> str:
+    """Ruta del modelo en servicio según settings.ML_MODEL_VARIANT"""
+    if settings.ML_MODEL_VARIANT == 'fast':
+        if os.path.exists(settings.ML_FAST_MODEL_PATH):
+            return settings.ML_FAST_MODEL_PATH
+        logger.warning(
+            f"Variante rápida no encontrada en {settings.ML_FAST_MODEL_PATH} (ejecuta manage.py build_fast_model); "
+            "se usa MODEL_PATH"
+        )
+    return settings.MODEL_PATH
+
+
+def get_service(model_path: Optional[str] = None, encoder_path: Optional[str] = None) -> CropRecommendationService:
+    """
+    Devuelve el servicio de recomendaciones compartido por todo el proceso
+
+    El modelo se carga una sola vez, en el primer uso (o en AppConfig.ready() si
+    settings.ML_PRELOAD_MODEL está activo), y se comparte entre ambas apps.
+
+    Args:
+        model_path (str): Ruta al modelo ML (por defecto la de serving_model_path())
+        encoder_path (str): Ruta al encoder de etiquetas (por defecto settings.ENCODER_PATH)
+
+    Returns:
+        CropRecommendationService: Servicio listo para predecir
+    """
+    key = (model_path or serving_model_path(), encoder_path or settings.ENCODER_PATH)
+
+    service = _services.get(key)
+    if service is None:
+        with _services_lock:
+            service = _services.get(key)
+            if service is None:
+                service = _load_service(*key)
+                _services[key] = service
+
+    # El vigilante se (re)inicia en cada proceso: los hilos no sobreviven al fork de los workers
+    if settings.ML_RELOAD_INTERVAL and not service.watcher_running():
+        service.start_watcher(settings.ML_RELOAD_INTERVAL)
+
+    return service
+
+
+def _load_service(model_path: str, encoder_path: str) -> CropRecommendationService:
+    """Carga el servicio midiendo el tiempo de carga y la memoria residente que añade"""
+    rss_before = _current_rss_bytes()
+    start = time.perf_counter()
+
+    service = CropRecommendationService(
+        model_path,
+        encoder_path,
+        use_dataframe_input=settings.ML_DATAFRAME_INPUT,
+        mmap_mode=settings.ML_MMAP_MODE,
+        backend=settings.ML_BACKEND,
+        compiled_dir=settings.ML_COMPILED_MODEL_DIR
+    )
+
+    load_time_ms = (time.perf_counter() - start) * 1000
+    rss_after = _current_rss_bytes()
+
+    cache_settings = settings.ML_PREDICTION_CACHE
+    if cache_settings.get('ENABLED'):
+        service.prediction_cache = PredictionCache(
+            max_entries=cache_settings.get('MAX_ENTRIES', 10000),
+            ttl=cache_settings.get('TTL', 300),
+            precision=cache_settings.get('PRECISION', 1),
+            django_cache_alias=cache_settings.get('DJANGO_CACHE_ALIAS')
+        )
+
+    batch_settings = settings.ML_MICRO_BATCH
+    if batch_settings.get('ENABLED'):
+        service.batcher = PredictionBatcher(
+            service,
+            max_batch=batch_settings.get('MAX_BATCH', 64),
+            max_wait_ms=batch_settings.get('MAX_WAIT_MS', 2.0)
+        )
+
+    metrics_settings = settings.ML_METRICS
+    if metrics_settings.get('ENABLED'):
+        service.metrics = PredictionMetrics(
+            directory=metrics_settings.get('DIR'),
+            flush_interval=metrics_settings.get('FLUSH_INTERVAL', 5.0)
+        )
+
+    grid_settings = settings.ML_GRID
+    if grid_settings.get('ENABLED'):
+        service.grid = _load_grid(grid_settings, service.model_version)
+
+    service.load_stats = {
+        'pid': os.getpid(),
+        'model_version': service.model_version,
+        'load_time_ms': round(load_time_ms, 1),
+        'rss_bytes': rss_after,
+        'rss_delta_bytes': rss_after - rss_before if rss_before is not None and rss_after is not None else None,
+        'mmap_mode': settings.ML_MMAP_MODE,
+        'backend': service._slot.backend if service._slot is not None else None
+    }
+
+    delta = service.load_stats['rss_delta_bytes']
+    logger.info(
+        f"Modelo ML cargado en {load_time_ms:.1f} ms "
+        f"(memoria residente {(delta or 0) / 2**20:+.1f} MB, mmap_mode={settings.ML_MMAP_MODE}, "
+        f"backend={service.load_stats['backend']})"
+    )
+    return service
+
+
+def _load_grid(grid_settings: Dict, model_version: Optional[str]) -> Optional[PredictionGrid]:
+    """Carga la malla de predicciones; None si falta o fue construida con otra versión del modelo"""
+    directory = grid_settings.get('DIR')
+    if not directory or not os.path.exists(os.path.join(directory, GRID_META_FILE)):
+        logger.warning(f"Malla de predicciones no encontrada en {directory} (ejecuta manage.py build_prediction_grid)")
+        return None
+
+    try:
+        grid = PredictionGrid(directory, interpolate=grid_settings.get('INTERPOLATE'))
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning(f"Malla de predicciones inválida en {directory}: {e} (ejecuta manage.py build_prediction_grid)")
+        return None
+
+    if grid.model_version != model_version:
+        logger.warning(
+            f"La malla de predicciones es de la versión {grid.model_version} y el modelo es {model_version}; "
+            "se predice con el modelo"
+        )
+    return grid
+
+
+def get_load_stats() -> Dict:
+    """Devuelve las estadísticas de carga de cada modelo cargado en este proceso"""
+    return {
+        model_path: getattr(service, 'load_stats', {})
+        for (model_path, _), service in _services.items()
+    }
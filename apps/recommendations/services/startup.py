@@ -0,0 +1,125 @@
+import json
+import os
+import subprocess
+import sys
+from typing import Dict, List, Optional
+
+from django.conf import settings
+
+# Puntos de entrada de los workers
+STARTUP_TARGETS = ('core.wsgi', 'core.asgi')
+
+# Dependencias que no deben cargarse al arrancar un worker (se importan en el primer uso)
+HEAVY_MODULES = ('pandas', 'plotly', 'sklearn', 'scipy', 'joblib')
+
+# Se ejecuta en un intérprete nuevo: importa el punto de entrada, carga el URLconf (lo que pagaría
+# la primera petición) y reporta memoria residente y dependencias pesadas cargadas
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {target}
+from django.urls import get_resolver
+get_resolver().url_patterns
+elapsed = time.perf_counter() - start
+from apps.recommendations.services.registry import _current_rss_bytes
+rss = _current_rss_bytes()
+heavy = sorted(name for name in {heavy!r} if name in sys.modules)
+print(json.dumps({{'elapsed_ms': elapsed * 1000, 'rss_bytes': rss, 'heavy_modules': heavy}}))
+"""
+
+
+def parse_importtime(output: str) -> List[Dict]:
+    """
+    Interpreta la salida de python -X importtime
+
+    Returns:
+        list: Un dict por módulo con name, depth, self_us y cumulative_us, en orden de importación
+    """
+    entries = []
+    for line in output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        parts = line[len('import time:'):].split('|')
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue
+
+        name = parts[2].rstrip()
+        stripped = name.lstrip()
+        entries.append({
+            'name': stripped,
+            'depth': (len(name) - len(stripped) - 1) // 2,
+            'self_us': int(parts[0]),
+            'cumulative_us': int(parts[1]),
+        })
+    return entries
+
+
+def _top_level_package(name: str) -> str:
+    return name.split('.')[0]
+
+
+def profile_startup(target: str, top: int = 15) -> Dict:
+    """
+    Mide el arranque en frío de un punto de entrada en un proceso nuevo
+
+    Args:
+        target (str): Módulo a importar ('core.wsgi' o 'core.asgi')
+        top (int): Módulos más costosos a incluir
+
+    Returns:
+        dict: target, elapsed_ms, rss_mb, heavy_modules (dependencias pesadas cargadas),
+        import_ms (suma de importaciones de primer nivel), slowest (módulos por tiempo acumulado)
+        y packages (tiempo propio por paquete de primer nivel)
+    """
+    env = {**os.environ, 'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'core.settings')}
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [str(settings.BASE_DIR), env.get('PYTHONPATH')]))
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', _PROBE.format(target=target, heavy=HEAVY_MODULES)],
+        capture_output=True, text=True, cwd=settings.BASE_DIR, env=env
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"No se pudo importar {target}: {completed.stderr.strip().splitlines()[-1:]}")
+
+    probe = json.loads(completed.stdout.strip().splitlines()[-1])
+    entries = parse_importtime(completed.stderr)
+
+    packages: Dict[str, int] = {}
+    for entry in entries:
+        package = _top_level_package(entry['name'])
+        packages[package] = packages.get(package, 0) + entry['self_us']
+
+    slowest = sorted(entries, key=lambda entry: entry['cumulative_us'], reverse=True)[:top]
+    rss_bytes: Optional[int] = probe['rss_bytes']
+    return {
+        'target': target,
+        'elapsed_ms': round(probe['elapsed_ms'], 1),
+        'rss_mb': round(rss_bytes / 2**20, 1) if rss_bytes is not None else None,
+        'heavy_modules': probe['heavy_modules'],
+        'import_ms': round(sum(entry['cumulative_us'] for entry in entries if entry['depth'] == 0) / 1000, 1),
+        'slowest': [
+            {'name': entry['name'], 'cumulative_ms': round(entry['cumulative_us'] / 1000, 1),
+             'self_ms': round(entry['self_us'] / 1000, 1)}
+            for entry in slowest
+        ],
+        'packages': {
+            package: round(self_us / 1000, 1)
+            for package, self_us in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+        },
+    }
+
+
+def check_budget(report: Dict, budget: Dict) -> List[str]:
+    """
+    Compara un perfil de arranque con el presupuesto (settings.STARTUP_BUDGET)
+
+    Returns:
+        list: Descripción de cada límite excedido (vacía si se cumple)
+    """
+    problems = []
+    if budget.get('IMPORT_MS') is not None and report['elapsed_ms'] > budget['IMPORT_MS']:
+        problems.append(f"{report['target']}: arranque de {report['elapsed_ms']} ms (límite {budget['IMPORT_MS']} ms)")
+    if budget.get('RSS_MB') is not None and report['rss_mb'] is not None and report['rss_mb'] > budget['RSS_MB']:
+        problems.append(f"{report['target']}: {report['rss_mb']} MB residentes (límite {budget['RSS_MB']} MB)")
+    if report['heavy_modules']:
+        problems.append(f"{report['target']}: importa al arrancar {', '.join(report['heavy_modules'])}")
+    return problems
@@ -1,3 +1,1219 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from apps.cultivai.models import SensorDevice, SensorReading
+from apps.cultivai.services.ingestion import ingest_readings
+from apps.cultivai.services.rescoring import get_recommendation
+
+from .services import fast_json, metrics as metrics_module, registry
+from .services.batcher import PredictionBatcher
+from .services.benchmark import BENCHMARK_DEVICE_ID, SCENARIOS, compare_to_baseline, load_rows, run_benchmarks
+from .services.bulk_scoring import model_summary, score_file
+from .services.compiled_forest import export_forest
+from .services.crop_knowledge import RECOMMENDATION_FIELDS
+from .services.executor import InferenceExecutor, InferenceRejected, InferenceTimeout
+from .services.fast_model import candidate_specs, tree_subset
+from .services.metrics import PredictionMetrics, render_prometheus
+from .services.ml_service import (
+    COMPACT_FIELDS, FEATURE_COLUMNS, INPUT_RANGES, CropRecommendationService, _artifact_version,
+)
+from .services.prediction_cache import PredictionCache
+from .services.prediction_grid import PredictionGrid, build_grid
+from .services.reference_dataset import ReferenceDataset, convert_dataset, load_reference_dataset
+from .services.registry import get_service, serving_model_path
+from .services.startup import STARTUP_TARGETS, check_budget, profile_startup
+
+
+class NumpyInputPathTests(SimpleTestCase):
+    """El camino rápido con arreglos NumPy debe dar exactamente lo mismo que el modo DataFrame"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.array_service = CropRecommendationService(settings.MODEL_PATH, settings.ENCODER_PATH)
+        cls.dataframe_service = CropRecommendationService(
+            settings.MODEL_PATH, settings.ENCODER_PATH, use_dataframe_input=True
+        )
+        cls.rows = pd.read_csv('./static/data/Crop_recommendation.csv')[FEATURE_COLUMNS].to_dict('records')
+
+    def test_model_columns_verified_at_load(self):
+        self.assertFalse(self.array_service._slot.use_dataframe_input)
+        self.assertEqual(list(self.array_service.model.feature_names_in_), FEATURE_COLUMNS)
+
+    def test_batch_probabilities_match_exactly(self):
+        array_slot = self.array_service._slot
+        dataframe_slot = self.dataframe_service._slot
+        array_input = self.array_service._prepare_batch_input(array_slot, self.rows)
+        dataframe_input = self.dataframe_service._prepare_batch_input(dataframe_slot, self.rows)
+
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            array_probabilities = array_slot.inference_model.predict_proba(array_input)
+        dataframe_probabilities = dataframe_slot.inference_model.predict_proba(dataframe_input)
+
+        np.testing.assert_array_equal(array_probabilities, dataframe_probabilities)
+
+    def test_single_row_predictions_match_exactly(self):
+        dataframe_slot = self.dataframe_service._slot
+        expected = dataframe_slot.inference_model.predict_proba(
+            self.dataframe_service._prepare_batch_input(dataframe_slot, self.rows)
+        )
+
+        array_slot = self.array_service._slot
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            for i, row in enumerate(self.rows):
+                model_input = self.array_service._prepare_model_input(array_slot, row)
+                probabilities = array_slot.inference_model.predict_proba(model_input)[0]
+                np.testing.assert_array_equal(probabilities, expected[i])
+
+    def test_predict_crop_results_match(self):
+        for row in self.rows[::50]:
+            array_result = self.array_service.predict_crop(row)
+            dataframe_result = self.dataframe_service.predict_crop(row)
+            for key in ('success', 'predicted_crop', 'all_probabilities', 'top_recommendations'):
+                self.assertEqual(array_result.get(key), dataframe_result.get(key))
+
+
+class DataFramePathParityTests(SimpleTestCase):
+    """predict_crop / predict_crops deben reproducir predict y predict_proba de sklearn sobre un DataFrame"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.service = CropRecommendationService(settings.MODEL_PATH, settings.ENCODER_PATH)
+        cls.rows = load_rows()[::5]
+
+        frame = pd.DataFrame(cls.rows, columns=FEATURE_COLUMNS)
+        model, encoder = cls.service.model, cls.service.label_encoder
+        cls.expected_crops = encoder.inverse_transform(model.predict(frame))
+        cls.expected_probabilities = model.predict_proba(frame)
+        cls.class_names = list(encoder.inverse_transform(model.classes_))
+
+    def _assert_matches(self, result, i):
+        probabilities = self.expected_probabilities[i]
+        self.assertEqual(result['predicted_crop'], self.expected_crops[i])
+        self.assertEqual(result['confidence_score'], probabilities.max())
+        self.assertEqual(result['all_probabilities'], dict(zip(self.class_names, probabilities.tolist())))
+
+        top = result['top_recommendations']
+        self.assertEqual([item['probability'] for item in top], sorted(probabilities, reverse=True)[:len(top)])
+        for item in top:
+            self.assertEqual(probabilities[self.class_names.index(item['crop'])], item['probability'])
+
+    def test_single_predictions(self):
+        for i, row in enumerate(self.rows):
+            self._assert_matches(self.service.predict_crop(row), i)
+
+    def test_batch_predictions(self):
+        output = self.service.predict_crops(self.rows)
+        self.assertEqual(output['successful'], len(self.rows))
+        for i, result in enumerate(output['results']):
+            self._assert_matches(result, i)
+
+
+class BatchValidationTests(TestCase):
+    """Cada fila de un lote se valida y predice igual que en el endpoint de una muestra"""
+
+    VALID = {'N': 90, 'P': 42, 'K': 43, 'temperature': 20.8, 'humidity': 82, 'ph': 6.5, 'rainfall': 202.9}
+    SAMPLES = [
+        VALID,
+        {**VALID, 'N': '90', 'ph': ' 6.5 '},
+        {**VALID, 'N': True},
+        {**VALID, 'humidity': 'nan'},
+        {**VALID, 'rainfall': 'inf'},
+        {**VALID, 'temperature': 'caliente'},
+        {**VALID, 'P': 500},
+        {key: value for key, value in VALID.items() if key != 'K'},
+        {**VALID, 'ph': None},
+    ]
+
+    def _post(self, path, data):
+        return self.client.post(path, json.dumps(data), content_type='application/json')
+
+    def test_batch_matches_single_endpoint(self):
+        batch = self._post('/api/recommendations/recommend/batch/', self.SAMPLES)
+        self.assertEqual(batch.status_code, 200)
+        results = batch.json()['results']
+        self.assertEqual(batch.json()['successful'], 2)
+
+        for sample, result in zip(self.SAMPLES, results):
+            single = self._post('/api/recommendations/recommend/', sample)
+            if single.status_code == 200:
+                self.assertTrue(result['success'], sample)
+                for key in ('predicted_crop', 'all_probabilities', 'top_recommendations', 'input_data'):
+                    self.assertEqual(result[key], single.json()[key], key)
+            else:
+                self.assertEqual(single.status_code, 400)
+                self.assertFalse(result['success'], sample)
+                self.assertEqual(result['errors'], single.json()['errors'], sample)
+
+    def test_single_endpoint_rejects_bool_and_non_finite(self):
+        for field, value in (('N', True), ('P', False), ('humidity', 'nan'), ('rainfall', 'inf'),
+                             ('temperature', '-Infinity')):
+            response = self._post('/api/recommendations/recommend/', {**self.VALID, field: value})
+            self.assertEqual(response.status_code, 400, (field, value))
+            body = response.json()
+            self.assertEqual(body['message'], 'Datos de entrada inválidos')
+            self.assertEqual(list(body['errors']), [field])
+            self.assertEqual(body['errors'][field], ['A valid number is required.'])
+
+    def test_service_errors_stay_per_field(self):
+        result = get_service().predict_crop({**self.VALID, 'N': True, 'ph': 15})
+        self.assertFalse(result['success'])
+        self.assertEqual(result['error'], 'Datos inválidos')
+        self.assertEqual(sorted(result['errors']), ['N', 'ph'])
+        self.assertTrue(all(isinstance(messages, list) for messages in result['errors'].values()))
+
+    def test_matrix_output_uses_same_validation(self):
+        response = self._post('/api/recommendations/recommend/batch/?output=arrays', self.SAMPLES)
+        body = response.json()
+        self.assertEqual([row is not None for row in body['probabilities']], [True, True] + [False] * 7)
+        self.assertEqual(sorted(body['errors'], key=int), [str(i) for i in range(2, 9)])
+        self.assertIn('humidity', body['errors']['3'])
+
+
+class ResponseShapeTests(TestCase):
+    """fields=, compact= y output= cambian la forma de la respuesta, no los valores"""
+
+    SAMPLES = [
+        BatchValidationTests.VALID,
+        {'N': 20, 'P': 60, 'K': 20, 'temperature': 27.5, 'humidity': 60, 'ph': 6.9, 'rainfall': 60},
+        {**BatchValidationTests.VALID, 'ph': 15},
+    ]
+
+    def _post(self, path, data):
+        return self.client.post(path, json.dumps(data), content_type='application/json')
+
+    def test_fields_and_compact(self):
+        full = self._post('/api/recommendations/recommend/', self.SAMPLES[0]).json()
+
+        compact = self._post('/api/recommendations/recommend/?compact=1', self.SAMPLES[0]).json()
+        self.assertEqual(set(compact) - {'message'}, {'success', 'predicted_crop', 'confidence_score'})
+        self.assertEqual(compact['confidence_score'], full['confidence_score'])
+
+        selected = self._post('/api/recommendations/recommend/?fields=predicted_crop,all_probabilities',
+                              self.SAMPLES[0]).json()
+        self.assertEqual(set(selected) - {'message'}, {'success', 'predicted_crop', 'all_probabilities'})
+        self.assertEqual(selected['all_probabilities'], full['all_probabilities'])
+
+        batch = self._post('/api/recommendations/recommend/batch/?compact=1', self.SAMPLES).json()
+        self.assertEqual(batch['results'][0]['predicted_crop'], full['predicted_crop'])
+        self.assertNotIn('all_probabilities', batch['results'][0])
+
+        unknown = self._post('/api/recommendations/recommend/?fields=predicted_crop,color', self.SAMPLES[0])
+        self.assertEqual(unknown.status_code, 400)
+        self.assertIn('fields', unknown.json()['errors'])
+
+    def test_async_endpoint_honors_fields_and_approximate(self):
+        for query in ('?compact=1', '?fields=predicted_crop,all_probabilities', '?recommendations=1'):
+            sync = self._post(f'/api/recommendations/recommend/{query}', self.SAMPLES[0]).json()
+            async_ = self._post(f'/api/recommendations/recommend/async/{query}', self.SAMPLES[0]).json()
+            self.assertEqual(set(async_), set(sync), query)
+            self.assertEqual({**async_, 'prediction_time_ms': None}, {**sync, 'prediction_time_ms': None}, query)
+
+        unknown = self._post('/api/recommendations/recommend/async/?fields=color', self.SAMPLES[0])
+        self.assertEqual(unknown.status_code, 400)
+        self.assertIn('fields', unknown.json()['errors'])
+
+        service = get_service()
+        with mock.patch.object(service, 'predict_crop', wraps=service.predict_crop) as predict_crop:
+            self._post('/api/recommendations/recommend/async/?approximate=1&compact=1', self.SAMPLES[0])
+        predict_crop.assert_called_once_with(mock.ANY, COMPACT_FIELDS, use_grid=True)
+
+    def test_arrays_output_matches_objects(self):
+        objects = self._post('/api/recommendations/recommend/batch/', self.SAMPLES).json()
+        arrays = self._post('/api/recommendations/recommend/batch/?output=arrays', self.SAMPLES).json()
+
+        self.assertEqual(arrays['model_version'], objects['model_version'])
+        for result, row, predicted in zip(objects['results'], arrays['probabilities'], arrays['predicted']):
+            if not result['success']:
+                self.assertIsNone(row)
+                self.assertIsNone(predicted)
+                continue
+            # Mismos float64 que all_probabilities, sin ruido de float32
+            self.assertEqual(dict(zip(arrays['classes'], row)), result['all_probabilities'])
+            self.assertEqual(predicted, result['predicted_crop'])
+        self.assertEqual(list(arrays['errors']), ['2'])
+
+    def test_binary_output(self):
+        arrays = self._post('/api/recommendations/recommend/batch/?output=arrays', self.SAMPLES).json()
+        response = self._post('/api/recommendations/recommend/batch/?output=binary', self.SAMPLES)
+
+        self.assertEqual(response['Content-Type'], 'application/octet-stream')
+        rows, columns = int(response['X-Rows']), int(response['X-Columns'])
+        self.assertEqual((rows, columns), (len(self.SAMPLES), len(arrays['classes'])))
+        self.assertEqual(response['X-Crop-Classes'].split(','), arrays['classes'])
+
+        matrix = np.frombuffer(response.content, dtype='<f4').reshape(rows, columns)
+        np.testing.assert_array_equal(matrix[:2], np.asarray(arrays['probabilities'][:2], dtype=np.float32))
+        self.assertTrue(np.isnan(matrix[2]).all())
+
+        invalid = self._post('/api/recommendations/recommend/batch/?output=csv', self.SAMPLES)
+        self.assertEqual(invalid.status_code, 400)
+
+
+class ServiceRegistryTests(TestCase):
+    """El modelo se carga una vez por proceso y todas las vistas usan el mismo servicio"""
+
+    VALID = BatchValidationTests.VALID
+
+    def setUp(self):
+        self.service = get_service()
+        patcher = mock.patch.dict(registry._services, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        def slow_load(model_path, encoder_path):
+            # La carga lenta deja a los demás hilos llegar mientras el primero aún carga
+            time.sleep(0.05)
+            return self.service
+
+        patcher = mock.patch.object(registry, '_load_service', side_effect=slow_load)
+        self.load_service = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_concurrent_first_access_loads_once(self):
+        barrier = threading.Barrier(8)
+
+        def first_access(_):
+            barrier.wait()
+            return get_service()
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            services = list(pool.map(first_access, range(8)))
+
+        self.assertEqual(self.load_service.call_count, 1)
+        self.assertTrue(all(service is self.service for service in services))
+
+    def test_views_share_the_service(self):
+        paths = ('/api/recommendations/recommend/', '/api/recommendations/recommend/fast/',
+                 '/api/recommendations/recommend/async/', '/api/crop_recommendation/',
+                 '/api/crop_recommendation/async/')
+        with mock.patch.object(self.service, 'predict_crop', wraps=self.service.predict_crop) as predict_crop:
+            for path in paths:
+                response = self.client.post(path, json.dumps(self.VALID), content_type='application/json')
+                self.assertEqual(response.status_code, 200, path)
+
+        self.assertEqual(predict_crop.call_count, len(paths))
+        self.assertEqual(self.load_service.call_count, 1)
+
+
+class ModelReloadTests(TestCase):
+    """La recarga cambia el slot completo de una vez y la nueva versión no reutiliza la caché anterior"""
+
+    SAMPLE = BatchValidationTests.VALID
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.model_path = os.path.join(directory, 'model.joblib')
+        self.encoder_path = os.path.join(directory, 'encoder.joblib')
+        shutil.copy(settings.MODEL_PATH, self.model_path)
+        shutil.copy(settings.ENCODER_PATH, self.encoder_path)
+
+        self.service = CropRecommendationService(self.model_path, self.encoder_path)
+        self.service.prediction_cache = PredictionCache()
+
+    def _write_other_model(self):
+        """Reemplaza el modelo en disco por un bosque pequeño distinto (otra versión)"""
+        from joblib import dump
+        from sklearn.ensemble import RandomForestClassifier
+
+        data = pd.read_csv(settings.DATASET_PATH)
+        labels = self.service.label_encoder.transform(data['label'])
+        model = RandomForestClassifier(n_estimators=3, max_depth=3, random_state=1).fit(data[FEATURE_COLUMNS], labels)
+        dump(model, self.model_path)
+
+    def test_in_flight_prediction_keeps_its_slot(self):
+        old_slot = self.service._slot
+        original_predict_proba = old_slot.inference_model.predict_proba
+
+        def predict_proba_during_reload(X):
+            # La recarga termina mientras esta predicción ya tomó el slot anterior
+            self._write_other_model()
+            self.assertTrue(self.service.reload(force=True))
+            return original_predict_proba(X)
+
+        with mock.patch.object(old_slot.inference_model, 'predict_proba', predict_proba_during_reload):
+            result = self.service.predict_crop(self.SAMPLE)
+
+        self.assertEqual(result['model_version'], old_slot.version)
+        new_slot = self.service._slot
+        self.assertIsNot(new_slot, old_slot)
+        self.assertNotEqual(new_slot.version, old_slot.version)
+        self.assertEqual(new_slot.version, _artifact_version([self.model_path, self.encoder_path]))
+        self.assertEqual(self.service.predict_crop(self.SAMPLE)['model_version'], new_slot.version)
+
+    def test_reload_changes_cache_key(self):
+        first = self.service.predict_crop(self.SAMPLE)
+        self.assertEqual(self.service.predict_crop(self.SAMPLE), {**first, 'prediction_time_ms': mock.ANY})
+        self.assertEqual(self.service.prediction_cache.stats()['hits'], 1)
+
+        # Sin cambios en disco no se recarga
+        self.assertFalse(self.service.reload())
+
+        self._write_other_model()
+        self.assertTrue(self.service.reload())
+        after = self.service.predict_crop(self.SAMPLE)
+        self.assertNotEqual(after['model_version'], first['model_version'])
+        stats = self.service.prediction_cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 2))
+
+    def test_failed_reload_keeps_current_version(self):
+        slot = self.service._slot
+        with open(self.model_path, 'wb') as model_file:
+            model_file.write(b'no es un modelo')
+
+        self.assertFalse(self.service.reload(force=True))
+        self.assertIs(self.service._slot, slot)
+        self.assertTrue(self.service.predict_crop(self.SAMPLE)['success'])
+
+    def test_reload_view_is_admin_only(self):
+        url = '/api/recommendations/model/reload/'
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.assertEqual(self.client.post(url).status_code, 403)
+        self.client.force_login(User.objects.create_user('usuario'))
+        self.assertEqual(self.client.post(url).status_code, 403)
+
+        self.client.force_login(User.objects.create_user('admin', is_staff=True))
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['model_version'], get_service().model_version)
+        self.assertTrue(response.json()['model_available'])
+
+        with mock.patch.object(get_service(), 'reload_in_background') as reload_in_background:
+            response = self.client.post(url)
+        self.assertEqual(response.status_code, 202)
+        reload_in_background.assert_called_once_with(force=True)
+
+
+class PredictionCacheTests(SimpleTestCase):
+    """LRU, TTL, claves cuantizadas y versión del modelo de la caché de predicciones"""
+
+    SAMPLE = BatchValidationTests.VALID
+
+    def test_lru_eviction(self):
+        prediction_cache = PredictionCache(max_entries=2)
+        keys = [prediction_cache.make_key({**self.SAMPLE, 'N': n}, 'v1') for n in (10, 20, 30)]
+        prediction_cache.set(keys[0], {'n': 10})
+        prediction_cache.set(keys[1], {'n': 20})
+        # Leer la primera la vuelve la más reciente; se expulsa la segunda
+        self.assertEqual(prediction_cache.get(keys[0]), {'n': 10})
+        prediction_cache.set(keys[2], {'n': 30})
+
+        self.assertIsNone(prediction_cache.get(keys[1]))
+        self.assertEqual(prediction_cache.get(keys[0]), {'n': 10})
+        self.assertEqual(prediction_cache.get(keys[2]), {'n': 30})
+        stats = prediction_cache.stats()
+        self.assertEqual((stats['entries'], stats['evictions'], stats['hits'], stats['misses']), (2, 1, 3, 1))
+
+    def test_ttl_expiry(self):
+        prediction_cache = PredictionCache(ttl=10)
+        key = prediction_cache.make_key(self.SAMPLE, 'v1')
+        with mock.patch('apps.recommendations.services.prediction_cache.time.monotonic', return_value=100.0):
+            prediction_cache.set(key, {'ok': True})
+        with mock.patch('apps.recommendations.services.prediction_cache.time.monotonic', return_value=109.9):
+            self.assertEqual(prediction_cache.get(key), {'ok': True})
+        with mock.patch('apps.recommendations.services.prediction_cache.time.monotonic', return_value=110.0):
+            self.assertIsNone(prediction_cache.get(key))
+
+        stats = prediction_cache.stats()
+        self.assertEqual((stats['entries'], stats['expirations']), (0, 1))
+
+    def test_quantized_keys(self):
+        prediction_cache = PredictionCache(precision={'temperature': 0, 'ph': 2})
+        key = prediction_cache.make_key(self.SAMPLE, 'v1')
+
+        # temperature se redondea a enteros y el resto a un decimal; ph conserva dos
+        self.assertEqual(prediction_cache.make_key({**self.SAMPLE, 'temperature': 21.3, 'N': 90.04}, 'v1'), key)
+        self.assertNotEqual(prediction_cache.make_key({**self.SAMPLE, 'temperature': 21.6}, 'v1'), key)
+        self.assertNotEqual(prediction_cache.make_key({**self.SAMPLE, 'N': 90.06}, 'v1'), key)
+        self.assertEqual(prediction_cache.make_key({**self.SAMPLE, 'ph': 6.496}, 'v1'), key)
+        self.assertNotEqual(prediction_cache.make_key({**self.SAMPLE, 'ph': 6.51}, 'v1'), key)
+
+    def test_service_collisions_and_version(self):
+        service = CropRecommendationService(settings.MODEL_PATH, settings.ENCODER_PATH)
+        service.prediction_cache = PredictionCache(precision=1)
+
+        first = service.predict_crop(self.SAMPLE)
+        # Una lectura que cae en la misma celda reutiliza el resultado, con su propia input_data
+        near = service.predict_crop({**self.SAMPLE, 'temperature': 20.82})
+        self.assertEqual(near['all_probabilities'], first['all_probabilities'])
+        self.assertEqual(near['input_data']['temperature'], 20.82)
+        self.assertEqual(service.prediction_cache.stats()['hits'], 1)
+
+        # Otra versión del modelo no comparte claves
+        key = service.prediction_cache.make_key(self.SAMPLE, service.model_version)
+        self.assertIsNotNone(service.prediction_cache.get(key))
+        self.assertIsNone(service.prediction_cache.get(
+            service.prediction_cache.make_key(self.SAMPLE, 'otra-version')
+        ))
+
+    def test_hits_are_isolated_from_caller_mutations(self):
+        service = CropRecommendationService(settings.MODEL_PATH, settings.ENCODER_PATH)
+        service.prediction_cache = PredictionCache(precision=1)
+
+        first = service.predict_crop(self.SAMPLE)
+        expected = {key: first[key] for key in ('top_recommendations', 'all_probabilities')}
+        expected = json.loads(json.dumps(expected))
+
+        # Modificar lo devuelto (fallo y acierto) no debe alterar la entrada guardada
+        for result in (first, service.predict_crop(self.SAMPLE)):
+            result['top_recommendations'][0]['crop'] = 'modificado'
+            result['top_recommendations'].clear()
+            result['all_probabilities'].clear()
+
+        hit = service.predict_crop(self.SAMPLE)
+        self.assertEqual(service.prediction_cache.stats()['hits'], 2)
+        self.assertEqual(hit['top_recommendations'], expected['top_recommendations'])
+        self.assertEqual(hit['all_probabilities'], expected['all_probabilities'])
+
+    def test_shared_level(self):
+        cache.clear()
+        writer, reader = PredictionCache(django_cache_alias='default'), PredictionCache(django_cache_alias='default')
+        key = writer.make_key(self.SAMPLE, 'v1')
+        writer.set(key, {'ok': True})
+
+        self.assertEqual(reader.get(key), {'ok': True})
+        self.assertEqual(reader.get(key), {'ok': True})
+        stats = reader.stats()
+        self.assertEqual((stats['shared_hits'], stats['hits'], stats['hit_rate']), (1, 1, 1.0))
+
+
+class PredictionCacheStatsViewTests(TestCase):
+    URL = '/api/recommendations/cache/stats/'
+
+    def test_admin_only(self):
+        self.assertEqual(self.client.get(self.URL).status_code, 403)
+        self.client.force_login(User.objects.create_user('usuario'))
+        self.assertEqual(self.client.get(self.URL).status_code, 403)
+
+    def test_response_shape(self):
+        self.client.force_login(User.objects.create_user('admin', is_staff=True))
+        service = get_service()
+
+        with mock.patch.object(service, 'prediction_cache', None):
+            self.assertEqual(self.client.get(self.URL).json(), {'enabled': False})
+
+        prediction_cache = PredictionCache(max_entries=5, ttl=60)
+        key = prediction_cache.make_key(BatchValidationTests.VALID, 'v1')
+        prediction_cache.get(key)
+        prediction_cache.set(key, {'ok': True})
+        prediction_cache.get(key)
+        with mock.patch.object(service, 'prediction_cache', prediction_cache):
+            response = self.client.get(self.URL)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {
+            'enabled': True, 'entries': 1, 'max_entries': 5, 'ttl': 60,
+            'precision': {column: 1 for column in FEATURE_COLUMNS},
+            'hits': 1, 'shared_hits': 0, 'misses': 1, 'evictions': 0, 'expirations': 0, 'hit_rate': 0.5
+        })
+
+
+class FastEndpointParityTests(TestCase):
+    """recommend/fast/ debe responder lo mismo que la vista DRF, con y sin orjson"""
+
+    VALID = BatchValidationTests.VALID
+    PAYLOADS = [
+        VALID,
+        {**VALID, 'N': '90', 'ph': ' 6.5 ', 'extra': 'ignorado'},
+        {**VALID, 'temperature': 'caliente'},
+        {**VALID, 'N': True},
+        {**VALID, 'humidity': 'NaN'},
+        {**VALID, 'rainfall': '1e400'},
+        {**VALID, 'P': 500, 'K': -1},
+        {**VALID, 'ph': None},
+        {**VALID, 'ph': [6.5]},
+        {key: value for key, value in VALID.items() if key != 'K'},
+        {},
+    ]
+    RAW_BODIES = [b'[1, 2]', b'{"N": ', b'"texto"', b'{"N": NaN}']
+
+    def _compare(self, body, query=''):
+        fast = self.client.post('/api/recommendations/recommend/fast/' + query, body, content_type='application/json')
+        drf = self.client.post('/api/recommendations/recommend/' + query, body, content_type='application/json')
+
+        self.assertEqual(fast.status_code, drf.status_code, body)
+        self.assertEqual(fast['Content-Type'], drf['Content-Type'], body)
+        fast_body, drf_body = fast.json(), drf.json()
+        for response_body in (fast_body, drf_body):
+            response_body.pop('prediction_time_ms', None)
+        self.assertEqual(fast_body, drf_body, body)
+
+    def test_parity(self):
+        for use_orjson in (True, False):
+            with self.subTest(orjson=use_orjson), \
+                    mock.patch.object(fast_json, 'orjson', fast_json.orjson if use_orjson else None):
+                for payload in self.PAYLOADS:
+                    self._compare(json.dumps(payload))
+                for body in self.RAW_BODIES:
+                    self._compare(body)
+                self._compare(json.dumps(self.VALID), '?compact=1')
+                self._compare(json.dumps(self.VALID), '?fields=predicted_crop,top_recommendations')
+                self._compare(json.dumps(self.VALID), '?fields=color')
+
+    def test_unicode_encoding_matches_drf(self):
+        text = 'ñandú \u2028 fin'
+        self.assertEqual(fast_json.dumps({'texto': text}), JSONRenderer().render({'texto': text}))
+        with mock.patch.object(fast_json, 'orjson', None):
+            self.assertEqual(fast_json.dumps({'texto': text}), JSONRenderer().render({'texto': text}))
+
+
+class InferenceExecutorTests(TestCase):
+    """El pool acotado rechaza con 429 al llenarse y corta con 504 al exceder el tiempo límite"""
+
+    URL = '/api/recommendations/recommend/async/'
+    VALID = BatchValidationTests.VALID
+
+    def setUp(self):
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+
+        def blocking_predict(data, fields=None, use_grid=False):
+            self.release.wait(timeout=5)
+            return {'success': True, 'predicted_crop': 'rice'}
+
+        patcher = mock.patch('apps.recommendations.services.executor._predict_crop', blocking_predict)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _executor(self, **kwargs):
+        executor = InferenceExecutor(kind='thread', max_workers=1, **kwargs)
+        self.addCleanup(executor.shutdown)
+        return executor
+
+    async def _wait_in_flight(self, executor, expected):
+        for _ in range(200):
+            if executor.in_flight == expected:
+                return
+            await asyncio.sleep(0.005)
+        self.fail(f'in_flight {executor.in_flight} != {expected}')
+
+    async def test_rejects_when_pool_and_queue_are_full(self):
+        executor = self._executor(max_queue=1, timeout=5)
+        running = [asyncio.ensure_future(executor.predict_crop(self.VALID)) for _ in range(2)]
+        await self._wait_in_flight(executor, 2)
+
+        with self.assertRaises(InferenceRejected):
+            await executor.predict_crop(self.VALID)
+
+        with mock.patch('apps.recommendations.views.get_inference_executor', return_value=executor):
+            response = await self.async_client.post(self.URL, self.VALID, content_type='application/json')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], str(settings.ML_INFERENCE_POOL['RETRY_AFTER']))
+
+        self.release.set()
+        results = await asyncio.gather(*running)
+        self.assertTrue(all(result['success'] for result in results))
+        await self._wait_in_flight(executor, 0)
+
+    async def test_timeout(self):
+        executor = self._executor(max_queue=0, timeout=0.05)
+        with self.assertRaises(InferenceTimeout):
+            await executor.predict_crop(self.VALID)
+        # El lugar en el pool sigue ocupado hasta que el worker termina
+        self.assertEqual(executor.in_flight, 1)
+
+        self.release.set()
+        await self._wait_in_flight(executor, 0)
+        self.release.clear()
+
+        with mock.patch('apps.recommendations.views.get_inference_executor', return_value=executor):
+            response = await self.async_client.post(self.URL, self.VALID, content_type='application/json')
+        self.assertEqual(response.status_code, 504)
+        self.assertFalse(response.json()['success'])
+
+
+class RecordingModel:
+    """Modelo falso que anota el tamaño de cada lote y devuelve [x, 2x] por fila"""
+
+    def __init__(self, error=None):
+        self.batch_sizes = []
+        self.error = error
+
+    def predict_proba(self, X):
+        self.batch_sizes.append(len(X))
+        if self.error is not None:
+            raise self.error
+        return np.hstack([X, 2 * X])
+
+
+class PredictionBatcherTests(SimpleTestCase):
+    """Las predicciones agrupadas deben ser idénticas a las individuales y el lote cerrarse a tiempo"""
+
+    def _fake_batcher(self, model, **kwargs):
+        service = SimpleNamespace(_prepare_batch_input=lambda slot, rows: np.array([[row['x']] for row in rows]))
+        return PredictionBatcher(service, **kwargs), SimpleNamespace(inference_model=model)
+
+    def test_batched_results_match_unbatched(self):
+        rows = load_rows(240)
+        plain = CropRecommendationService(settings.MODEL_PATH, settings.ENCODER_PATH)
+        batched = CropRecommendationService(settings.MODEL_PATH, settings.ENCODER_PATH)
+        batched.batcher = PredictionBatcher(batched, max_batch=16, max_wait_ms=5)
+
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            results = list(pool.map(batched.predict_crop, rows))
+
+        for row, result in zip(rows, results):
+            expected = plain.predict_crop(row)
+            for key in ('success', 'predicted_crop', 'confidence_score', 'all_probabilities', 'top_recommendations'):
+                self.assertEqual(result.get(key), expected.get(key), key)
+        self.assertEqual(batched.batcher.samples, len(rows))
+
+    def test_flush_on_size(self):
+        model = RecordingModel()
+        batcher, slot = self._fake_batcher(model, max_batch=4, max_wait_ms=10_000)
+
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            futures = [pool.submit(batcher.predict_proba, slot, {'x': float(i)}) for i in range(4)]
+            # Con el lote lleno no se espera los 10 s de max_wait_ms
+            results = [future.result(timeout=5) for future in futures]
+
+        self.assertEqual(model.batch_sizes, [4])
+        for i, row in enumerate(results):
+            np.testing.assert_array_equal(row, [i, 2 * i])
+
+    def test_flush_on_timeout(self):
+        model = RecordingModel()
+        batcher, slot = self._fake_batcher(model, max_batch=64, max_wait_ms=20)
+
+        start = time.perf_counter()
+        row = batcher.predict_proba(slot, {'x': 3.0})
+        elapsed = time.perf_counter() - start
+
+        np.testing.assert_array_equal(row, [3.0, 6.0])
+        self.assertEqual(model.batch_sizes, [1])
+        self.assertGreaterEqual(elapsed, 0.015)
+        self.assertLess(elapsed, 1.0)
+        self.assertEqual(batcher.stats()['batches'], 1)
+
+    def test_model_error_reaches_every_caller(self):
+        batcher, slot = self._fake_batcher(RecordingModel(error=ValueError('modelo roto')), max_batch=2,
+                                           max_wait_ms=10_000)
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            futures = [pool.submit(batcher.predict_proba, slot, {'x': float(i)}) for i in range(2)]
+            for future in futures:
+                with self.assertRaisesMessage(ValueError, 'modelo roto'):
+                    future.result(timeout=5)
+
+
+class CompiledForestTests(SimpleTestCase):
+    """El bosque compilado debe reproducir las probabilidades de sklearn en todo el dataset"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.sklearn_service = CropRecommendationService(settings.MODEL_PATH, settings.ENCODER_PATH)
+        export_forest(
+            cls.sklearn_service.model, cls.directory.name, FEATURE_COLUMNS, _artifact_version([settings.MODEL_PATH])
+        )
+        cls.compiled_service = CropRecommendationService(
+            settings.MODEL_PATH, settings.ENCODER_PATH, backend='compiled', compiled_dir=cls.directory.name
+        )
+        cls.rows = pd.read_csv('./static/data/Crop_recommendation.csv')[FEATURE_COLUMNS].to_dict('records')
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.directory.cleanup()
+        super().tearDownClass()
+
+    def test_compiled_backend_selected(self):
+        self.assertEqual(self.compiled_service._slot.backend, 'compiled')
+        self.assertEqual(self.compiled_service.model_version, self.sklearn_service.model_version)
+
+    def test_probabilities_match_sklearn(self):
+        sklearn_slot = self.sklearn_service._slot
+        compiled_slot = self.compiled_service._slot
+        expected = sklearn_slot.inference_model.predict_proba(
+            self.sklearn_service._prepare_batch_input(sklearn_slot, self.rows)
+        )
+        actual = compiled_slot.inference_model.predict_proba(
+            self.compiled_service._prepare_batch_input(compiled_slot, self.rows)
+        )
+        np.testing.assert_allclose(actual, expected, rtol=0, atol=1e-12)
+
+    def test_stale_export_falls_back_to_sklearn(self):
+        with tempfile.TemporaryDirectory() as directory:
+            export_forest(self.sklearn_service.model, directory, FEATURE_COLUMNS, 'otra-version')
+            service = CropRecommendationService(
+                settings.MODEL_PATH, settings.ENCODER_PATH, backend='compiled', compiled_dir=directory
+            )
+        self.assertEqual(service._slot.backend, 'sklearn')
+
+
+class PredictionGridTests(SimpleTestCase):
+    """La malla solo responde en celdas cuyo error contra el modelo se midió dentro de la tolerancia"""
+
+    RANGES = {'a': (0.0, 1.0), 'b': (0.0, 1.0)}
+
+    @staticmethod
+    def smooth_model(points):
+        # Multilineal: la interpolación de la malla lo reproduce salvo por la cuantización
+        first = 0.6 + 0.3 * points[:, 0] * points[:, 1]
+        return np.column_stack([first, 1 - first])
+
+    @staticmethod
+    def bump_model(points):
+        # Un pico angosto en a ≈ 0.6 que no toca ningún vértice (los vértices están en múltiplos de 0.25)
+        first = np.where(np.abs(points[:, 0] - 0.6) < 0.05, 0.9, 0.1)
+        return np.column_stack([first, 1 - first])
+
+    def test_build_and_lookup(self):
+        with tempfile.TemporaryDirectory() as directory:
+            meta = build_grid(self.smooth_model, directory, self.RANGES, 5, 2, max_error=0.01)
+            grid = PredictionGrid(directory, mmap_mode=None)
+
+            self.assertEqual(meta['reliable_fraction'], 1.0)
+            self.assertLessEqual(meta['measured_max_error'], 0.01)
+            for point in ([0.1, 0.9], [0.37, 0.52], [1.0, 1.0]):
+                expected = self.smooth_model(np.array([point]))[0]
+                looked_up = grid.lookup(dict(zip(self.RANGES, point)))
+                np.testing.assert_allclose(looked_up, expected, atol=2 / 255)
+            self.assertEqual(grid.stats()['hits'], 3)
+
+    def test_interior_error_marks_cell_unreliable(self):
+        with tempfile.TemporaryDirectory() as directory:
+            meta = build_grid(self.bump_model, directory, self.RANGES, 5, 2, max_error=0.1)
+            grid = PredictionGrid(directory, mmap_mode=None)
+
+            # Las cuatro esquinas coinciden en todas las celdas; solo las de a en [0.5, 0.75] tienen el pico
+            self.assertFalse(grid.reliable[2].any())
+            self.assertTrue(np.delete(grid.reliable, 2, axis=0).all())
+            self.assertEqual(meta['candidate_fraction'], 1.0)
+            self.assertIsNone(grid.lookup({'a': 0.6, 'b': 0.3}))
+            self.assertIsNone(grid.lookup({'a': 1.5, 'b': 0.3}))
+            self.assertIsNotNone(grid.lookup({'a': 0.2, 'b': 0.3}))
+            self.assertEqual((grid.hits, grid.fallbacks), (1, 2))
+
+    def test_validation_points_mark_cell_unreliable(self):
+        def narrow_bump(points):
+            # Más angosto que el muestreo interior: solo lo detecta un punto real
+            first = np.where(np.abs(points[:, 1] - 0.13) < 0.005, 0.9, 0.1)
+            return np.column_stack([first, 1 - first])
+
+        with tempfile.TemporaryDirectory() as directory:
+            build_grid(narrow_bump, directory, self.RANGES, 5, 2, max_error=0.1, samples_per_cell=1,
+                       validation_points=np.array([[0.4, 0.13]]))
+            grid = PredictionGrid(directory, mmap_mode=None)
+            self.assertFalse(grid.reliable[1, 0])
+            self.assertEqual(int(grid.reliable.sum()), 15)
+
+    def test_predict_crop_uses_grid_only_when_requested(self):
+        service = CropRecommendationService(settings.MODEL_PATH, settings.ENCODER_PATH)
+        slot = service._slot
+        row = {'N': 90, 'P': 42, 'K': 43, 'temperature': 20.8, 'humidity': 82, 'ph': 6.5, 'rainfall': 202.9}
+        expected = service.predict_crop(row)['all_probabilities']
+
+        with tempfile.TemporaryDirectory() as directory:
+            build_grid(
+                lambda points: slot.inference_model.predict_proba(points), directory,
+                {feature: INPUT_RANGES[feature] for feature in FEATURE_COLUMNS}, 2, len(slot.class_names),
+                max_error=0.01, model_version=slot.version
+            )
+            # Con una sola celda que cubre toda la caja el error es enorme: la malla deriva al modelo
+            service.grid = PredictionGrid(directory, mmap_mode=None)
+            self.assertFalse(service.grid.reliable.any())
+            self.assertEqual(service.predict_crop(row, use_grid=True)['all_probabilities'], expected)
+            self.assertEqual(service.grid.fallbacks, 1)
+
+            # Forzada como confiable, solo responde si se pide
+            service.grid.reliable = np.ones_like(service.grid.reliable)
+            self.assertEqual(service.predict_crop(row)['all_probabilities'], expected)
+            self.assertNotEqual(service.predict_crop(row, use_grid=True)['all_probabilities'], expected)
+            self.assertEqual(service.grid.hits, 1)
+
+            service.grid.model_version = 'otra-version'
+            self.assertEqual(service.predict_crop(row, use_grid=True)['all_probabilities'], expected)
+
+
+class BenchmarkSuiteTests(TestCase):
+    """El benchmark debe recorrer todos los escenarios sin errores y detectar regresiones"""
+
+    def test_all_scenarios_run_without_errors(self):
+        result = run_benchmarks(SCENARIOS, samples=30, concurrency=2, warmup=2)
+
+        self.assertEqual(set(result['scenarios']), set(SCENARIOS))
+        for name, metrics in result['scenarios'].items():
+            self.assertEqual(metrics['errors'], 0, name)
+            self.assertEqual(metrics['requests'], 30, name)
+            self.assertLessEqual(metrics['p50_ms'], metrics['p99_ms'], name)
+        self.assertEqual(SensorReading.objects.count(), 0)
+        # El escenario de ingesta no deja rastro del dispositivo de prueba en la caché
+        self.assertIsNone(get_recommendation(BENCHMARK_DEVICE_ID))
+        self.assertIsNone(cache.get(f'sensors:recommendation:{BENCHMARK_DEVICE_ID}'))
+
+    def test_committed_baseline(self):
+        with open(settings.BENCHMARK_BASELINE_PATH) as baseline_file:
+            baseline = json.load(baseline_file)
+        self.assertEqual(set(baseline['scenarios']), set(SCENARIOS))
+        self.assertEqual(compare_to_baseline(baseline, baseline, tolerance=0.0), [])
+
+    def test_compare_to_baseline(self):
+        baseline = {'scenarios': {'service': {'p99_ms': 10.0, 'throughput_rps': 100.0, 'errors': 0}}}
+        within = {'scenarios': {'service': {'p99_ms': 11.0, 'throughput_rps': 95.0, 'errors': 0}}}
+        slower = {'scenarios': {'service': {'p99_ms': 20.0, 'throughput_rps': 50.0, 'errors': 0}}}
+
+        self.assertEqual(compare_to_baseline(within, baseline, tolerance=0.25), [])
+        regressions = compare_to_baseline(slower, baseline, tolerance=0.25)
+        self.assertEqual(len(regressions), 2)
+        self.assertTrue(any('p99_ms' in regression for regression in regressions))
+
+
+class BulkScoringTests(SimpleTestCase):
+    """La puntuación por bloques debe coincidir con predict_crop y marcar las filas inválidas"""
+
+    def test_score_file_matches_predict_crop(self):
+        service = CropRecommendationService(settings.MODEL_PATH, settings.ENCODER_PATH)
+        data = pd.read_csv('./static/data/Crop_recommendation.csv').head(120)
+        data['plot_id'] = range(len(data))
+        data.loc[3, 'N'] = 999
+        data.loc[4, 'ph'] = None
+
+        with tempfile.TemporaryDirectory() as directory:
+            input_path, output_path = f'{directory}/input.csv', f'{directory}/output.csv'
+            data.to_csv(input_path, index=False)
+            summary = score_file(service, input_path, output_path, chunk_size=25, top_k=2, keep_columns=['plot_id'])
+            output = pd.read_csv(output_path, keep_default_na=False)
+
+        self.assertEqual(summary, {'rows': 120, 'valid': 118, 'invalid': 2, 'chunks': 5})
+        self.assertEqual(output['row'].tolist(), list(range(120)))
+        self.assertEqual(output['plot_id'].tolist(), list(range(120)))
+        self.assertEqual(output.loc[3, 'errors'], 'N')
+        self.assertEqual(output.loc[4, 'errors'], 'ph')
+
+        for i in (0, 30, 57, 119):
+            expected = service.predict_crop(data.loc[i, FEATURE_COLUMNS].to_dict())
+            self.assertEqual(output.loc[i, 'predicted_crop'], expected['predicted_crop'])
+            self.assertAlmostEqual(float(output.loc[i, 'confidence_score']), expected['confidence_score'])
+            self.assertAlmostEqual(
+                float(output.loc[i, 'top2_probability']), expected['top_recommendations'][1]['probability']
+            )
+
+
+    def test_parent_skips_service_with_workers(self):
+        data = pd.read_csv('./static/data/Crop_recommendation.csv').head(60)
+
+        with tempfile.TemporaryDirectory() as directory:
+            input_path = f'{directory}/input.csv'
+            data.to_csv(input_path, index=False)
+            call_command('score_file', input_path, f'{directory}/single.csv', chunk_size=20, verbosity=0,
+                         stdout=io.StringIO())
+            with mock.patch('apps.recommendations.management.commands.score_file.CropRecommendationService') \
+                    as service_class:
+                stdout = io.StringIO()
+                call_command('score_file', input_path, f'{directory}/workers.csv', chunk_size=20, workers=2,
+                             verbosity=0, stdout=stdout)
+            service_class.assert_not_called()
+
+            single = pd.read_csv(f'{directory}/single.csv', keep_default_na=False)
+            pd.testing.assert_frame_equal(pd.read_csv(f'{directory}/workers.csv', keep_default_na=False), single)
+
+            with self.assertRaises(ValueError):
+                score_file(None, input_path, f'{directory}/none.csv')
+
+        summary = model_summary(serving_model_path(), settings.ENCODER_PATH)
+        self.assertIn(f"modelo {summary['model_version']}", stdout.getvalue())
+        self.assertEqual(summary['model_version'], get_service().model_version)
+        self.assertEqual(len(summary['classes']), 22)
+
+
+class CropKnowledgeTests(SimpleTestCase):
+    """Las recomendaciones por lote deben coincidir con las de una sola muestra"""
+
+    def test_batch_recommendations_match_single(self):
+        service = CropRecommendationService(settings.MODEL_PATH, settings.ENCODER_PATH)
+        for crop in service.class_names:
+            self.assertTrue(service.get_crop_recommendations_text(crop, {})['planting_season'], crop)
+
+        rows = pd.read_csv('./static/data/Crop_recommendation.csv').head(60)[FEATURE_COLUMNS].to_dict('records')
+        rows[0].update({'temperature': 40, 'humidity': 90, 'ph': 5})
+        results = service.predict_crops(rows, frozenset({'predicted_crop', 'recommendations'}))['results']
+
+        for row, result in zip(rows, results):
+            self.assertEqual(list(result['recommendations']), list(RECOMMENDATION_FIELDS))
+            self.assertEqual(
+                result['recommendations'], service.get_crop_recommendations_text(result['predicted_crop'], row)
+            )
+        self.assertIn('ácido', results[0]['recommendations']['soil_warnings'])
+        self.assertEqual(results[0]['recommendations']['climate_warnings'].count(';'), 1)
+
+
+class IncrementalRescoringTests(TestCase):
+    """Al ingerir, un dispositivo se re-puntúa solo cuando alguna característica supera su umbral"""
+
+    def setUp(self):
+        cache.clear()
+
+    def _ingest(self, seconds, **values):
+        reading = {'device_id': 'parcela-1', 'timestamp': timezone.now() + timezone.timedelta(seconds=seconds),
+                   'values': values}
+        ingest_readings([reading])
+        return SensorDevice.objects.get(device_id='parcela-1')
+
+    def test_rescore_on_threshold(self):
+        features = {'N': 90.0, 'P': 42.0, 'K': 43.0, 'temperature': 20.8, 'humidity': 82.0, 'ph': 6.5}
+        device = self._ingest(0, **features)
+        self.assertIsNone(device.recommendation)
+        self.assertIsNone(get_recommendation('parcela-1'))
+
+        device = self._ingest(1, rainfall=202.9)
+        first_scored_at = device.scored_at
+        expected = CropRecommendationService(settings.MODEL_PATH, settings.ENCODER_PATH).predict_crop(
+            {**features, 'rainfall': 202.9}
+        )
+        self.assertEqual(device.recommendation['predicted_crop'], expected['predicted_crop'])
+
+        threshold = settings.SENSOR_RESCORE['THRESHOLDS']['temperature']
+        device = self._ingest(2, temperature=20.8 + threshold / 2)
+        self.assertEqual(device.scored_at, first_scored_at)
+        self.assertEqual(device.scored_features['temperature'], 20.8)
+
+        device = self._ingest(3, temperature=20.8 + threshold * 2)
+        self.assertGreater(device.scored_at, first_scored_at)
+        self.assertEqual(get_recommendation('parcela-1')['features']['temperature'], 20.8 + threshold * 2)
+        self.assertEqual(get_recommendation()['device_id'], 'parcela-1')
+
+    def test_failed_prediction_follows_thresholds(self):
+        features = {'N': 90.0, 'P': 42.0, 'K': 43.0, 'temperature': 8.6, 'humidity': 82.0, 'ph': 6.5,
+                    'rainfall': 202.9}
+        device = self._ingest(0, **features)
+        self.assertFalse(device.recommendation['success'])
+
+        response = self.client.get('/api/sensores/recomendacion/', {'device_id': 'parcela-1'})
+        self.assertEqual(response.status_code, 422)
+        self.assertIn('temperature', response.json()['errors'])
+
+        # Lecturas fuera de rango repetidas no re-puntúan (ni reescriben la fila del dispositivo)
+        scored_at = device.scored_at
+        service = get_service()
+        with mock.patch.object(service, 'predict_crops', wraps=service.predict_crops) as predict_crops:
+            for seconds in (1, 2, 3):
+                device = self._ingest(seconds, **features)
+            predict_crops.assert_not_called()
+        self.assertEqual(device.scored_at, scored_at)
+        self.assertFalse(device.recommendation['success'])
+
+        # Un cambio mayor que el umbral reemplaza el resultado fallido
+        threshold = settings.SENSOR_RESCORE['THRESHOLDS']['temperature']
+        device = self._ingest(4, temperature=8.6 + threshold + 0.1)
+        self.assertTrue(device.recommendation['success'])
+        self.assertGreater(device.scored_at, scored_at)
+        response = self.client.get('/api/sensores/recomendacion/', {'device_id': 'parcela-1'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['features']['temperature'], 8.6 + threshold + 0.1)
+
+        response = self.client.get('/api/sensores/recomendacion/', {'device_id': 'sin-lecturas'})
+        self.assertEqual(response.status_code, 404)
+
+
+class PredictionMetricsTests(TestCase):
+    """Los contadores combinados entre workers nunca retroceden y /metrics no es público"""
+
+    def test_exposition_text(self):
+        metrics = PredictionMetrics()
+        metrics.observe('v1', 'single', {'model': 30_000, 'total': 2_000_000}, 'success')
+        metrics.observe('v1', 'single', {'model': 70_000, 'total': 3_000_000}, 'success')
+        metrics.observe('v1', 'single', {'validation': 10_000, 'total': 20_000}, 'invalid')
+
+        lines = render_prometheus(metrics.collect(), [{'model_version': 'v1', 'backend': 'sklearn'}]).splitlines()
+
+        model = 'cultivai_prediction_stage_seconds_{}{{operation="single",stage="model",model_version="v1"{}}}'
+        self.assertIn('# TYPE cultivai_prediction_stage_seconds histogram', lines)
+        self.assertIn(model.format('bucket', ',le="5e-05"') + ' 1', lines)
+        self.assertIn(model.format('bucket', ',le="0.0001"') + ' 2', lines)
+        self.assertIn(model.format('bucket', ',le="+Inf"') + ' 2', lines)
+        self.assertIn(model.format('sum', '') + ' 0.000100000', lines)
+        self.assertIn(model.format('count', '') + ' 2', lines)
+        self.assertIn('# TYPE cultivai_predictions_total counter', lines)
+        self.assertIn('cultivai_predictions_total{operation="single",model_version="v1",outcome="success"} 2', lines)
+        self.assertIn('cultivai_predictions_total{operation="single",model_version="v1",outcome="invalid"} 1', lines)
+        self.assertIn('cultivai_model_info{model_version="v1",backend="sklearn"} 1', lines)
+        self.assertIn('cultivai_metrics_workers 1', lines)
+
+    def _worker_file(self, directory, pid, started_ns, value):
+        with open(os.path.join(directory, f'{pid}-{started_ns}.json'), 'w') as snapshot_file:
+            json.dump({'pid': pid, 'started_ns': started_ns, 'histograms': [], 'counters': [
+                {'operation': 'single', 'model_version': 'v1', 'outcome': 'success', 'value': value}
+            ]}, snapshot_file)
+
+    def _success_total(self, snapshots):
+        line = [line for line in render_prometheus(snapshots, []).splitlines() if 'outcome="success"' in line]
+        return int(line[0].rsplit(' ', 1)[1]) if line else 0
+
+    def test_dead_and_reused_pids_stay_counted(self):
+        with tempfile.TemporaryDirectory() as directory:
+            metrics = PredictionMetrics(directory=directory)
+            metrics.observe('v1', 'single', {'total': 1_000}, 'success')
+            # El mismo pid en dos procesos sucesivos: dos archivos, ninguno pisa al otro
+            self._worker_file(directory, 999_999, 1, 5)
+            self._worker_file(directory, 999_999, 2, 3)
+
+            alive = {os.getpid(), 999_999}
+            with mock.patch.object(metrics_module, '_process_alive', lambda pid: pid in alive):
+                self.assertEqual(self._success_total(metrics.collect()), 9)
+
+                alive.discard(999_999)
+                snapshots = metrics.collect()
+                self.assertEqual(self._success_total(snapshots), 9)
+                self.assertIn('cultivai_metrics_workers 1', render_prometheus(snapshots, []))
+                self.assertEqual(sorted(name for name in os.listdir(directory) if name.endswith('.json')),
+                                 sorted([f'{os.getpid()}-{metrics._started_ns}.json', 'retired.json']))
+
+                metrics.observe('v1', 'single', {'total': 1_000}, 'success')
+                self.assertEqual(self._success_total(metrics.collect()), 10)
+
+    def test_metrics_endpoint_access(self):
+        service = get_service()
+        with mock.patch.object(service, 'metrics', None):
+            self.assertEqual(self.client.get('/metrics').status_code, 404)
+
+        with mock.patch.object(service, 'metrics', PredictionMetrics()):
+            response = self.client.get('/metrics')
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+
+            self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='203.0.113.7').status_code, 403)
+            self.client.force_login(User.objects.create_user('admin', is_staff=True))
+            self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='203.0.113.7').status_code, 200)
+
+
+class FastModelVariantTests(SimpleTestCase):
+    """Variantes reducidas del modelo: subconjuntos, candidatas, elección automática y respaldo"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        from joblib import load
+        cls.model = load(settings.MODEL_PATH)
+        cls.rows = pd.read_csv(settings.DATASET_PATH)[FEATURE_COLUMNS].iloc[::40].to_numpy()
+
+    def test_tree_subset(self):
+        subset = tree_subset(self.model, 5)
+        self.assertEqual((len(subset.estimators_), subset.n_estimators), (5, 5))
+        self.assertEqual(len(self.model.estimators_), 100)
+
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', UserWarning)
+            expected = np.mean([tree.predict_proba(self.rows) for tree in self.model.estimators_[:5]], axis=0)
+            np.testing.assert_allclose(subset.predict_proba(self.rows), expected)
+
+    def test_candidate_specs(self):
+        specs = candidate_specs(self.model, trees=(10, 200), depths=(4,), ccp_alphas=(0.01,))
+        self.assertEqual([spec['name'] for spec in specs], [
+            'current', 'trees10', 'depth4-trees10', 'depth4-trees200', 'ccp0.01-trees10', 'ccp0.01-trees200'
+        ])
+        # Un subconjunto no puede tener más árboles que el modelo; reentrenado sí
+        self.assertEqual(specs[1], {'name': 'trees10', 'kind': 'subset', 'params': {'n_estimators': 10}})
+        self.assertEqual(specs[3]['params'], {'n_estimators': 200, 'max_depth': 4})
+
+    def _build(self, output, **options):
+        stdout = io.StringIO()
+        call_command('build_fast_model', trees=[3], depths=[2], ccp_alphas=[], latency_samples=20, no_compiled=True,
+                     output=output, stdout=stdout, **options)
+        return stdout.getvalue()
+
+    def test_save_auto(self):
+        from joblib import load
+
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'fast.joblib')
+            report = self._build(output, save='auto', min_agreement=0.0)
+            self.assertIn('depth2-trees3', report)
+            self.assertTrue('Variante trees3 guardada' in report or 'Variante depth2-trees3 guardada' in report)
+            self.assertEqual(len(load(output).estimators_), 3)
+
+            with self.assertRaisesMessage(CommandError, 'Ninguna variante coincide'):
+                self._build(os.path.join(directory, 'ninguna.joblib'), save='auto', min_agreement=1.01)
+            with self.assertRaisesMessage(CommandError, 'Variante desconocida'):
+                self._build(os.path.join(directory, 'otra.joblib'), save='trees7')
+            self.assertEqual(sorted(os.listdir(directory)), ['fast.joblib'])
+
+    def test_serving_path_falls_back_to_full_model(self):
+        with tempfile.TemporaryDirectory() as directory:
+            fast_path = os.path.join(directory, 'fast.joblib')
+            with override_settings(ML_MODEL_VARIANT='fast', ML_FAST_MODEL_PATH=fast_path):
+                with self.assertLogs('predictions', 'WARNING'):
+                    self.assertEqual(serving_model_path(), settings.MODEL_PATH)
+
+                shutil.copy(settings.MODEL_PATH, fast_path)
+                self.assertEqual(serving_model_path(), fast_path)
+
+            with override_settings(ML_MODEL_VARIANT='full', ML_FAST_MODEL_PATH=fast_path):
+                self.assertEqual(serving_model_path(), settings.MODEL_PATH)
+
+
+class StartupBudgetTests(SimpleTestCase):
+    """Los workers deben arrancar dentro del presupuesto y sin importar dependencias pesadas"""
+
+    def test_entry_points_within_budget(self):
+        for target in STARTUP_TARGETS:
+            report = profile_startup(target)
+            self.assertEqual(report['heavy_modules'], [], target)
+            self.assertEqual(check_budget(report, settings.STARTUP_BUDGET), [], target)
+
+
+class ReferenceDatasetTests(SimpleTestCase):
+    """La copia columnar debe reproducir el CSV y regenerarse cuando el CSV cambia"""
+
+    def test_columnar_copy_matches_csv(self):
+        csv = pd.read_csv(settings.DATASET_PATH)
+        with tempfile.TemporaryDirectory() as directory:
+            convert_dataset(settings.DATASET_PATH, directory, chunk_size=500)
+            frame = load_reference_dataset(directory=directory, auto_build=False).to_frame()
+
+        np.testing.assert_array_equal(frame[FEATURE_COLUMNS].to_numpy(), csv[FEATURE_COLUMNS].to_numpy())
+        self.assertEqual(frame['label'].astype(str).tolist(), csv['label'].tolist())
+        self.assertEqual(list(frame['label'].cat.categories), list(csv['label'].unique()))
+
+    def test_rebuilds_when_csv_changes(self):
+        with tempfile.TemporaryDirectory() as directory:
+            csv_path = f'{directory}/data.csv'
+            pd.read_csv(settings.DATASET_PATH).head(10).to_csv(csv_path, index=False)
+            self.assertEqual(load_reference_dataset(csv_path, f'{directory}/columnar').rows, 10)
+
+            pd.read_csv(settings.DATASET_PATH).head(25).to_csv(csv_path, index=False)
+            with self.assertRaises(FileNotFoundError):
+                load_reference_dataset(csv_path, f'{directory}/columnar', auto_build=False)
+            self.assertEqual(load_reference_dataset(csv_path, f'{directory}/columnar').rows, 25)
+
+    def test_concurrent_conversions(self):
+        with tempfile.TemporaryDirectory() as directory:
+            csv_path = f'{directory}/data.csv'
+            pd.read_csv(settings.DATASET_PATH).head(50).to_csv(csv_path, index=False)
+            target = f'{directory}/columnar'
+
+            calls = [dict(force=False)] * 4 + [dict(force=True)] * 2
+            with ThreadPoolExecutor(max_workers=len(calls)) as pool:
+                metas = list(pool.map(lambda kwargs: convert_dataset(csv_path, target, chunk_size=7, **kwargs), calls))
+
+            self.assertTrue(all(meta['rows'] == 50 for meta in metas))
+            self.assertEqual(ReferenceDataset(target).rows, 50)
+            # Sin carpetas temporales huérfanas de los perdedores
+            self.assertEqual(sorted(os.listdir(directory)), ['.columnar.lock', 'columnar', 'data.csv'])
+
+    def test_output_outside_static_files(self):
+        for static_dir in settings.STATICFILES_DIRS:
+            self.assertFalse(os.path.abspath(settings.DATASET_COLUMNAR_DIR).startswith(os.path.abspath(static_dir)))
@@ -1,7 +1,15 @@
 from django.urls import path
-from .views import CropRecommendationView
+from .views import (
+    CropRecommendationView, CropBatchRecommendationView, ModelReloadView, PredictionCacheStatsView,
+    crop_recommendation_async, crop_recommendation_fast,
+)
 
 
 urlpatterns = [
     path('recommend/', CropRecommendationView.as_view(), name='crop-recommendation'),
+    path('recommend/fast/', crop_recommendation_fast, name='crop-recommendation-fast'),
+    path('recommend/async/', crop_recommendation_async, name='crop-recommendation-async'),
+    path('recommend/batch/', CropBatchRecommendationView.as_view(), name='crop-recommendation-batch'),
+    path('model/reload/', ModelReloadView.as_view(), name='model-reload'),
+    path('cache/stats/', PredictionCacheStatsView.as_view(), name='prediction-cache-stats'),
 ]
@@ -1,14 +1,64 @@
+import json
+
+import numpy as np
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from .serializers import CropInputSerializer
-from django.conf import settings
-from .services.ml_service import CropRecommendationService
+from rest_framework.permissions import IsAdminUser
+from .serializers import CropInputSerializer, CropBatchInputSerializer
+from .services import fast_json
+from .services.executor import InferenceRejected, InferenceTimeout, get_inference_executor
+from .services.metrics import render_prometheus
+from .services.ml_service import parse_result_fields
+from .services.registry import get_service
+
+
+def _parse_fields(query_params):
+    """
+    Lee fields= / compact=1 / recommendations=1 de la query
+
+    Returns:
+        tuple: (campos pedidos o None, mensaje de error o None)
+    """
+    try:
+        return parse_result_fields(
+            query_params.get('fields'), query_params.get('compact'), query_params.get('recommendations')
+        ), None
+    except ValueError as e:
+        return None, str(e)
+
+
+def _wants_grid(query_params) -> bool:
+    """approximate=1 acepta la respuesta de la malla precalculada (ML_GRID) cuando la celda es confiable"""
+    return query_params.get('approximate') in ('1', 'true', 'True')
+
+
+def _invalid_fields_data(message: str) -> dict:
+    return {
+        'success': False,
+        'message': 'Parámetro fields inválido',
+        'errors': {'fields': [message]}
+    }
 
-ml_service = CropRecommendationService(settings.MODEL_PATH, settings.ENCODER_PATH)
 
 class CropRecommendationView(APIView):
+    """
+    Recomendación de cultivo para una muestra
+
+    Cada característica debe ser un número finito dentro de su rango: además de los textos no
+    numéricos se rechazan booleanos (true/false), NaN e infinitos ("nan", "inf") con 400 y el
+    error en errors[<campo>], igual que en fast/, async/ y en cada fila de batch/.
+    """
+
     def post(self, request):
+        fields, fields_error = _parse_fields(request.query_params)
+        if fields_error:
+            return Response(_invalid_fields_data(fields_error), status=status.HTTP_400_BAD_REQUEST)
+
         serializer = CropInputSerializer(data=request.data)
         if not serializer.is_valid():
             # Si el serializer falla, retorna los errores del serializer
@@ -19,7 +69,7 @@ class CropRecommendationView(APIView):
             }, status=status.HTTP_400_BAD_REQUEST)
 
         data = serializer.validated_data
-        result = ml_service.predict_crop(data)
+        result = get_service().predict_crop(data, fields, use_grid=_wants_grid(request.query_params))
 
         # Si el modelo retorna error, usa status 400 y un mensaje claro
         if not result.get('success', False):
@@ -35,3 +85,260 @@ class CropRecommendationView(APIView):
             **result
         }, status=status.HTTP_200_OK)
 
+
+def _fast_json_response(data, status_code: int) -> HttpResponse:
+    return HttpResponse(fast_json.dumps(data), status=status_code, content_type='application/json')
+
+
+@csrf_exempt
+@require_POST
+def crop_recommendation_fast(request):
+    """
+    Camino rápido de CropRecommendationView para el endpoint más usado
+
+    Valida con la tabla de rangos (mismas reglas y mensajes que CropInputSerializer) y
+    codifica la respuesta directamente, sin la negociación de contenido ni el renderer de
+    DRF. Lo que no sea un objeto JSON se delega a la vista DRF para responder igual que ella.
+    """
+    if request.content_type != 'application/json':
+        return _crop_recommendation_drf(request)
+
+    fields, fields_error = _parse_fields(request.GET)
+    if fields_error:
+        return _fast_json_response(_invalid_fields_data(fields_error), status.HTTP_400_BAD_REQUEST)
+
+    try:
+        payload = fast_json.loads(request.body)
+    except fast_json.InvalidPayload:
+        return _crop_recommendation_drf(request)
+
+    data, errors = fast_json.validate_input(payload)
+    if errors:
+        return _fast_json_response({
+            'success': False,
+            'message': 'Datos de entrada inválidos',
+            'errors': errors
+        }, status.HTTP_400_BAD_REQUEST)
+
+    result = get_service().predict_crop(data, fields, use_grid=_wants_grid(request.GET))
+
+    if not result.get('success', False):
+        return _fast_json_response({
+            'success': False,
+            'message': result.get('error', 'Error en la predicción'),
+            'errors': result.get('errors', [])
+        }, status.HTTP_400_BAD_REQUEST)
+
+    return _fast_json_response({
+        'message': 'Predicción realizada con éxito',
+        **result
+    }, status.HTTP_200_OK)
+
+
+_crop_recommendation_drf = CropRecommendationView.as_view()
+
+
+@csrf_exempt
+@require_POST
+async def crop_recommendation_async(request):
+    """
+    Variante asíncrona de CropRecommendationView para servir con ASGI
+
+    DRF no tiene vistas asíncronas, así que se valida con el mismo serializer y la
+    predicción se envía al pool de inferencia (ML_INFERENCE_POOL) sin bloquear el event loop.
+    Acepta los mismos parámetros de query (fields / compact / recommendations / approximate).
+    """
+    fields, fields_error = _parse_fields(request.GET)
+    if fields_error:
+        return JsonResponse(_invalid_fields_data(fields_error), status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        payload = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({
+            'success': False,
+            'message': 'Formato JSON inválido'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    serializer = CropInputSerializer(data=payload)
+    if not serializer.is_valid():
+        return JsonResponse({
+            'success': False,
+            'message': 'Datos de entrada inválidos',
+            'errors': serializer.errors
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        result = await get_inference_executor().predict_crop(
+            dict(serializer.validated_data), fields, use_grid=_wants_grid(request.GET)
+        )
+    except InferenceRejected:
+        response = JsonResponse({
+            'success': False,
+            'message': 'Servidor saturado, intenta de nuevo más tarde'
+        }, status=status.HTTP_429_TOO_MANY_REQUESTS)
+        response['Retry-After'] = str(settings.ML_INFERENCE_POOL['RETRY_AFTER'])
+        return response
+    except InferenceTimeout:
+        return JsonResponse({
+            'success': False,
+            'message': 'La predicción excedió el tiempo límite'
+        }, status=status.HTTP_504_GATEWAY_TIMEOUT)
+
+    if not result.get('success', False):
+        return JsonResponse({
+            'success': False,
+            'message': result.get('error', 'Error en la predicción'),
+            'errors': result.get('errors', [])
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    return JsonResponse({
+        'message': 'Predicción realizada con éxito',
+        **result
+    }, status=status.HTTP_200_OK)
+
+
+class CropBatchRecommendationView(APIView):
+    """
+    Predicción por lote
+
+    Query:
+        fields / compact / recommendations: Campos de cada resultado (como en recommend/)
+        output: 'arrays' devuelve solo las probabilidades como listas por fila (mismos valores que
+            all_probabilities); 'binary' devuelve la matriz float32 little-endian (filas x clases, NaN en filas inválidas)
+    """
+    OUTPUT_MODES = ('objects', 'arrays', 'binary')
+
+    def post(self, request):
+        # 'format' lo reserva DRF para la negociación de contenido; por eso el parámetro es 'output'
+        output = request.query_params.get('output', 'objects')
+        if output not in self.OUTPUT_MODES:
+            return Response({
+                'success': False,
+                'message': 'Parámetro output inválido',
+                'errors': {'output': [f"Valores permitidos: {', '.join(self.OUTPUT_MODES)}"]}
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        fields, fields_error = _parse_fields(request.query_params)
+        if fields_error:
+            return Response(_invalid_fields_data(fields_error), status=status.HTTP_400_BAD_REQUEST)
+
+        # Se acepta una lista de muestras o un objeto {"samples": [...]}
+        payload = {'samples': request.data} if isinstance(request.data, list) else request.data
+        serializer = CropBatchInputSerializer(data=payload)
+        if not serializer.is_valid():
+            return Response({
+                'success': False,
+                'message': 'Datos de entrada inválidos',
+                'errors': serializer.errors
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        samples = serializer.validated_data['samples']
+        if output != 'objects':
+            return self._matrix_response(samples, output)
+
+        result = get_service().predict_crops(samples, fields)
+
+        # Solo un error del modelo hace fallar el lote; los errores por fila van en los resultados
+        if not result.get('success', False):
+            return Response({
+                'success': False,
+                'message': 'Error en la predicción',
+                'errors': result.get('errors', [])
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'message': 'Predicción por lote realizada con éxito',
+            **result
+        }, status=status.HTTP_200_OK)
+
+    def _matrix_response(self, samples, output: str):
+        result = get_service().predict_proba_matrix(samples)
+        if not result.get('success', False):
+            return Response({
+                'success': False,
+                'message': 'Error en la predicción',
+                'errors': result.get('errors', [])
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        probabilities = result['probabilities']
+        if output == 'binary':
+            # Solo la salida binaria se reduce a float32, para la mitad de bytes por celda
+            response = HttpResponse(probabilities.astype('<f4').tobytes(),
+                                    content_type='application/octet-stream')
+            response['X-Crop-Classes'] = ','.join(result['classes'])
+            response['X-Rows'], response['X-Columns'] = map(str, probabilities.shape)
+            response['X-Model-Version'] = result['model_version']
+            return response
+
+        # Las filas inválidas van como null en probabilities y predicted
+        valid = ~np.isnan(probabilities[:, 0]) if len(probabilities) else np.zeros(0, dtype=bool)
+        predicted = probabilities.argmax(axis=1) if len(probabilities) else []
+        return _fast_json_response({
+            'success': True,
+            'model_version': result['model_version'],
+            'classes': result['classes'],
+            'probabilities': [row.tolist() if ok else None for row, ok in zip(probabilities, valid)],
+            'predicted': [result['classes'][index] if ok else None for index, ok in zip(predicted, valid)],
+            'errors': {str(i): message for i, message in result['errors'].items()}
+        }, status.HTTP_200_OK)
+
+
+class ModelReloadView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        service = get_service()
+        slot = service._slot
+        return Response({
+            'model_available': service.is_model_available(),
+            'model_version': service.model_version,
+            'loaded_at': slot.loaded_at if slot is not None else None,
+            'watcher_running': service.watcher_running(),
+            'micro_batch': service.batcher.stats() if service.batcher is not None else None,
+            'grid': service.grid.stats() if service.grid is not None else None,
+            'load_stats': service.load_stats
+        }, status=status.HTTP_200_OK)
+
+    def post(self, request):
+        # La recarga corre en segundo plano; las predicciones siguen con la versión actual hasta el cambio
+        service = get_service()
+        service.reload_in_background(force=True)
+        return Response({
+            'message': 'Recarga del modelo iniciada',
+            'model_version': service.model_version
+        }, status=status.HTTP_202_ACCEPTED)
+
+
+class PredictionCacheStatsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        prediction_cache = get_service().prediction_cache
+        if prediction_cache is None:
+            return Response({'enabled': False}, status=status.HTTP_200_OK)
+
+        return Response({'enabled': True, **prediction_cache.stats()}, status=status.HTTP_200_OK)
+
+
+def _can_scrape_metrics(request) -> bool:
+    """Solo las IPs de ML_METRICS['ALLOWED_IPS'] (el scraper de Prometheus) o usuarios staff"""
+    if request.META.get('REMOTE_ADDR') in settings.ML_METRICS.get('ALLOWED_IPS', ()):
+        return True
+    return request.user.is_authenticated and request.user.is_staff
+
+
+@require_GET
+def metrics_view(request):
+    """Histogramas de latencia por etapa en el formato de texto de Prometheus"""
+    service = get_service()
+    if service.metrics is None:
+        return HttpResponse('Métricas desactivadas (ML_METRICS)', status=404, content_type='text/plain; charset=utf-8')
+    if not _can_scrape_metrics(request):
+        return HttpResponse('No autorizado', status=403, content_type='text/plain; charset=utf-8')
+
+    snapshots = service.metrics.collect()
+    slot = service._slot
+    models = [{'model_version': slot.version, 'backend': slot.backend}] if slot is not None else []
+
+    return HttpResponse(render_prometheus(snapshots, models), content_type='text/plain; version=0.0.4; charset=utf-8')
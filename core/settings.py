@@ -139,4 +139,132 @@ STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 MODEL_PATH = os.path.join(BASE_DIR, 'static', 'models', 'crop_recommendation_model.joblib')
-ENCODER_PATH = os.path.join(BASE_DIR, 'static', 'models', 'label_encoder.joblib')
\ No newline at end of file
+ENCODER_PATH = os.path.join(BASE_DIR, 'static', 'models', 'label_encoder.joblib')
+# Número máximo de muestras aceptadas por el endpoint de predicción por lote
+ML_MAX_BATCH_SIZE = 10000
+
+# Usa pd.DataFrame como entrada del modelo (modo de compatibilidad) en lugar del buffer NumPy
+ML_DATAFRAME_INPUT = False
+
+# Carga el modelo al iniciar Django (AppConfig.ready) en lugar de hacerlo en la primera predicción
+ML_PRELOAD_MODEL = False
+
+# Modo de memory-map de joblib para los arreglos del modelo (None desactiva, 'r' comparte páginas entre workers)
+ML_MMAP_MODE = None
+
+# Motor de inferencia: 'sklearn' o 'compiled' (bosque aplanado en arreglos .npy, ver manage.py export_forest).
+# Si el bosque compilado falta o no corresponde a MODEL_PATH se usa el modelo sklearn.
+ML_BACKEND = 'sklearn'
+ML_COMPILED_MODEL_DIR = os.path.join(BASE_DIR, 'static', 'models', 'compiled')
+
+# Modelo en servicio: 'full' (MODEL_PATH) o 'fast' (variante reducida de manage.py build_fast_model en
+# ML_FAST_MODEL_PATH). Se combina con ML_BACKEND; si la variante no existe se usa MODEL_PATH.
+ML_MODEL_VARIANT = 'full'
+ML_FAST_MODEL_PATH = os.path.join(BASE_DIR, 'static', 'models', 'crop_recommendation_model_fast.joblib')
+
+# Segundos entre revisiones de MODEL_PATH / ENCODER_PATH para recargar el modelo en caliente (0 desactiva)
+ML_RELOAD_INTERVAL = 0
+
+# Caché de resultados de predicción con las entradas redondeadas (PRECISION: decimales, global o por campo).
+# DJANGO_CACHE_ALIAS activa un segundo nivel en settings.CACHES para compartir aciertos entre workers.
+ML_PREDICTION_CACHE = {
+    'ENABLED': False,
+    'MAX_ENTRIES': 10000,
+    'TTL': 300,
+    'PRECISION': 1,
+    'DJANGO_CACHE_ALIAS': None,
+}
+
+# Agrupa predicciones individuales concurrentes en una sola llamada a predict_proba.
+# MAX_WAIT_MS acota la latencia añadida a cada petición; MAX_BATCH el tamaño de cada lote.
+ML_MICRO_BATCH = {
+    'ENABLED': False,
+    'MAX_BATCH': 64,
+    'MAX_WAIT_MS': 2.0,
+}
+
+# Modo malla (gateways de bajo consumo): probabilidades precalculadas en DIR con manage.py build_prediction_grid.
+# Solo responde en celdas confiables: misma clase en sus vértices y error <= MAX_ERROR medido contra el modelo en
+# SAMPLES_PER_CELL puntos interiores; el resto va al modelo. POINTS son los vértices por eje (entero o dict por
+# característica): el tamaño crece como POINTS^7 y con pocos vértices casi ninguna celda es confiable, así que
+# revisa la cobertura que reporta el comando antes de activarla. Desactivada por defecto.
+ML_GRID = {
+    'ENABLED': False,
+    'DIR': os.path.join(BASE_DIR, 'static', 'models', 'grid'),
+    'POINTS': 6,
+    'MAX_ERROR': 0.1,
+    'SAMPLES_PER_CELL': 4,
+    'INTERPOLATE': True,
+}
+
+# Histogramas de latencia por etapa de predicción, expuestos en /metrics (formato de texto de Prometheus).
+# DIR es una carpeta compartida donde cada worker vuelca su estado cada FLUSH_INTERVAL segundos para
+# sumar todos los workers en /metrics (None = solo el worker que responde); es por máquina, ya que los
+# archivos de workers terminados se detectan por pid. /metrics solo responde a ALLOWED_IPS (comparadas
+# con REMOTE_ADDR, que detrás de un proxy es la IP del proxy) y a usuarios staff.
+ML_METRICS = {
+    'ENABLED': False,
+    'DIR': None,
+    'FLUSH_INTERVAL': 5.0,
+    'ALLOWED_IPS': ['127.0.0.1', '::1'],
+}
+
+# Pool de inferencia de las vistas asíncronas (ASGI). KIND: 'thread' o 'process'; MAX_WORKERS None = núcleos.
+# Con MAX_WORKERS + MAX_QUEUE predicciones pendientes se responde 429 con Retry-After (segundos);
+# TIMEOUT es el límite por petición y BLAS_THREADS los hilos de BLAS/OpenMP por worker (threadpoolctl).
+ML_INFERENCE_POOL = {
+    'KIND': 'thread',
+    'MAX_WORKERS': None,
+    'MAX_QUEUE': 64,
+    'TIMEOUT': 5.0,
+    'RETRY_AFTER': 1,
+    'BLAS_THREADS': 1,
+}
+
+# Línea base de manage.py benchmark (--save-baseline la escribe, --check falla ante regresiones)
+BENCHMARK_BASELINE_PATH = os.path.join(BASE_DIR, 'benchmarks', 'baseline.json')
+
+# Presupuesto de arranque en frío de core.wsgi / core.asgi con el URLconf cargado (manage.py startup_report --check
+# y las pruebas); pandas, plotly y sklearn no deben importarse hasta su primer uso
+STARTUP_BUDGET = {
+    'IMPORT_MS': 1000,
+    'RSS_MB': 90,
+}
+
+# Dataset de referencia usado por la página de análisis
+DATASET_PATH = os.path.join(BASE_DIR, 'static', 'data', 'Crop_recommendation.csv')
+
+# Copia columnar del dataset (un .npy por columna, etiqueta como códigos) que los workers abren con memory-map.
+# Se genera con manage.py convert_dataset o automáticamente en el primer uso si falta o si el CSV cambió.
+DATASET_COLUMNAR_DIR = os.path.join(BASE_DIR, 'var', 'columnar')
+
+# Tiempo de vida en la caché de las figuras de análisis (None = sin expiración; la clave cambia con el CSV o el modelo)
+ANALYTICS_CACHE_TIMEOUT = None
+
+# Ingesta de lecturas de sensores
+SENSOR_DEFAULT_DEVICE_ID = 'default'  # Dispositivo asignado a lecturas sin device_id
+SENSOR_INGEST_BATCH_SIZE = 500  # Filas por INSERT en las inserciones masivas
+SENSOR_LATEST_CACHE_TIMEOUT = 5  # Segundos de la proyección "última lectura" en caché (más con una caché compartida)
+SENSOR_BULK_MAX_READINGS = 100000  # Lecturas máximas por petición al endpoint masivo
+
+# Re-puntaje incremental: al ingerir, un dispositivo con las 7 características se vuelve a predecir solo si
+# alguna se movió más que su umbral desde la última predicción (o si cambió la versión del modelo).
+# Un umbral de 0 re-puntúa ante cualquier cambio de esa característica.
+SENSOR_RESCORE = {
+    'ENABLED': True,
+    'THRESHOLDS': {
+        'N': 5.0,
+        'P': 5.0,
+        'K': 5.0,
+        'temperature': 0.5,
+        'humidity': 2.0,
+        'ph': 0.1,
+        'rainfall': 5.0,
+    },
+}
+
+# Flujo en vivo de lecturas (Server-Sent Events, servido por ASGI)
+SENSOR_STREAM_HEARTBEAT = 15  # Segundos entre comentarios keep-alive
+SENSOR_STREAM_QUEUE_SIZE = 16  # Lecturas pendientes por conexión antes de descartar las más viejas
+SENSOR_STREAM_POLL_INTERVAL = 0  # Segundos entre consultas a la caché compartida por lecturas de otros workers (0 desactiva)
+SENSOR_STREAM_WSGI_POLL_INTERVAL = 1  # Segundos entre consultas bajo WSGI cuando SENSOR_STREAM_POLL_INTERVAL es 0
@@ -1,8 +1,11 @@
 from django.contrib import admin
 from django.urls import path, include
 
+from apps.recommendations.views import metrics_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', metrics_view, name='metrics'),
     path('', include('apps.cultivai.urls'), name='cultivai'),
     path('api/recommendations/', include('apps.recommendations.urls'), name='recommendations'),
 ]